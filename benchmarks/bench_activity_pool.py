@@ -0,0 +1,79 @@
+"""Measure the activity throughput of SWFActivityWorker.run_forever.
+
+The single threaded loop is compared with the activity pool against a
+stubbed SWF client that adds a fixed latency to every poll and response. The
+activities are I/O bound; they only sleep.
+
+Run with: python benchmarks/bench_activity_pool.py
+"""
+from __future__ import print_function
+
+import threading
+import time
+
+from flowy import SWFActivityConfig
+from flowy import SWFActivityWorker
+from flowy.proxy import Proxy
+
+
+ACTIVITIES = 200
+LATENCY = 0.005  # seconds, for each SWF call
+DURATION = 0.02  # seconds, for each activity
+
+
+class StubSWFClient(object):
+    def __init__(self, activities):
+        self.activities = activities
+        self.polled = 0
+        self.responded = 0
+        self.lock = threading.Lock()
+
+    def poll_for_activity_task(self, domain, task_list, identity=None):
+        time.sleep(LATENCY)
+        with self.lock:
+            if self.polled >= self.activities:
+                return {}
+            i = self.polled
+            self.polled += 1
+        return {
+            'taskToken': 'token-%s' % i,
+            'activityType': {'name': 'io_bound', 'version': '1'},
+            'input': Proxy.serialize_input(DURATION),
+        }
+
+    def respond_activity_task_completed(self, task_token, result=None):
+        time.sleep(LATENCY)
+        with self.lock:
+            self.responded += 1
+
+
+def io_bound(heartbeat, duration):
+    time.sleep(duration)
+
+
+def run(**kwargs):
+    client = StubSWFClient(ACTIVITIES)
+
+    class Worker(SWFActivityWorker):
+        def break_loop(self):
+            return client.responded >= ACTIVITIES
+
+    worker = Worker()
+    worker.register(SWFActivityConfig(), io_bound, version=1)
+    start = time.time()
+    worker.run_forever('domain', 'tl', swf_client=client, setup_log=False,
+                       register_remote=False, **kwargs)
+    return ACTIVITIES / (time.time() - start)
+
+
+def main():
+    print('%d activities of %.0f ms, %.0f ms per SWF call' % (
+        ACTIVITIES, DURATION * 1000, LATENCY * 1000))
+    print('single threaded loop:  %8.1f activities/s' % run())
+    for pollers, workers in [(2, 4), (4, 8), (8, 16)]:
+        print('%d pollers, %2d threads: %8.1f activities/s' % (
+            pollers, workers, run(pollers=pollers, workers=workers)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Measure the throughput of AsyncSWFActivityWorker with coroutine activities.
+
+The thread pool of SWFActivityWorker.run_forever is compared with the event
+loop of AsyncSWFActivityWorker against a stubbed SWF client that adds a fixed
+latency to every poll and response. The activities only wait, like an HTTP
+call would.
+
+Run with: python benchmarks/bench_async_activities.py
+"""
+from __future__ import print_function
+
+import asyncio
+import threading
+import time
+
+from flowy import SWFActivityConfig
+from flowy import SWFActivityWorker
+from flowy.proxy import Proxy
+from flowy.swf.aio import AsyncSWFActivityWorker
+
+
+ACTIVITIES = 1000
+LATENCY = 0.002  # seconds, for each SWF call
+DURATION = 0.5  # seconds, for each activity
+
+
+class StubSWFClient(object):
+    def __init__(self, activities, name):
+        self.activities = activities
+        self.name = name
+        self.polled = 0
+        self.responded = 0
+        self.lock = threading.Lock()
+
+    def poll_for_activity_task(self, domain, task_list, identity=None):
+        time.sleep(LATENCY)
+        with self.lock:
+            if self.polled >= self.activities:
+                return {}
+            i = self.polled
+            self.polled += 1
+        return {
+            'taskToken': 'token-%s' % i,
+            'activityType': {'name': self.name, 'version': '1'},
+            'input': Proxy.serialize_input(DURATION),
+        }
+
+    def respond_activity_task_completed(self, task_token, result=None):
+        time.sleep(LATENCY)
+        with self.lock:
+            self.responded += 1
+
+
+def io_bound(heartbeat, duration):
+    time.sleep(duration)
+
+
+async def async_io_bound(heartbeat, duration):
+    await asyncio.sleep(duration)
+
+
+def run(worker_class, func, **kwargs):
+    client = StubSWFClient(ACTIVITIES, func.__name__)
+
+    class Worker(worker_class):
+        def break_loop(self):
+            return client.responded >= ACTIVITIES
+
+    worker = Worker()
+    worker.register(SWFActivityConfig(), func, version=1)
+    start = time.time()
+    worker.run_forever('domain', 'tl', swf_client=client, setup_log=False,
+                       register_remote=False, **kwargs)
+    return ACTIVITIES / (time.time() - start)
+
+
+def main():
+    print('%d activities of %.0f ms, %.0f ms per SWF call' % (
+        ACTIVITIES, DURATION * 1000, LATENCY * 1000))
+    print('8 pollers, 64 threads:       %8.1f activities/s' % run(
+        SWFActivityWorker, io_bound, pollers=8, workers=64))
+    for concurrency in [100, 1000]:
+        print('8 pollers, %4d coroutines:  %8.1f activities/s' % (
+            concurrency, run(AsyncSWFActivityWorker, async_io_bound,
+                             pollers=8, concurrency=concurrency,
+                             threads=16)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Measure how fast workflows are started, one by one versus in a batch.
+
+A stubbed SWF client adds a fixed latency to every start, like the round
+trip to SWF.
+
+Run with: python benchmarks/bench_batch_start.py
+"""
+from __future__ import print_function
+
+import time
+
+from flowy import SWFWorkflowBatchStarter
+from flowy import SWFWorkflowStarter
+
+
+STARTS = 500
+LATENCY = 0.02  # seconds, for each start
+
+
+class StubSWFClient(object):
+    def start_workflow_execution(self, domain, wid, name, version, **kwargs):
+        time.sleep(LATENCY)
+        return {'runId': 'run-%s' % wid}
+
+
+def one_by_one():
+    client = StubSWFClient()
+    start = time.time()
+    for i in range(STARTS):
+        SWFWorkflowStarter('domain', 'name', 1, swf_client=client,
+                           wid='w%s' % i)(i)
+    return STARTS / (time.time() - start)
+
+
+def batch(concurrency):
+    start_batch = SWFWorkflowBatchStarter('domain', 'name', 1,
+                                          swf_client=StubSWFClient(),
+                                          concurrency=concurrency)
+    start = time.time()
+    for _ in start_batch(('w%s' % i, [i], {}) for i in range(STARTS)):
+        pass
+    return STARTS / (time.time() - start)
+
+
+def main():
+    print('%d starts, %.0f ms per start' % (STARTS, LATENCY * 1000))
+    print('one by one:          %8.1f starts/s' % one_by_one())
+    for concurrency in [10, 50]:
+        print('batch, %2d threads:   %8.1f starts/s' % (
+            concurrency, batch(concurrency)))
+
+
+if __name__ == '__main__':
+    main()
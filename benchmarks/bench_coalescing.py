@@ -0,0 +1,83 @@
+"""Measure the workflow replays saved by coalescing the task completions.
+
+Every workflow in tests/examples.py is run on threads, without coalescing
+and with a few coalescing settings, and the replay count and wall time are
+reported. A wide fan-out of short activities shows the case coalescing is
+meant for.
+
+Run with: python benchmarks/bench_coalescing.py
+"""
+from __future__ import print_function
+
+import inspect
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flowy import LocalWorkflow
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tests'))
+import examples  # noqa
+
+TIME_SCALE = 0.1
+SETTINGS = [
+    ('none', {}),
+    ('window 10ms', dict(coalesce_window=0.01)),
+    ('count 4', dict(coalesce_count=4)),
+    ('count 64', dict(coalesce_count=64)),
+    ('both', dict(coalesce_window=0.01, coalesce_count=64)),
+]
+
+
+class CountingWorkflow(LocalWorkflow):
+    def __init__(self, *args, **kwargs):
+        super(CountingWorkflow, self).__init__(*args, **kwargs)
+        self.replays = 0
+
+    def __call__(self, state, input_data, tracer):
+        self.replays += 1
+        return super(CountingWorkflow, self).__call__(state, input_data,
+                                                      tracer)
+
+
+class Fanout(object):
+    def __init__(self, a):
+        self.a = a
+
+    def __call__(self, n):
+        return sum([self.a(x, sleep=0.001) for x in range(n)])
+
+
+def measure(wf, args, **settings):
+    lw = CountingWorkflow(wf, activity_workers=16, workflow_workers=1,
+                          executor=ThreadPoolExecutor, **settings)
+    lw.conf_activity('a', examples.activity)
+    start = time.time()
+    lw.run(*args)
+    return lw.replays, time.time() - start
+
+
+def main():
+    workflows = sorted(
+        (name, wf) for name, wf in vars(examples).items()
+        if inspect.isclass(wf) and wf.__module__ == examples.__name__)
+    workflows.append(('Fanout(1000)', Fanout))
+    row = '%-22s %-12s %8s %8s'
+    print(row % ('workflow', 'coalescing', 'replays', 'wall s'))
+    stdout = sys.stdout
+    for name, wf in workflows:
+        args = (1000,) if wf is Fanout else (TIME_SCALE,)
+        for setting, kwargs in SETTINGS:
+            sys.stdout = open(os.devnull, 'w')  # the activities print
+            try:
+                replays, seconds = measure(wf, args, **kwargs)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            print(row % (name, setting, replays, '%.2f' % seconds))
+
+
+if __name__ == '__main__':
+    main()
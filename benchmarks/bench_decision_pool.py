@@ -0,0 +1,100 @@
+"""Measure the decision throughput of SWFWorkflowWorker.run_forever.
+
+The single threaded loop is compared with the decision pool, using threads
+and processes, against a stubbed SWF client. The stub adds a fixed latency
+to every poll and response, like the round trip to SWF, and each workflow
+replay does some CPU work.
+
+Run with: python benchmarks/bench_decision_pool.py
+"""
+from __future__ import print_function
+
+import threading
+import time
+
+from flowy import SWFWorkflowConfig
+from flowy import SWFWorkflowWorker
+from flowy.proxy import Proxy
+
+
+DECISIONS = 200
+LATENCY = 0.005  # seconds, for each SWF call
+WORK = 20000  # loop iterations per replay
+
+
+class StubSWFClient(object):
+    def __init__(self, decisions):
+        self.decisions = decisions
+        self.polled = 0
+        self.responded = 0
+        self.lock = threading.Lock()
+
+    def poll_for_decision_task(self, domain, task_list, identity=None,
+                               next_page_token=None, reverse_order=False):
+        time.sleep(LATENCY)
+        with self.lock:
+            if self.polled >= self.decisions:
+                return {}
+            i = self.polled
+            self.polled += 1
+        return {
+            'taskToken': 'token-%s' % i,
+            'workflowExecution': {'workflowId': 'wid-%s' % i, 'runId': 'rid'},
+            'events': [{
+                'eventId': 1,
+                'eventType': 'WorkflowExecutionStarted',
+                'workflowExecutionStartedEventAttributes': {
+                    'taskList': {'name': 'tl'},
+                    'taskStartToCloseTimeout': '10',
+                    'executionStartToCloseTimeout': '100',
+                    'childPolicy': 'TERMINATE',
+                    'workflowType': {'name': 'Busy', 'version': '1'},
+                    'input': Proxy.serialize_input(WORK),
+                },
+            }],
+        }
+
+    def respond_decision_task_completed(self, task_token, decisions=None,
+                                        exec_context=None):
+        time.sleep(LATENCY)
+        with self.lock:
+            self.responded += 1
+
+
+class Busy(object):
+    def __call__(self, n):
+        x = 0
+        for i in range(n):
+            x += i * i
+        return x
+
+
+def run(**kwargs):
+    client = StubSWFClient(DECISIONS)
+
+    class Worker(SWFWorkflowWorker):
+        def break_loop(self):
+            return client.responded >= DECISIONS
+
+    worker = Worker()
+    worker.register(SWFWorkflowConfig(), Busy, version=1)
+    start = time.time()
+    worker.run_forever('domain', 'tl', swf_client=client, setup_log=False,
+                       register_remote=False, **kwargs)
+    return DECISIONS / (time.time() - start)
+
+
+def main():
+    print('%d decisions, %.0f ms per SWF call' % (DECISIONS, LATENCY * 1000))
+    print('single threaded loop:  %8.1f decisions/s' % run())
+    for pollers, workers in [(2, 4), (4, 8), (8, 16)]:
+        print('%d pollers, %2d threads: %8.1f decisions/s' % (
+            pollers, workers, run(pollers=pollers, workers=workers)))
+    for pollers, workers in [(4, 4)]:
+        print('%d pollers, %d processes: %7.1f decisions/s' % (
+            pollers, workers,
+            run(pollers=pollers, workers=workers, processes=True)))
+
+
+if __name__ == '__main__':
+    main()
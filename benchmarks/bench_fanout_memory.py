@@ -0,0 +1,77 @@
+"""Measure the peak memory of a wide local fan-out.
+
+A workflow calls an activity for each of N items, on a process pool. With
+max_in_flight set to N every call is submitted at once, like before, and
+with the default only twice the pool size is in the executor at any time.
+The sizes are kept small because submitting many more calls at once can
+fill the process pool wakeup pipe and stall the unbounded run.
+Each case runs in a fresh interpreter and reports its peak RSS.
+
+Run with: python benchmarks/bench_fanout_memory.py
+"""
+from __future__ import print_function
+
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+
+from flowy import LocalWorkflow
+from flowy.local.runner import BoundedSubmitter
+from flowy.local.runner import RootWorkflowRunner
+from flowy.local.transport import collect_activities
+from flowy.local.transport import make_executor
+from flowy.proxy import Proxy
+
+
+PAYLOAD = 'x' * 1024
+WORKERS = 4
+
+
+def activity(item, payload):
+    return len(payload) + item
+
+
+class Fanout(object):
+    def __init__(self, a):
+        self.a = a
+
+    def __call__(self, n):
+        return sum([self.a(x, PAYLOAD) for x in range(n)])
+
+
+def run(n, max_in_flight):
+    lw = LocalWorkflow(Fanout, coalesce_window=0.5)
+    lw.conf_activity('a', activity)
+    # The decisions run on threads, only the activities use processes
+    activity_executor = BoundedSubmitter(
+        make_executor(ProcessPoolExecutor, WORKERS, collect_activities(lw)),
+        max_in_flight)
+    runner = RootWorkflowRunner(lw, ThreadPoolExecutor(max_workers=1),
+                                activity_executor, Proxy.serialize_input(n),
+                                coalesce_window=0.5)
+    start = time.time()
+    assert runner.run(wait=True) == n * len(PAYLOAD) + n * (n - 1) // 2
+    seconds = time.time() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    print('%.1f %.2f' % (peak_mb, seconds))
+
+
+def main():
+    row = '%-8s %-14s %12s %8s'
+    print(row % ('calls', 'max_in_flight', 'peak RSS MB', 'wall s'))
+    for n in (5000, 10000, 15000):
+        for max_in_flight in (n, 2 * WORKERS):
+            out = subprocess.check_output(
+                [sys.executable, __file__, str(n), str(max_in_flight)])
+            peak_mb, seconds = out.decode().split()
+            print(row % (n, max_in_flight, peak_mb, seconds))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3:
+        run(int(sys.argv[1]), int(sys.argv[2]))
+    else:
+        main()
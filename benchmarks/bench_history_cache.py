@@ -0,0 +1,98 @@
+"""Measure the cost of polling a decision with and without the history cache.
+
+An execution with a history of a given size gets 10 new events and the next
+decision is polled. Without the cache the whole history is fetched and
+parsed; with the cache only the new events are, and the decision gets a view
+of the cached history, so the cost doesn't grow with the history size. The
+stubbed client serves pages of 1000 events, like SWF, without any latency.
+
+Run with: python benchmarks/bench_history_cache.py
+"""
+from __future__ import print_function
+
+import timeit
+
+from flowy.swf.worker import HistoryCache
+from flowy.swf.worker import poll_decision
+
+
+PAGE_SIZE = 1000
+NEW_EVENTS = 10
+
+
+class StubPagingClient(object):
+    def __init__(self, events):
+        self.events = events
+        self.reversed_events = events[::-1]
+
+    def poll_for_decision_task(self, domain, task_list, identity=None,
+                               next_page_token=None, reverse_order=False):
+        events = self.reversed_events if reverse_order else self.events
+        start = int(next_page_token or 0)
+        page = {
+            'taskToken': 'token',
+            'workflowExecution': {'workflowId': 'wid', 'runId': 'rid'},
+            'events': events[start:start + PAGE_SIZE],
+        }
+        if start + PAGE_SIZE < len(events):
+            page['nextPageToken'] = str(start + PAGE_SIZE)
+        return page
+
+
+def make_events(n):
+    """A started event followed by n scheduled and completed activities."""
+    events = [{
+        'eventId': 1,
+        'eventType': 'WorkflowExecutionStarted',
+        'workflowExecutionStartedEventAttributes': {
+            'taskList': {'name': 'tl'},
+            'taskStartToCloseTimeout': '10',
+            'executionStartToCloseTimeout': '100',
+            'childPolicy': 'TERMINATE',
+            'workflowType': {'name': 'W', 'version': '1'},
+            'input': '[[], {}]',
+        },
+    }]
+    for i in range(n // 2):
+        scheduled = len(events) + 1
+        events.append({
+            'eventId': scheduled,
+            'eventType': 'ActivityTaskScheduled',
+            'activityTaskScheduledEventAttributes': {
+                'activityId': 'a-%s-0' % i,
+            },
+        })
+        events.append({
+            'eventId': scheduled + 1,
+            'eventType': 'ActivityTaskCompleted',
+            'activityTaskCompletedEventAttributes': {
+                'scheduledEventId': scheduled,
+                'result': '[%s]' % i,
+            },
+        })
+    return events
+
+
+def decision_ms(n, cached):
+    events = make_events(n + NEW_EVENTS)
+    old, new = StubPagingClient(events[:-NEW_EVENTS]), StubPagingClient(events)
+    timings = []
+    for _ in range(5):
+        cache = HistoryCache() if cached else None
+        poll_decision(old, 'd', 'tl', history_cache=cache)
+        timings.append(timeit.timeit(
+            lambda: poll_decision(new, 'd', 'tl', history_cache=cache),
+            number=1))
+    return min(timings) * 1000
+
+
+def main():
+    row = '%-8s %14s %14s'
+    print(row % ('events', 'full ms', 'cached ms'))
+    for n in (1000, 10000, 40000, 100000):
+        print(row % (n, '%.3f' % decision_ms(n, False),
+                     '%.3f' % decision_ms(n, True)))
+
+
+if __name__ == '__main__':
+    main()
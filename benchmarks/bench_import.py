@@ -0,0 +1,48 @@
+"""Measure the time and memory it takes to import flowy.
+
+Each measurement runs in a fresh interpreter. Importing flowy alone, enough
+for the local backend, must not import boto3; the SWF names are imported on
+first access.
+
+Run with: python benchmarks/bench_import.py
+"""
+from __future__ import print_function
+
+import subprocess
+import sys
+
+
+RUNS = 10
+
+SCRIPT = '''
+import resource, sys, time
+start = time.time()
+%s
+elapsed = time.time() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, rss, 'boto3' in sys.modules)
+'''
+
+
+def measure(code):
+    times, rss = [], []
+    for _ in range(RUNS):
+        out = subprocess.check_output([sys.executable, '-c', SCRIPT % code])
+        elapsed, max_rss, boto3 = out.split()
+        times.append(float(elapsed))
+        rss.append(int(max_rss))
+    times.sort()
+    return times[len(times) // 2], max(rss) / 1024.0, boto3.decode()
+
+
+def main():
+    for code in ['import flowy',
+                 'import flowy; flowy.LocalWorkflow',
+                 'import flowy; flowy.SWFWorkflowWorker']:
+        elapsed, rss, boto3 = measure(code)
+        print('%-40s %6.1f ms, %5.1f MB max RSS, boto3 imported: %s' % (
+            code, elapsed * 1000, rss, boto3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Measure the throughput of many small local workflow executions.
+
+Each execution calls two activities. They are run one at a time with
+LocalWorkflow.run, which starts new process pools every time, and then
+concurrently on a single LocalEngine.
+
+Run with: python benchmarks/bench_local_engine.py
+"""
+from __future__ import print_function
+
+import time
+
+from flowy import LocalWorkflow
+
+
+N = 100
+
+
+def double(x):
+    return 2 * x
+
+
+class Small(object):
+    def __init__(self, a):
+        self.a = a
+
+    def __call__(self, x):
+        return self.a(self.a(x))
+
+
+def main():
+    lw = LocalWorkflow(Small, activity_workers=4, workflow_workers=2)
+    lw.conf_activity('a', double)
+
+    start = time.time()
+    results = [lw.run(x) for x in range(N)]
+    run_seconds = time.time() - start
+    assert results == [4 * x for x in range(N)]
+
+    start = time.time()
+    with lw.engine() as engine:
+        futures = [engine.submit(x) for x in range(N)]
+        results = [f.result() for f in futures]
+    engine_seconds = time.time() - start
+    assert results == [4 * x for x in range(N)]
+
+    row = '%-20s %8s %14s'
+    print(row % ('mode', 'wall s', 'executions/s'))
+    print(row % ('LocalWorkflow.run', '%.2f' % run_seconds,
+                 '%.1f' % (N / run_seconds)))
+    print(row % ('LocalEngine.submit', '%.2f' % engine_seconds,
+                 '%.1f' % (N / engine_seconds)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Measure the per-task overhead of calling local activities on processes.
+
+The previous transport is reproduced next to the current one:
+
+* legacy - the runner deserializes the input, the callable and the
+  arguments are pickled for every call, and the result is serialized to
+  JSON by the runner and deserialized again by the proxy
+* keyed - the callable is registered once in each pool process, a call
+  sends the key and the serialized input and the result is kept as it is
+
+Both are run with a plain function and with a callable object holding some
+state, which has to be pickled with every legacy call.
+
+Run with: python benchmarks/bench_local_ipc.py
+"""
+from __future__ import print_function
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from flowy.local.transport import call_activity
+from flowy.local.transport import make_executor
+from flowy.serialization import dumps
+from flowy.serialization import loads
+
+
+N = 5000
+WORKERS = 4
+IN_FLIGHT = 16
+
+
+def add(x, y):
+    return {'sum': x + y, 'items': list(range(10))}
+
+
+class Lookup(object):
+    """A callable with state, like a loaded model or a config."""
+    def __init__(self):
+        self.table = dict((str(i), i) for i in range(20000))
+
+    def __call__(self, x, y):
+        return {'sum': self.table[str(x % 20000)] + y,
+                'items': list(range(10))}
+
+
+def run(executor, submit, finish):
+    inputs = [dumps([[i, i], {}]) for i in range(N)]
+    start = time.time()
+    in_flight = []
+    for input_data in inputs:
+        in_flight.append(submit(executor, input_data))
+        if len(in_flight) == IN_FLIGHT:
+            finish(in_flight.pop(0).result())
+    for f in in_flight:
+        finish(f.result())
+    return (time.time() - start) / N * 1e6
+
+
+def legacy(func):
+    def submit(executor, input_data):
+        args, kwargs = loads(input_data)
+        return executor.submit(func, *args, **kwargs)
+
+    def finish(result):
+        loads(dumps(result))  # stored as JSON, decoded by the proxy
+
+    return submit, finish
+
+
+def keyed(key):
+    def submit(executor, input_data):
+        return executor.submit(call_activity, key, input_data)
+
+    def finish(result):
+        pass  # kept as it is
+
+    return submit, finish
+
+
+def main():
+    activities = {'add': add, 'lookup': Lookup()}
+    row = '%-10s %-8s %12s'
+    print('%s calls, %s processes' % (N, WORKERS))
+    print(row % ('activity', 'mode', 'us/task'))
+    legacy_executor = ProcessPoolExecutor(max_workers=WORKERS)
+    keyed_executor = make_executor(ProcessPoolExecutor, WORKERS, activities)
+    for key, func in sorted(activities.items()):
+        for mode, executor, (submit, finish) in (
+                ('legacy', legacy_executor, legacy(func)),
+                ('keyed', keyed_executor, keyed(key))):
+            run(executor, submit, finish)  # warm up the pool
+            print(row % (key, mode, '%.1f' % run(executor, submit, finish)))
+    legacy_executor.shutdown()
+    keyed_executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
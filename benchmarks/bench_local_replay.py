@@ -0,0 +1,71 @@
+"""Measure how reading the activity results scales with the replays.
+
+A local workflow calls n activities, one after the other, so it's replayed
+n times and every replay reads all the results so far. Each activity returns
+an array of 100000 floats. Reading the results through a deep copy, like the
+previous implementation did, copies O(n^2) arrays over the run; now only
+the lists, dicts and sets are copied and the arrays are shared, so the time
+spent per replay grows only with the number of results read.
+
+Run with: python benchmarks/bench_local_replay.py
+"""
+from __future__ import print_function
+
+import array
+import copy
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import flowy.local.proxy
+from flowy import LocalWorkflow
+from flowy.history import HistoryView
+from flowy.local.proxy import keep
+
+
+def samples(i):
+    return array.array('d', [i]) * 100000
+
+
+class Chain(object):
+    def __init__(self, samples):
+        self.samples = samples
+
+    def __call__(self, n):
+        total = 0
+        for i in range(n):
+            # Wait for each result, to force a replay per activity
+            total += self.samples(i)[0] * 0 + 1
+        return total
+
+
+def deepcopy_reader(history):
+    return copy.deepcopy if isinstance(history, HistoryView) else keep
+
+
+def run_seconds(n):
+    lw = LocalWorkflow(Chain, executor=ThreadPoolExecutor)
+    lw.conf_activity('samples', samples)
+    start = time.time()
+    assert lw.run(n, _wait=True) == n
+    return time.time() - start
+
+
+def main():
+    current = flowy.local.proxy.result_reader
+    row = '%-8s %12s %16s %12s %16s'
+    print(row % ('calls', 'deepcopy s', 'deepcopy us/read', 'current s',
+                 'current us/read'))
+    for n in (50, 100, 200):
+        reads = n * (n + 1) // 2  # the results read over the run
+        flowy.local.proxy.result_reader = deepcopy_reader
+        try:
+            old = run_seconds(n)
+        finally:
+            flowy.local.proxy.result_reader = current
+        new = run_seconds(n)
+        print(row % (n, '%.2f' % old, '%.1f' % (old / reads * 1e6),
+                     '%.2f' % new, '%.1f' % (new / reads * 1e6)))
+
+
+if __name__ == '__main__':
+    main()
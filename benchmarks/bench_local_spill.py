@@ -0,0 +1,56 @@
+"""Measure passing large results between local activities on processes.
+
+An activity makes a blob and two other activities read it. Without a spill
+threshold the blob is pickled back to the runner and then serialized, as
+base64 JSON, into the input of each reader. With a spill threshold it's
+written once to a file on /dev/shm and only a handle is passed around.
+
+Run with: python benchmarks/bench_local_spill.py
+"""
+from __future__ import print_function
+
+import time
+
+from flowy import LocalWorkflow
+
+
+def make(n):
+    return b'x' * n
+
+
+def measure(data):
+    return len(data)
+
+
+class Pipeline(object):
+    def __init__(self, make, measure):
+        self.make = make
+        self.measure = measure
+
+    def __call__(self, n):
+        blob = self.make(n)
+        return self.measure(blob) + self.measure(blob)
+
+
+def run(n, spill_threshold):
+    lw = LocalWorkflow(Pipeline, activity_workers=2, workflow_workers=1,
+                       spill_threshold=spill_threshold)
+    lw.conf_activity('make', make)
+    lw.conf_activity('measure', measure)
+    with lw.engine() as engine:
+        engine.submit(1).result()  # start the pools
+        start = time.time()
+        assert engine.submit(n).result() == 2 * n
+        return time.time() - start
+
+
+def main():
+    row = '%-8s %12s %12s'
+    print(row % ('MB', 'pickled s', 'spilled s'))
+    for mb in (1, 16, 64):
+        n = mb * 1024 * 1024
+        print(row % (mb, '%.3f' % run(n, None), '%.3f' % run(n, 65536)))
+
+
+if __name__ == '__main__':
+    main()
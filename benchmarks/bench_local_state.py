@@ -0,0 +1,90 @@
+"""Measure the cost of handing the execution state to the local decisions.
+
+Each decision used to get a deep copy of the history, now it gets a view of
+an append-only history. The snapshot cost is measured for histories of
+different sizes and a whole local run with many activities is timed with
+both kinds of state.
+
+Run with: python benchmarks/bench_local_state.py
+"""
+from __future__ import print_function
+
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+from flowy import LocalWorkflow
+from flowy.history import ExecutionHistory
+from flowy.history import VersionedExecutionHistory
+from flowy.local.runner import BoundedSubmitter
+from flowy.local.runner import RootWorkflowRunner
+from flowy.local.transport import collect_activities
+from flowy.local.transport import make_executor
+from flowy.proxy import Proxy
+from flowy.tracer import ExecutionTracer
+
+
+def activity(x):
+    return x
+
+
+class Fanout(object):
+    def __init__(self, a):
+        self.a = a
+
+    def __call__(self, n):
+        return sum(map(self.a, range(n)))
+
+
+def filled(history, n):
+    for i in range(n):
+        history.set_running('a-%d-0' % i)
+        history.set_result('a-%d-0' % i, i)
+    return history
+
+
+def snapshot_ms(n):
+    plain = filled(ExecutionHistory(), n)
+    versioned = filled(VersionedExecutionHistory(), n)
+    tracer = ExecutionTracer()
+    for i in range(n):
+        tracer.schedule_activity('a-%d' % i, 'a')
+    copy = min(timeit.repeat(plain.copy, number=1, repeat=3)) * 1000
+    view = min(timeit.repeat(versioned.view, number=1000, repeat=3))
+    tracer_copy = min(timeit.repeat(tracer.copy, number=1000, repeat=3))
+    return copy, view, tracer_copy
+
+
+def run_seconds(n, state_factory):
+    lw = LocalWorkflow(Fanout, activity_workers=8, workflow_workers=1,
+                       executor=ThreadPoolExecutor)
+    lw.conf_activity('a', activity)
+    # LocalWorkflow.run always starts with a versioned history
+    activity_executor = BoundedSubmitter(
+        make_executor(ThreadPoolExecutor, 8, collect_activities(lw)),
+        lw.max_in_flight)
+    runner = RootWorkflowRunner(lw, ThreadPoolExecutor(max_workers=1),
+                                activity_executor,
+                                Proxy.serialize_input(n),
+                                state=state_factory())
+    start = time.time()
+    assert runner.run() == n * (n - 1) // 2
+    return time.time() - start
+
+
+def main():
+    row = '%-8s %14s %14s %16s'
+    print(row % ('calls', 'copy ms', 'view ms', 'tracer copy ms'))
+    for n in (100, 1000, 10000):
+        print(row % ((n,) + tuple('%.3f' % x for x in snapshot_ms(n))))
+    print()
+    row = '%-8s %-10s %10s'
+    print(row % ('calls', 'state', 'run s'))
+    for n in (500, 2000):
+        for name, factory in (('copy', ExecutionHistory),
+                              ('view', VersionedExecutionHistory)):
+            print(row % (n, name, '%.2f' % run_seconds(n, factory)))
+
+
+if __name__ == '__main__':
+    main()
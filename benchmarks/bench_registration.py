@@ -0,0 +1,81 @@
+"""Measure the remote registration time of a worker with many activities.
+
+A stubbed SWF client adds a fixed latency to every call. All the types are
+already registered, so each one costs a register and a describe call. The
+worker registers them serially, concurrently and then with a warm
+registration cache, like after a restart. The registrations are made
+through an SWFClient with the default throttle, so the token bucket of the
+register calls is included, and then without any throttle.
+
+Run with: python benchmarks/bench_registration.py
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import time
+
+from botocore.exceptions import ClientError
+
+from flowy import SWFActivityConfig
+from flowy import SWFActivityWorker
+from flowy.swf.client import SWFClient
+from flowy.swf.client import Throttle
+from flowy.swf.worker import RegistrationCache
+
+
+TYPES = 200
+LATENCY = 0.02  # seconds, for each SWF call
+
+
+class StubLowLevelClient(object):
+    """Stands in for the boto3 client wrapped by SWFClient."""
+
+    def register_activity_type(self, **kwargs):
+        time.sleep(LATENCY)
+        raise ClientError({'Error': {'Code': 'TypeAlreadyExistsFault'}},
+                          'RegisterActivityType')
+
+    def describe_activity_type(self, **kwargs):
+        time.sleep(LATENCY)
+        return {'configuration': {}}
+
+
+def activity(heartbeat):
+    pass
+
+
+def run(rates=None, **kwargs):
+    worker = SWFActivityWorker(**kwargs)
+    for i in range(TYPES):
+        worker.register(SWFActivityConfig(), activity, version=1,
+                        name='activity%s' % i)
+    # A new throttle for each run, with full buckets, like a new process
+    client = SWFClient(client=StubLowLevelClient(),
+                       throttle=Throttle(rates=rates))
+    start = time.time()
+    worker.register_remote(client, 'domain')
+    return time.time() - start
+
+
+def main():
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, 'registrations.json')
+    try:
+        print('%d types, %.0f ms per SWF call' % (TYPES, LATENCY * 1000))
+        for name, rates in (('throttled', None),
+                            ('unthrottled', {'register': None})):
+            for threads in (1, 8, 32):
+                print('%-12s %2d threads: %6.2fs' % (
+                    name, threads,
+                    run(rates=rates, register_concurrency=threads)))
+        run(registration_cache=RegistrationCache(path))
+        print('cached, restart:         %6.2fs' % run(
+            registration_cache=RegistrationCache(path)))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Measure the memory and allocation cost of task results.
+
+The current results are compared with the previous implementation, a
+dict based TaskResult with a __del__ finalizer.
+
+Run with: python benchmarks/bench_results.py
+"""
+from __future__ import print_function
+
+import gc
+import timeit
+import tracemalloc
+
+from flowy.result import ResultProxy
+from flowy.result import placeholder
+from flowy.result import result
+from flowy.utils import sentinel
+
+
+N = 100000
+
+
+class LegacyTaskResult(object):
+    def __init__(self, value=sentinel, order=None):
+        self.value = value
+        self.order = order
+        self.called = False
+
+    def __del__(self):
+        if not self.called and isinstance(self.value, Exception):
+            pass
+
+
+def legacy_result(value, order):
+    return ResultProxy(LegacyTaskResult(value, order))
+
+
+def legacy_placeholder():
+    return ResultProxy(LegacyTaskResult())
+
+
+def bytes_per_result(factory):
+    values = list(range(N))  # don't count the values themselves
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    results = [factory(v) for v in values]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return float(after - before) / N
+
+
+def seconds_per_replay(factory):
+    def replay():
+        results = [factory(v) for v in range(N)]
+        del results
+        gc.collect()
+    return min(timeit.repeat(replay, number=1, repeat=5))
+
+
+def main():
+    cases = [
+        ('result', lambda v: legacy_result(v, v), lambda v: result(v, v)),
+        ('placeholder', lambda v: legacy_placeholder(),
+         lambda v: placeholder()),
+    ]
+    row = '%-12s %-10s %12s %12s'
+    print('%s results per replay' % N)
+    print(row % ('kind', 'impl', 'bytes/result', 'ms/replay'))
+    for name, legacy, current in cases:
+        for impl, factory in (('legacy', legacy), ('current', current)):
+            print(row % (name, impl, '%.1f' % bytes_per_result(factory),
+                         '%.1f' % (seconds_per_replay(factory) * 1000)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Compare the serialization codec with the previous two-pass implementation.
+
+Run with: python benchmarks/bench_serialization.py
+"""
+from __future__ import print_function
+
+import json
+import timeit
+import uuid
+from base64 import b64decode
+from base64 import b64encode
+
+from flowy.serialization import dumps
+from flowy.serialization import loads
+
+
+def legacy_dumps(value):
+    return json.dumps(_legacy_tag(value))
+
+
+def _legacy_tag(value):
+    if isinstance(value, uuid.UUID):
+        return {' u': value.hex}
+    elif isinstance(value, bytes):
+        return {' b': b64encode(value).decode('ascii')}
+    elif callable(getattr(value, '__json__', None)):
+        return _legacy_tag(value.__json__())
+    elif isinstance(value, (list, tuple)):
+        return [_legacy_tag(x) for x in value]
+    elif isinstance(value, dict):
+        return dict((k, _legacy_tag(v)) for k, v in value.items())
+    return value
+
+
+def legacy_loads(value):
+    return json.loads(value, object_hook=_legacy_obj_hook)
+
+
+def _legacy_obj_hook(obj):
+    if len(obj) != 1:
+        return obj
+    key, value = next(iter(obj.items()))
+    if key == ' u':
+        return uuid.UUID(value)
+    elif key == ' b':
+        return b64decode(value)
+    return obj
+
+
+PAYLOADS = {
+    'ids': [list(range(50000)), {}],
+    'records': [[{'id': i, 'name': 'item-%s' % i, 'tags': ['a', 'b'],
+                  'size': i * 1.5} for i in range(10000)], {}],
+    'tagged': [[{'id': uuid.UUID(int=i), 'data': b'x' * 16}
+                for i in range(5000)], {}],
+}
+
+
+def bench(f, arg, number=20):
+    return min(timeit.repeat(lambda: f(arg), number=number, repeat=7)) / number
+
+
+def main():
+    row = '%-8s %-6s %10s %10s %8s'
+    print(row % ('payload', 'op', 'legacy ms', 'new ms', 'speedup'))
+    for name, payload in sorted(PAYLOADS.items()):
+        old = bench(legacy_dumps, payload)
+        new = bench(dumps, payload)
+        print(row % (name, 'dumps', '%.2f' % (old * 1000),
+                     '%.2f' % (new * 1000), '%.1fx' % (old / new)))
+        encoded = dumps(payload)
+        assert legacy_loads(encoded) == loads(encoded)
+        old = bench(legacy_loads, encoded)
+        new = bench(loads, encoded)
+        print(row % (name, 'loads', '%.2f' % (old * 1000),
+                     '%.2f' % (new * 1000), '%.1fx' % (old / new)))
+
+
+if __name__ == '__main__':
+    main()
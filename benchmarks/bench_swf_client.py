@@ -0,0 +1,38 @@
+"""Measure the cost of getting an SWF client, fresh versus shared.
+
+SWFWorkflowStarter used to build a new SWFClient, and a new boto3 client
+with its own connection pool, for each workflow started. No requests are
+made here, only the clients are created.
+
+Run with: python benchmarks/bench_swf_client.py
+"""
+from __future__ import print_function
+
+import time
+
+from flowy.swf.client import SWFClient
+from flowy.swf.client import get_swf_client
+
+
+CALLS = 50
+KWARGS = {'region_name': 'us-east-1', 'aws_access_key_id': 'x',
+          'aws_secret_access_key': 'x'}
+
+
+def timed(f):
+    start = time.time()
+    for _ in range(CALLS):
+        f()
+    return (time.time() - start) / CALLS * 1000
+
+
+def main():
+    get_swf_client(**KWARGS)  # the first one is created
+    print('fresh SWFClient():  %8.3f ms/client' % timed(
+        lambda: SWFClient(kwargs=dict(KWARGS))))
+    print('get_swf_client():   %8.3f ms/client' % timed(
+        lambda: get_swf_client(**KWARGS)))
+
+
+if __name__ == '__main__':
+    main()
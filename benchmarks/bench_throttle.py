@@ -0,0 +1,90 @@
+"""Measure how SWFClient behaves when SWF throttles the calls.
+
+A stubbed low-level client accepts 100 calls per second, like an account
+quota, and answers the rest with ThrottlingException. A few threads send
+responses as fast as they can, first with the throttle disabled, retrying
+right away, then with the client token bucket and the jittered backoff. The
+wasted calls are the ones rejected by the stub.
+
+Run with: python benchmarks/bench_throttle.py
+"""
+from __future__ import print_function
+
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from flowy.swf.client import SWFClient
+from flowy.swf.client import Throttle
+from flowy.utils import logger
+
+
+QUOTA = 100  # calls per second accepted by the stub
+THREADS = 8
+RESPONSES = 480
+
+
+class ThrottlingSWF(object):
+    def __init__(self):
+        self.tokens = QUOTA / 10.0
+        self.last = time.time()
+        self.accepted = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def respond_activity_task_completed(self, **kwargs):
+        with self.lock:
+            now = time.time()
+            self.tokens = min(QUOTA / 10.0,
+                              self.tokens + (now - self.last) * QUOTA)
+            self.last = now
+            if self.tokens < 1:
+                self.rejected += 1
+                raise ClientError({'Error': {'Code': 'ThrottlingException',
+                                             'Message': 'Rate exceeded'}},
+                                  'RespondActivityTaskCompleted')
+            self.tokens -= 1
+            self.accepted += 1
+
+
+def run(throttle):
+    swf = ThrottlingSWF()
+    client = SWFClient(client=swf, throttle=throttle)
+    per_thread = RESPONSES // THREADS
+
+    def respond():
+        for i in range(per_thread):
+            while 1:
+                try:
+                    client.respond_activity_task_completed('token')
+                    break
+                except ClientError:
+                    pass  # retry right away, like the old poll loops
+
+    start = time.time()
+    threads = [threading.Thread(target=respond) for _ in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.time() - start, swf.accepted, swf.rejected
+
+
+def main():
+    logger.setLevel('ERROR')  # don't log the retries
+    print('%d responses from %d threads, %d calls/s quota' % (
+        RESPONSES, THREADS, QUOTA))
+    cases = [
+        ('no throttle', Throttle(rates={'respond': None}, max_retries=0)),
+        ('backoff only', Throttle(rates={'respond': None})),
+        ('bucket and backoff', Throttle(rates={'respond': (QUOTA, 10)})),
+    ]
+    for name, throttle in cases:
+        duration, accepted, rejected = run(throttle)
+        print('%-20s %5.2fs, %4d accepted, %7d wasted calls' % (
+            name, duration, accepted, rejected))
+
+
+if __name__ == '__main__':
+    main()
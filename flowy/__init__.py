@@ -1,14 +1,67 @@
+import importlib
+import sys
+
 from flowy.local.config import LocalWorkflow
-from flowy.swf.config import SWFActivityConfig
-from flowy.swf.config import SWFWorkflowConfig
-from flowy.swf.client import SWFClient
-from flowy.swf.starter import SWFWorkflowStarter
-from flowy.swf.worker import SWFActivityWorker
-from flowy.swf.worker import SWFWorkflowWorker
+from flowy.local.engine import LocalEngine
 from flowy.operations import finish_order
 from flowy.operations import first
+from flowy.operations import parallel_map
 from flowy.operations import parallel_reduce
 from flowy.result import restart
 from flowy.result import TaskError
 from flowy.result import TaskTimedout
 from flowy.result import wait
+
+
+# The SWF backend needs boto3, which is slow to import, so its names are
+# imported on first access. The local backend doesn't need it.
+_lazy_names = {
+    'SWFActivityConfig': 'flowy.swf.config',
+    'SWFWorkflowConfig': 'flowy.swf.config',
+    'SWFClient': 'flowy.swf.client',
+    'SWFWorkflowBatchStarter': 'flowy.swf.starter',
+    'SWFWorkflowStarter': 'flowy.swf.starter',
+    'SWFActivityWorker': 'flowy.swf.worker',
+    'SWFWorkflowWorker': 'flowy.swf.worker',
+}
+
+__all__ = ['LocalEngine', 'LocalWorkflow', 'finish_order', 'first',
+           'parallel_map', 'parallel_reduce', 'restart', 'TaskError',
+           'TaskTimedout', 'wait'] + sorted(_lazy_names)
+
+
+def __getattr__(name):
+    try:
+        module_name = _lazy_names[name]
+    except KeyError:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value  # only import once
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_names))
+
+
+if sys.version_info < (3, 7):
+    # No support for the module __getattr__, use a module subclass instead
+    import types
+
+    class _LazyModule(types.ModuleType):
+        def __getattr__(self, name):
+            value = __getattr__(name)
+            setattr(self, name, value)
+            return value
+
+        def __dir__(self):
+            return __dir__()
+
+    if sys.version_info >= (3, 5):
+        sys.modules[__name__].__class__ = _LazyModule
+    else:
+        _module = _LazyModule(__name__, __doc__)
+        _module.__dict__.update(globals())
+        # Keep the original module alive, its globals are used above
+        _module._original_module = sys.modules[__name__]
+        sys.modules[__name__] = _module
@@ -1,7 +1,10 @@
 import argparse
+import json
 import sys
 
+from flowy import SWFWorkflowBatchStarter
 from flowy import SWFWorkflowStarter
+from flowy.swf.starter import read_batch
 
 
 def main():
@@ -14,18 +17,45 @@ def main():
     parser.add_argument("--workflow-duration", type=int, default=None)
     parser.add_argument("--child-policy", type=str, default=None)
     parser.add_argument("--lambda-role", type=str, default=None)
+    parser.add_argument("--batch", type=argparse.FileType('r'), default=None,
+                        help="start a workflow for each line of a JSON lines "
+                             "file with the wid, args and kwargs; - for stdin")
+    parser.add_argument("--concurrency", type=int, default=10,
+                        help="the number of workflows started at once")
     parser.add_argument('args', nargs=argparse.REMAINDER)
 
     args = parser.parse_args()
 
+    starter_kwargs = dict(task_list=args.task_list,
+                          task_duration=args.task_duration,
+                          workflow_duration=args.workflow_duration,
+                          child_policy=args.child_policy,
+                          lambda_role=args.lambda_role)
+    if args.batch is not None:
+        if args.args:
+            parser.error('the workflow args are read from the batch file')
+        starter = SWFWorkflowBatchStarter(args.domain, args.name, args.version,
+                                          concurrency=args.concurrency,
+                                          **starter_kwargs)
+        return start_batch(starter, args.batch)
     starter = SWFWorkflowStarter(args.domain, args.name, args.version,
-                                 swf_client=None, task_list=args.task_list,
-                                 task_duration=args.task_duration,
-                                 workflow_duration=args.workflow_duration,
-                                 child_policy=args.child_policy,
-                                 lambda_role=args.lambda_role)
+                                 swf_client=None, **starter_kwargs)
     return not starter(*args.args)  # 0 is success
 
 
+def start_batch(starter, batch_file):
+    """Print a JSON line with the run id or the error of each workflow."""
+    failed = False
+    for wid, run_id, error in starter(read_batch(batch_file)):
+        if error is None:
+            line = {'wid': str(wid), 'run_id': run_id}
+        else:
+            failed = True
+            line = {'wid': str(wid), 'error': str(error)}
+        sys.stdout.write(json.dumps(line) + '\n')
+        sys.stdout.flush()
+    return int(failed)  # 0 is success
+
+
 if __name__ == '__main__':
     sys.exit(main())
@@ -0,0 +1,15 @@
+"""Helpers for coroutine tasks, needs Python 3.5 or newer."""
+from flowy.utils import logger
+
+
+__all__ = ['serialize_awaited']
+
+
+async def serialize_awaited(config, awaitable):
+    """Await the result of a coroutine activity and serialize it."""
+    result = await awaitable
+    try:
+        return config.serialize_result(result)
+    except Exception:
+        logger.exception('Cannot serialize the result:')
+        raise ValueError('Cannot serialize the result: %r' % (result,))
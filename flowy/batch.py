@@ -0,0 +1,277 @@
+"""Send many small calls of the same task as a single, batched, task.
+
+The calls made through a :class:`BatchProxy` are grouped in batches of
+consecutive calls, in the order they are made. Each batch is scheduled as a
+single task having the list with the input of every call in the batch as its
+input. The task runs all the calls and returns the list with their results,
+or errors, which are then split back into individual results.
+
+A batch is identified by the number of its last call. Because the calls are
+always batched in order, and every call number up to the last one batched is
+part of a batch, this is enough to find the batch and the position of any
+call from the execution history, when the workflow is replayed.
+"""
+
+import bisect
+import json
+
+from flowy.history import ERROR
+from flowy.history import RUNNING
+from flowy.history import TIMEDOUT
+from flowy.proxy import Proxy
+from flowy.result import copy_result_proxy
+from flowy.result import error
+from flowy.result import placeholder
+from flowy.result import result
+from flowy.result import timeout
+from flowy.serialization import loads
+from flowy.serialization import traverse_data
+from flowy.utils import logger
+
+
+__all__ = ['BatchProxy', 'dumps_batch', 'loads_batch', 'is_batch',
+           'run_batch', 'run_local_batch']
+
+
+BATCH_HEADER = '[batch]'  # can't be the start of a JSON document
+
+
+def dumps_batch(inputs):
+    """Serialize the list with the input data of each call in a batch."""
+    return BATCH_HEADER + json.dumps(inputs)
+
+
+def loads_batch(input_data):
+    return json.loads(input_data[len(BATCH_HEADER):])
+
+
+def is_batch(input_data):
+    """Check if the input data is the input of a batch."""
+    return input_data[:len(BATCH_HEADER)] == BATCH_HEADER
+
+
+def run_batch(call, inputs, max_size=None):
+    """Call each input data and collect the results or the errors.
+
+    The result of each call is a [True, result] or [False, reason] list. The
+    inputs of the calls with errors in their arguments are None and so are
+    their results.
+
+    With max_size, the results that would make the serialized list longer
+    than max_size are replaced with errors, so only the calls with these
+    results fail and not the whole batch.
+    """
+    results = []
+    size = len('[]')
+    for input_data in inputs:
+        if input_data is None:
+            item = None
+        else:
+            try:
+                item = [True, call(input_data)]
+            except Exception as e:
+                logger.exception('Unhandled exception in batched call:')
+                item = [False, str(e)]
+        if max_size is not None:
+            item_size = len(json.dumps(item)) + len(', ')
+            if item is not None and size + item_size > max_size:
+                item = [False, 'Batch result too large.']
+                item_size = len(json.dumps(item)) + len(', ')
+            size += item_size
+        results.append(item)
+    return results
+
+
+def run_local_batch(f, inputs):
+    """Like run_batch but for a function called by the local backend.
+
+    The results are not serialized, the local backend keeps them as they are.
+    """
+    return run_batch(lambda input_data: _local_call(f, input_data), inputs)
+
+
+def _local_call(f, input_data):
+    args, kwargs = loads(input_data)
+    return f(*args, **kwargs)
+
+
+class BatchProxy(Proxy):
+    """A proxy that schedules its calls, in batches, as single tasks.
+
+    Only the consecutive calls having all their arguments ready can be part of
+    the same batch. A call waiting on the results of other tasks ends the
+    current batch and no new batches are started until the next decision. A
+    batch is scheduled as soon as it has batch_size calls; the calls that
+    didn't fill a whole batch are scheduled when the decision is flushed.
+
+    With max_size, a batch is also scheduled before its serialized input
+    would get longer than max_size. A single call with a larger input makes a
+    batch on its own.
+
+    The retries are done for a whole batch, and not for individual calls, and
+    an error that fails the entire batch task is an error for all of its calls.
+    """
+
+    def __init__(self, task_exec_history, task_decision, retry=(0, ),
+                 serialize_input=None, deserialize_result=None,
+                 batch_size=16, serialize_batch=None, deserialize_batch=None,
+                 max_size=None):
+        super(BatchProxy, self).__init__(task_exec_history, task_decision,
+                                         retry, serialize_input,
+                                         deserialize_result)
+        self.batch_size = int(batch_size)
+        if self.batch_size < 1:
+            raise ValueError('The batch size must be at least 1')
+        self.max_size = max_size
+        if serialize_batch is not None:
+            self.serialize_batch = serialize_batch
+        if deserialize_batch is not None:
+            self.deserialize_batch = deserialize_batch
+        # The batches are identified by the number of their last call
+        self.batch_ends = [call_number for call_number, retries
+                           in enumerate(task_exec_history.calls) if retries]
+        self.batch_results = {}  # (batch end, retry number) -> batch results
+        self.retry_inputs = {}  # batch end -> inputs for the batch retry
+        self.pending = []  # the inputs of the calls not scheduled yet
+        self.pending_size = len(BATCH_HEADER + '[]')
+        self.pending_end = None
+        self.batching = True
+
+    def __call__(self, *args, **kwargs):
+        call_number = self.call_number
+        self.call_number += 1
+        i = bisect.bisect_left(self.batch_ends, call_number)
+        if i == len(self.batch_ends):
+            return self._add_call(call_number, args, kwargs)
+        start = self.batch_ends[i - 1] + 1 if i else 0
+        end = self.batch_ends[i]
+        return self._batch_call(start, end, call_number - start, args, kwargs)
+
+    def skip_call(self):
+        """Use up the next call number without making the call.
+
+        Like a call with unfinished arguments, a skipped call ends the current
+        batch: the following calls are batched only once it's made.
+        """
+        self.call_number += 1
+        self.batching = False
+
+    def flush(self):
+        """Schedule the calls that didn't fill a whole batch."""
+        if self.pending:
+            self._schedule_pending()
+
+    def _add_call(self, call_number, args, kwargs):
+        if not self.batching:
+            return placeholder()
+        r, input_data = self._prepare(args, kwargs)
+        if input_data is None and not r.__factory__.is_error():
+            self.batching = False  # this call must be the start of a batch
+            return r
+        if self.max_size is not None:
+            size = len(json.dumps(input_data)) + len(', ')
+            if self.pending and self.pending_size + size > self.max_size:
+                self._schedule_pending()
+                if not self.batching:
+                    return placeholder()
+            self.pending_size += size
+        self.pending.append(input_data)
+        self.pending_end = call_number
+        if len(self.pending) >= self.batch_size:
+            self._schedule_pending()
+        return placeholder() if r is None else r
+
+    def _schedule_pending(self):
+        inputs, self.pending = self.pending, []
+        self.pending_size = len(BATCH_HEADER + '[]')
+        if not self._schedule(self.pending_end, 0, self.retry[0], inputs):
+            # A batch must not start before the unscheduled calls
+            self.batching = False
+
+    def _batch_call(self, start, end, index, args, kwargs):
+        states = self.task_exec_history.call_states(end)
+        for retry_number, delay in enumerate(self.retry):
+            state = states[retry_number] if retry_number < len(states) else None
+            if state is None:
+                self._add_retry_call(end - start + 1, end, retry_number, delay,
+                                     args, kwargs)
+                return placeholder()
+            status, value, order = state
+            if status == TIMEDOUT:
+                continue
+            if status == RUNNING:
+                return placeholder()
+            if status == ERROR:
+                return error(value, order)
+            try:
+                item = self._batch_results(end, retry_number, value)[index]
+            except Exception as e:
+                logger.exception('Error while deserializing the batch result:')
+                self.task_decision.fail(e)
+                return placeholder()
+            if item is None:  # the call had errors in its arguments
+                r, _ = self._prepare(args, kwargs)
+                return placeholder() if r is None else r
+            ok, value = item
+            if not ok:
+                return error(value, order)
+            try:
+                value = self.deserialize_result(value)
+            except Exception as e:
+                logger.exception(
+                    'Error while deserializing the activity result:')
+                self.task_decision.fail(e)
+                return placeholder()
+            return result(value, order)
+        # No retries left, it must be a timeout; order is the last one's
+        return timeout(order)
+
+    def _add_retry_call(self, size, end, retry_number, delay, args, kwargs):
+        inputs = self.retry_inputs.setdefault(end, [])
+        inputs.append(self._prepare(args, kwargs)[1])
+        if len(inputs) == size:
+            self._schedule(end, retry_number, delay, inputs)
+
+    def _batch_results(self, end, retry_number, value):
+        key = (end, retry_number)
+        try:
+            return self.batch_results[key]
+        except KeyError:
+            items = self.batch_results[key] = self.deserialize_batch(value)
+            return items
+
+    def _prepare(self, args, kwargs):
+        """Return (None, input_data) if the call is ready to be scheduled.
+
+        Otherwise, return an error or a placeholder result and None.
+        """
+        traversed_args, (err, placeholders) = traverse_data([args, kwargs])
+        if err is not None:
+            return copy_result_proxy(err), None
+        if placeholders:
+            return placeholder(), None
+        t_args, t_kwargs = traversed_args
+        try:
+            return None, self.serialize_input(*t_args, **t_kwargs)
+        except Exception as e:
+            logger.exception('Error while serializing the task input:')
+            self.task_decision.fail(e)
+            return placeholder(), None
+
+    def _schedule(self, end, retry_number, delay, inputs):
+        try:
+            input_data = self.serialize_batch(inputs)
+        except Exception as e:
+            logger.exception('Error while serializing the batch input:')
+            self.task_decision.fail(e)
+            return False
+        return self.task_decision.schedule(end, retry_number, delay, input_data)
+
+    @staticmethod
+    def serialize_batch(inputs):
+        return dumps_batch(inputs)
+
+    @staticmethod
+    def deserialize_batch(value):
+        """Deserialize the list of results returned by :func:`run_batch`."""
+        return loads(value)
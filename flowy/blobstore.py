@@ -0,0 +1,85 @@
+import binascii
+import errno
+import hashlib
+import os
+import re
+
+
+__all__ = ['BlobStore', 'FileBlobStore']
+
+
+class BlobStore(object):
+    """A content-addressed store for the payloads too large for SWF.
+
+    Implementations must be reachable, with the same content, from every
+    worker that decodes the references. Register them with
+    :func:`flowy.serialization.register_blob_store` in every worker process.
+    """
+
+    def put(self, data):
+        """Store the data text and return its key.
+
+        The key must be derived from the content, so storing the same data
+        multiple times returns the same key and stores the data only once.
+        """
+        raise NotImplementedError
+
+    def get(self, key):
+        """Return the data text stored under key."""
+        raise NotImplementedError
+
+
+class FileBlobStore(BlobStore):
+    """A blob store using a local or shared directory.
+
+    The blobs are stored in files named after the SHA-256 hash of their
+    content. They are created with mode, minus the umask, like any other new
+    file, so by default workers running as other users can share the
+    directory.
+    """
+
+    _key_re = re.compile('^[0-9a-f]{64}$')
+
+    def __init__(self, path, mode=0o666):
+        self.path = path
+        self.mode = mode
+
+    def put(self, data):
+        raw = data.encode('utf-8')
+        key = hashlib.sha256(raw).hexdigest()
+        path = self._blob_path(key)
+        if os.path.exists(path):
+            return key
+        dirname = os.path.dirname(path)
+        try:
+            os.makedirs(dirname)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Write to a temporary file first so a blob is never partially visible;
+        # not made by mkstemp, which ignores the umask and always uses 0o600
+        tmp_path = os.path.join(dirname, '.%s.%s' % (
+            key, binascii.hexlify(os.urandom(8)).decode('ascii')))
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                     getattr(os, 'O_BINARY', 0), self.mode)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(raw)
+            os.rename(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return key
+
+    def get(self, key):
+        with open(self._blob_path(key), 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def _blob_path(self, key):
+        if not self._key_re.match(key):
+            raise ValueError('Invalid blob key: %r' % (key,))
+        return os.path.join(self.path, key[:2], key)
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.path)
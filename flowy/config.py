@@ -3,10 +3,14 @@ import keyword
 
 import venusian
 
+from flowy.batch import is_batch
+from flowy.batch import loads_batch
+from flowy.batch import run_batch
 from flowy.result import is_result_proxy
 from flowy.result import restart_type
 from flowy.result import SuspendTask
 from flowy.result import wait
+from flowy.result import warn_ignored_errors
 from flowy.serialization import dumps
 from flowy.serialization import loads
 from flowy.serialization import traverse_data
@@ -27,6 +31,7 @@ class ActivityConfig(object):
     """
 
     category = None  # The category used with venusian
+    batch_result_size = None  # The size limit of the batch results, if any
 
     def __init__(self, deserialize_input=None, serialize_result=None):
         """Initialize the activity config object.
@@ -111,13 +116,33 @@ class ActivityConfig(object):
         return functools.partial(_activity_wrapper, self, func)
 
 
-def _activity_wrapper(self, func, input_data, *extra_args):
+def _activity_wrapper(self, func, input_data, *extra_args, **kwargs):
+    """Run the activity func with the deserialized input_data.
+
+    A coroutine activity can only run if allow_awaitable is set, by the
+    asyncio worker that awaits it; then the awaitable of the serialized
+    result is returned. Everywhere else it fails, like any other activity
+    that can't run, instead of returning a coroutine that is never awaited.
+    """
+    allow_awaitable = kwargs.pop('allow_awaitable', False)
+    if is_batch(input_data):
+        return dumps(run_batch(
+            lambda data: _activity_wrapper(self, func, data, *extra_args),
+            loads_batch(input_data), max_size=self.batch_result_size))
     try:
         args, kwargs = self.deserialize_input(input_data)
     except Exception:
         logger.exception('Cannot deserialize the input:')
         raise ValueError('Cannot deserialize the input: %r' % (input_data,))
     result = func(*(tuple(extra_args) + tuple(args)), **kwargs)
+    if hasattr(result, '__await__'):
+        if not allow_awaitable:
+            if hasattr(result, 'close'):
+                result.close()  # don't warn that it was never awaited
+            raise ValueError('Coroutine activities need an asyncio worker.')
+        # A coroutine activity, the result is serialized after it's awaited
+        from flowy.aio import serialize_awaited
+        return serialize_awaited(self, result)
     try:
         return self.serialize_result(result)
     except Exception:
@@ -201,9 +226,27 @@ class WorkflowConfig(ActivityConfig):
 
 
 def _workflow_wrapper(self, factory, input_data, *extra_args):
+    with warn_ignored_errors():
+        return _run_workflow(self, factory, input_data, *extra_args)
+
+
+def _run_workflow(self, factory, input_data, *extra_args):
     wf_kwargs = {}
     for dep_name, proxy in self.proxy_factory_registry.items():
         wf_kwargs[dep_name] = proxy(*extra_args)
+    try:
+        return _call_workflow(self, factory, wf_kwargs, input_data)
+    except SuspendTask:
+        # Proxies like BatchProxy can delay scheduling until the decision ends;
+        # there is nothing to schedule if the workflow finishes or fails
+        for proxy in wf_kwargs.values():
+            flush = getattr(proxy, 'flush', None)
+            if flush is not None:
+                flush()
+        raise
+
+
+def _call_workflow(self, factory, wf_kwargs, input_data):
     func = factory(**wf_kwargs)
     try:
         args, kwargs = self.deserialize_input(input_data)
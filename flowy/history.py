@@ -0,0 +1,267 @@
+import copy
+
+
+__all__ = ['ExecutionHistory', 'TaskExecutionHistory', 'parse_call_key',
+           'VersionedExecutionHistory', 'HistoryView',
+           'RUNNING', 'RESULT', 'ERROR', 'TIMEDOUT']
+
+
+# poor man's enums; the states a scheduled call can be in
+RUNNING = 'RUNNING'
+RESULT = 'RESULT'
+ERROR = 'ERROR'
+TIMEDOUT = 'TIMEDOUT'
+
+
+class ExecutionHistory(object):
+    """The execution history of a workflow, partitioned by proxy identity.
+
+    The calls are identified by call keys of the form
+    identity-call_number-retry_number. The keys are parsed only once, when the
+    history is updated, and the state of each call is stored in a
+    :class:`TaskExecutionHistory` for its proxy identity. This way, a proxy can
+    find the state of a call without formatting or hashing call keys.
+    """
+
+    def __init__(self):
+        self.tasks = {}  # identity -> TaskExecutionHistory
+        self.finish_order = []  # the call keys in the order they finished
+
+    def task_history(self, identity):
+        """The history of all the calls made by a proxy identity."""
+        try:
+            return self.tasks[identity]
+        except KeyError:
+            th = self.tasks[identity] = TaskExecutionHistory()
+            return th
+
+    def copy(self):
+        h = self.__class__.__new__(self.__class__)
+        h.__dict__ = copy.deepcopy(self.__dict__)
+        return h
+
+    def set_running(self, call_key):
+        self.set_state(call_key, (RUNNING, None, None))
+
+    def set_result(self, call_key, result):
+        self.set_state(call_key, (RESULT, result, self._finish(call_key)))
+
+    def set_error(self, call_key, reason):
+        self.set_state(call_key, (ERROR, reason, self._finish(call_key)))
+
+    def set_timeout(self, call_key):
+        self.set_state(call_key, (TIMEDOUT, None, self._finish(call_key)))
+
+    def _finish(self, call_key):
+        """Record the finish order and return the call finish position."""
+        self.finish_order.append(call_key)
+        return len(self.finish_order) - 1
+
+    def set_state(self, call_key, state):
+        """Set the state of a call as a (status, value, order) tuple."""
+        try:
+            identity, call_number, retry_number = parse_call_key(call_key)
+        except ValueError:
+            return  # not generated by a proxy, nothing can look it up
+        self.task_history(identity).set_state(call_number, retry_number, state)
+
+    def __repr__(self):
+        counts = {RUNNING: 0, RESULT: 0, ERROR: 0, TIMEDOUT: 0}
+        for th in self.tasks.values():
+            for retries in th.calls:
+                for state in retries or ():
+                    if state is not None:
+                        counts[state[0]] += 1
+        if len(self.finish_order) > 6:
+            order = (' '.join(map(str, self.finish_order[:3])) + ' ... ' +
+                     ' '.join(map(str, self.finish_order[-3:])))
+        else:
+            order = ' '.join(map(str, self.finish_order))
+        return "<RUNNING: %d, RESULTS: %d, ERRORS: %d, ORDER: %s>" % (
+            counts[RUNNING], counts[RESULT], counts[ERROR], order)
+
+
+class TaskExecutionHistory(object):
+    """The state of all the calls made by a single proxy identity.
+
+    The states are stored in lists indexed by the call number and then by the
+    retry number. Each state is a (status, value, order) tuple or None if the
+    call was never scheduled.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def call_states(self, call_number):
+        """Return the states of all the retries for a call number."""
+        calls = self.calls
+        if call_number < len(calls):
+            return calls[call_number] or ()
+        return ()
+
+    def set_state(self, call_number, retry_number, state):
+        calls = self.calls
+        if call_number >= len(calls):
+            calls.extend([None] * (call_number + 1 - len(calls)))
+        retries = calls[call_number]
+        if retries is None:
+            retries = calls[call_number] = []
+        if retry_number >= len(retries):
+            retries.extend([None] * (retry_number + 1 - len(retries)))
+        retries[retry_number] = state
+
+
+class VersionedExecutionHistory(ExecutionHistory):
+    """An execution history that can be viewed as it was at an earlier time.
+
+    Every state change gets a new version and the states are never
+    overwritten, the new ones are appended. A :class:`HistoryView` of the
+    current version is made in constant time and it doesn't change when the
+    history is updated later, so it can be used by a decision running in
+    another thread while the history keeps changing.
+
+    Only the thread updating the history may make views.
+    """
+
+    def __init__(self):
+        super(VersionedExecutionHistory, self).__init__()
+        self.version = 0
+
+    def task_history(self, identity):
+        try:
+            return self.tasks[identity]
+        except KeyError:
+            th = self.tasks[identity] = VersionedTaskExecutionHistory()
+            return th
+
+    def set_state(self, call_key, state):
+        try:
+            identity, call_number, retry_number = parse_call_key(call_key)
+        except ValueError:
+            return  # not generated by a proxy, nothing can look it up
+        self.version += 1
+        self.task_history(identity).set_state(call_number, retry_number,
+                                              (self.version, state))
+
+    def view(self):
+        """A read-only view of the history as it is now."""
+        return HistoryView(self, self.version, len(self.finish_order))
+
+    def __repr__(self):
+        return repr(self.view())
+
+
+class VersionedTaskExecutionHistory(TaskExecutionHistory):
+    """Like :class:`TaskExecutionHistory` but each retry has a list of
+    (version, state) tuples, in the order they were set."""
+
+    def call_states(self, call_number, version=None):
+        """Return the states of all the retries for a call number, as they
+        were at a version, by default the last one."""
+        calls = self.calls
+        if call_number >= len(calls) or not calls[call_number]:
+            return ()
+        states = []
+        for changes in calls[call_number]:
+            state = None
+            for v, s in reversed(changes or ()):
+                if version is None or v <= version:
+                    state = s
+                    break
+            states.append(state)
+        while states and states[-1] is None:
+            states.pop()  # the retries scheduled after the version
+        return states or ()
+
+    def set_state(self, call_number, retry_number, state):
+        calls = self.calls
+        if call_number >= len(calls):
+            calls.extend([None] * (call_number + 1 - len(calls)))
+        retries = calls[call_number]
+        if retries is None:
+            retries = calls[call_number] = []
+        if retry_number >= len(retries):
+            retries.extend([None] * (retry_number + 1 - len(retries)))
+        if retries[retry_number] is None:
+            retries[retry_number] = [state]
+        else:
+            retries[retry_number].append(state)
+
+
+class HistoryView(object):
+    """A read-only view of a :class:`VersionedExecutionHistory` version.
+
+    It has the same interface as :class:`ExecutionHistory` for the proxies.
+    When pickled, only the states visible in the view are kept and it's
+    loaded as a plain :class:`ExecutionHistory`.
+    """
+
+    def __init__(self, history, version, finished):
+        self.history = history
+        self.version = version
+        self.finished = finished
+
+    def task_history(self, identity):
+        return TaskHistoryView(self.history.tasks.get(identity), self.version)
+
+    @property
+    def finish_order(self):
+        return self.history.finish_order[:self.finished]
+
+    def materialize(self):
+        """Copy the states visible in the view to a plain history."""
+        h = ExecutionHistory()
+        h.finish_order = self.finish_order
+        # The history may change while this runs, in the pickling thread
+        for identity, th in list(self.history.tasks.items()):
+            h.tasks[identity] = th_copy = TaskExecutionHistory()
+            th_copy.calls = TaskHistoryView(th, self.version).calls
+        return h
+
+    def __reduce__(self):
+        h = self.materialize()
+        return _plain_history, (h.tasks, h.finish_order)
+
+    def __repr__(self):
+        return repr(self.materialize())
+
+
+class TaskHistoryView(object):
+    """A read-only view of a :class:`VersionedTaskExecutionHistory`."""
+
+    def __init__(self, task_history, version):
+        self.task_history = task_history
+        self.version = version
+
+    def call_states(self, call_number):
+        if self.task_history is None:
+            return ()
+        return self.task_history.call_states(call_number, self.version)
+
+    @property
+    def calls(self):
+        """The states of the retries of each call, like in
+        :class:`TaskExecutionHistory`, or None for the calls not scheduled."""
+        if self.task_history is None:
+            return []
+        calls = [self.call_states(call_number) or None
+                 for call_number in range(len(self.task_history.calls))]
+        while calls and calls[-1] is None:
+            calls.pop()
+        return calls
+
+
+def _plain_history(tasks, finish_order):
+    h = ExecutionHistory()
+    h.tasks = tasks
+    h.finish_order = finish_order
+    return h
+
+
+def parse_call_key(call_key):
+    """Split a call key in identity, call number and retry number.
+
+    Raise ValueError if the call key doesn't have the expected format.
+    """
+    identity, call_number, retry_number = str(call_key).rsplit('-', 2)
+    return identity, int(call_number), int(retry_number)
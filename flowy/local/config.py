@@ -2,28 +2,68 @@ from concurrent.futures import ProcessPoolExecutor
 
 from flowy.config import WorkflowConfig
 from flowy.local.decision import Decision
+from flowy.local.engine import LocalEngine
 from flowy.local.proxy import ActivityProxy
 from flowy.local.proxy import WorkflowProxy
-from flowy.local.runner import RootWorkflowRunner
-from flowy.proxy import Proxy
-from flowy.tracer import ExecutionTracer
+from flowy.local.spill import loads_handles
 from flowy.worker import Worker
 
 
 class LocalWorkflow(WorkflowConfig):
+    """Run a workflow on this machine, using threads or processes.
+
+    The coalesce_window and coalesce_count options batch the task
+    completions that arrive close to each other in a single workflow replay,
+    see :class:`flowy.local.runner.WorkflowRunner`.
+
+    At most max_in_flight activities, twice the activity workers by default,
+    are submitted to the executor at once; the rest wait in a compact queue.
+
+    With spill_threshold, the activity results larger than this many bytes
+    are passed between processes as files in spill_dir, see
+    :mod:`flowy.local.spill`.
+    """
     def __init__(self, w,
                  activity_workers=8,
                  workflow_workers=2,
-                 executor=ProcessPoolExecutor):
+                 executor=ProcessPoolExecutor,
+                 coalesce_window=None,
+                 coalesce_count=None,
+                 max_in_flight=None,
+                 spill_threshold=None,
+                 spill_dir=None):
         super(LocalWorkflow, self).__init__()
         self.activity_workers = activity_workers
         self.workflow_workers = workflow_workers
         self.executor = executor
+        self.max_in_flight = max_in_flight or 2 * activity_workers
+        self.spill_threshold = spill_threshold
+        self.spill_dir = spill_dir
+        self.coalesce_window = coalesce_window
+        self.coalesce_count = coalesce_count
         self.worker = Worker()
         self.worker.register_task('local', self.wrap(w))
 
-    def conf_activity(self, dep_name, f):
-        self.conf_proxy_factory(dep_name, ActivityProxy(dep_name, f))
+    @staticmethod
+    def deserialize_input(input_data):
+        """Deserialize the input data, with the spilled handles in it."""
+        args, kwargs = loads_handles(input_data)
+        if not isinstance(args, list):
+            raise ValueError('Invalid args: %r' % (args,))
+        if not isinstance(kwargs, dict):
+            raise ValueError('Invalid kwargs: %r' % (kwargs,))
+        return args, kwargs
+
+    def conf_activity(self, dep_name, f, batch_size=None):
+        """Configure an activity dependency.
+
+        If batch_size is set, up to batch_size calls are sent as a single
+        activity task, see :class:`flowy.batch.BatchProxy`. The batched calls
+        are not traced: a traced execution shows one node for each batch,
+        without its dependencies.
+        """
+        self.conf_proxy_factory(dep_name,
+                                ActivityProxy(dep_name, f, batch_size))
 
     def conf_workflow(self, dep_name, f):
         self.conf_proxy_factory(dep_name, WorkflowProxy(dep_name, f))
@@ -39,13 +79,17 @@ class LocalWorkflow(WorkflowConfig):
         return d
 
     def run(self, *args, **kwargs):
+        """Run a single execution on new pools and return its result.
+
+        Use :meth:`engine` to run many executions on the same pools.
+        """
         wait = kwargs.pop('_wait', False)
-        tracer = None
-        if kwargs.pop('_trace', False):
-            tracer = ExecutionTracer()
-        a_executor = self.executor(max_workers=self.activity_workers)
-        w_executor = self.executor(max_workers=self.workflow_workers)
-        input_data = Proxy.serialize_input(*args, **kwargs)
-        wr = RootWorkflowRunner(self, w_executor, a_executor, input_data,
-                                tracer=tracer)
-        return wr.run(wait=wait)
+        engine = self.engine()
+        try:
+            return engine.submit(*args, **kwargs).result()
+        finally:
+            engine.shutdown(wait=wait)
+
+    def engine(self):
+        """A :class:`LocalEngine` with long-lived pools for this workflow."""
+        return LocalEngine(self)
@@ -32,13 +32,13 @@ class Decision(dict):
         self['result'] = result
         self.closed = True
 
-    def schedule_activity(self, call_key, input_data, f):
+    def schedule_activity(self, call_key, input_data, key):
         if self.closed or 'activities' not in self:
             return
         self['activities'].append(
             {'id': call_key,
              'input_data': input_data,
-             'f': f})
+             'key': key})
 
     def schedule_workflow(self, call_key, input_data, f):
         if self.closed or 'workflows' not in self:
@@ -50,10 +50,10 @@ class Decision(dict):
 
 
 class ActivityDecision(object):
-    def __init__(self, decision, identity, f):
+    def __init__(self, decision, identity, key):
         self.decision = decision
         self.identity = identity
-        self.f = f
+        self.key = key
 
     def fail(self, reason):
         self.decision.fail(reason)
@@ -61,7 +61,8 @@ class ActivityDecision(object):
     def schedule(self, call_number, retry_number, delay, input_data):
         self.decision.schedule_activity(
             '%s-%s-%s' % (self.identity, call_number, retry_number),
-            input_data, self.f)
+            input_data, self.key)
+        return True
 
 
 class WorkflowDecision(object):
@@ -77,3 +78,4 @@ class WorkflowDecision(object):
         self.decision.schedule_workflow(
             '%s-%s-%s' % (self.identity, call_number, retry_number),
             input_data, self.f)
+        return True
@@ -0,0 +1,110 @@
+from functools import partial
+from threading import Lock
+
+try:
+    from concurrent.futures import Future
+except ImportError:
+    from futures import Future
+
+from flowy.local.runner import BoundedSubmitter
+from flowy.local.runner import RootWorkflowRunner
+from flowy.local.spill import Spill
+from flowy.local.transport import collect_activities
+from flowy.local.transport import make_executor
+from flowy.proxy import Proxy
+from flowy.tracer import ExecutionTracer
+
+
+__all__ = ['LocalEngine']
+
+
+class LocalEngine(object):
+    """Run many executions of a local workflow on long-lived pools.
+
+    The activity and workflow executors are made once, with the settings of
+    the :class:`LocalWorkflow`, and are shared by all the executions. Each
+    call to :meth:`submit` starts a new execution and returns a future for
+    its result, so many executions can run concurrently::
+
+        with LocalEngine(workflow) as engine:
+            futures = [engine.submit(x) for x in range(1000)]
+            results = [f.result() for f in futures]
+
+    The max_in_flight limit of the workflow applies to all the executions
+    together. The activities are registered in the pools when the engine is
+    made, the calls of the ones configured later fail.
+    """
+
+    def __init__(self, workflow):
+        self.workflow = workflow
+        activities = collect_activities(workflow)
+        self.spill = None
+        if workflow.spill_threshold is not None:
+            self.spill = Spill(workflow.spill_threshold, workflow.spill_dir)
+        self.activity_executor = BoundedSubmitter(
+            make_executor(workflow.executor, workflow.activity_workers,
+                          activities),
+            workflow.max_in_flight,
+            spill=self.spill,
+            keys=activities)
+        self.workflow_executor = workflow.executor(
+            max_workers=workflow.workflow_workers)
+        self.lock = Lock()
+        self.closed = False
+        self.runners = set()  # the executions still running
+
+    def submit(self, *args, **kwargs):
+        """Start a new execution and return a future for its result.
+
+        The execution is traced if the _trace keyword argument is true.
+        Raise RuntimeError after shutdown.
+        """
+        tracer = None
+        if kwargs.pop('_trace', False):
+            tracer = ExecutionTracer()
+        input_data = Proxy.serialize_input(*args, **kwargs)
+        future = Future()
+        future.set_running_or_notify_cancel()  # can't be cancelled
+        runner = RootWorkflowRunner(
+            self.workflow, self.workflow_executor, self.activity_executor,
+            input_data,
+            tracer=tracer,
+            coalesce_window=self.workflow.coalesce_window,
+            coalesce_count=self.workflow.coalesce_count,
+            future=future)
+        with self.lock:
+            if self.closed:
+                raise RuntimeError('Cannot submit after shutdown.')
+            self.runners.add(runner)
+        future.add_done_callback(partial(self.forget, runner))
+        # The pools may be shut down meanwhile, then shutdown fails the future
+        runner.reschedule_decision()
+        return future
+
+    def forget(self, runner, future):
+        with self.lock:
+            self.runners.discard(runner)
+
+    def shutdown(self, wait=True):
+        """Stop the pools and fail the executions still running.
+
+        The futures of the executions that didn't finish, after the pools
+        stopped, fail with a RuntimeError. The spilled files left, if any,
+        are removed.
+        """
+        with self.lock:
+            self.closed = True
+        self.activity_executor.shutdown(wait=wait)
+        self.workflow_executor.shutdown(wait=wait)
+        with self.lock:
+            runners = list(self.runners)
+        for runner in runners:
+            runner.stop_running(RuntimeError('The engine was shut down.'))
+        if self.spill is not None:
+            self.spill.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
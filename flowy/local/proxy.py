@@ -1,21 +1,78 @@
+import copy
+import itertools
+from functools import partial
+
+from flowy.batch import BatchProxy
+from flowy.batch import run_local_batch
+from flowy.history import HistoryView
 from flowy.local.decision import ActivityDecision
 from flowy.local.decision import WorkflowDecision
+from flowy.local.spill import loads_handles
 from flowy.proxy import Proxy
-from flowy.swf.history import SWFTaskExecutionHistory as TaskHistory
 from flowy.tracer import TracingProxy
 
 
+_keys = itertools.count()
+_containers = frozenset([list, dict, set])  # copied for each decision
+
+
+def keep(value):
+    """The activity results are not serialized by the local backend."""
+    return value
+
+
+def result_reader(history):
+    """How the decision using history reads the activity results.
+
+    A :class:`HistoryView` shares the results with the history of the
+    runner, so each decision reads its own copies of the lists, dicts and
+    sets in them and the changes it makes are not seen by the next
+    decisions. Anything else, like arrays or custom objects, is shared by
+    all the decisions and must be treated as immutable. The histories sent
+    to a process are already private copies.
+    """
+    return copy_containers if isinstance(history, HistoryView) else keep
+
+
+def copy_containers(value):
+    """Copy the mutable builtin containers, share everything else."""
+    if type(value) in _containers:
+        return copy.deepcopy(value)
+    return value
+
+
 class ActivityProxy(object):
-    def __init__(self, identity, f):
+    """Schedule the calls of a local activity.
+
+    The decisions refer to the activity by its key, which is registered in
+    the processes running the activities, see :mod:`flowy.local.transport`.
+    """
+    def __init__(self, identity, f, batch_size=None):
         self.identity = identity
         self.f = f
+        self.batch_size = batch_size
+        self.key = '%s/%s' % (identity, next(_keys))
+
+    @property
+    def task(self):
+        """The callable registered for the key."""
+        if self.batch_size is not None:
+            return partial(run_local_batch, self.f)
+        return self.f
 
     def __call__(self, decision, history, tracer):
-        th = TaskHistory(history, self.identity)
-        ad = ActivityDecision(decision, self.identity, self.f)
+        th = history.task_history(self.identity)
+        ad = ActivityDecision(decision, self.identity, self.key)
+        read = result_reader(history)
+        if self.batch_size is not None:  # not traced, see conf_activity
+            return BatchProxy(th, ad, batch_size=self.batch_size,
+                              serialize_batch=Proxy.serialize_input,
+                              deserialize_result=read,
+                              deserialize_batch=keep)
         if tracer is None:
-            return Proxy(th, ad)
-        return TracingProxy(tracer, self.identity, th, ad)
+            return Proxy(th, ad, deserialize_result=read)
+        return TracingProxy(tracer, self.identity, th, ad,
+                            deserialize_result=read)
 
 
 class WorkflowProxy(object):
@@ -24,8 +81,9 @@ class WorkflowProxy(object):
         self.f = f
 
     def __call__(self, decision, history, tracer):
-        th = TaskHistory(history, self.identity)
+        th = history.task_history(self.identity)
         wd = WorkflowDecision(decision, self.identity, self.f)
         if tracer is None:
-            return Proxy(th, wd)
-        return TracingProxy(tracer, self.identity, th, wd)
+            return Proxy(th, wd, deserialize_result=loads_handles)
+        return TracingProxy(tracer, self.identity, th, wd,
+                            deserialize_result=loads_handles)
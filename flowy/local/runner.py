@@ -1,27 +1,172 @@
-import copy
+from collections import deque
 from functools import partial
 from threading import Event
+from threading import Lock
 from threading import RLock
+from threading import Timer
+from threading import current_thread
 
 from flowy import serialization
+from flowy.history import VersionedExecutionHistory
+from flowy.local.spill import loads_handles
+from flowy.local.transport import call_activity
 from flowy.result import TaskError
 
 
+class BoundedSubmitter(object):
+    """Submit the activities to an executor, a bounded number at a time.
+
+    At most max_in_flight activities are submitted to the executor, the
+    others wait in a queue as (key, input_data, callback, task_id) records.
+    A queued activity is submitted when another one finishes. This way, a
+    wide fan-out doesn't make a future and a pickled payload for each call
+    upfront.
+
+    The activities are called by key, see :mod:`flowy.local.transport`, and
+    the callback is called with the task id and the future of the call.
+
+    With a :class:`flowy.local.spill.Spill`, the large results are spilled
+    to files and a call holds the spilled files in its input until it ends.
+
+    If the keys registered in the executor are known, the calls of other
+    keys are refused with a ValueError instead of failing in the pool.
+    """
+
+    def __init__(self, executor, max_in_flight, spill=None, keys=None):
+        if max_in_flight < 1:
+            raise ValueError('max_in_flight must be at least 1.')
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+        self.spill = spill
+        self.keys = frozenset(keys) if keys is not None else None
+        self.in_flight = 0
+        self.pending = deque()
+        self.lock = Lock()
+        self.closed = False
+
+    def submit(self, key, input_data, callback, task_id):
+        """Queue a call.
+
+        Raise RuntimeError if the submitter is shut down and ValueError if
+        the key is not registered.
+        """
+        if self.keys is not None and key not in self.keys:
+            raise ValueError(
+                'Activity %r is not registered in the pools, it was'
+                ' configured after they were made.' % (key.split('/')[0], ))
+        with self.lock:
+            if self.closed:
+                raise RuntimeError('Cannot submit after shutdown.')
+            if self.spill is not None:
+                self.spill.acquire(self.spill.paths(input_data))
+            self.pending.append((key, input_data, callback, task_id))
+        self.submit_pending()
+
+    def submit_pending(self):
+        # The lock is not held while submitting: the done callbacks can run
+        # in the executor thread that submit waits for
+        while True:
+            with self.lock:
+                if not self.pending or self.in_flight >= self.max_in_flight:
+                    return
+                key, input_data, callback, task_id = self.pending.popleft()
+                self.in_flight += 1
+            spill = self.spill
+            try:
+                f = self.executor.submit(
+                    call_activity, key, input_data,
+                    spill.options if spill is not None else None)
+            except RuntimeError:
+                with self.lock:  # The executor must be closed
+                    self.in_flight -= 1
+                    self.pending.clear()
+                return
+            f.add_done_callback(partial(self.done, callback, task_id,
+                                        input_data))
+
+    def done(self, callback, task_id, input_data, future):
+        with self.lock:
+            self.in_flight -= 1
+        self.submit_pending()
+        callback(task_id, future)
+        if self.spill is not None:
+            self.spill.release(self.spill.paths(input_data))
+
+    def shutdown(self, wait=True):
+        with self.lock:
+            self.closed = True
+            self.pending.clear()
+        self.executor.shutdown(wait=wait)
+
+
 class WorkflowRunner(object):
+    """Run the decisions of a workflow and the tasks they schedule.
+
+    A new decision is scheduled when the history changes, but never while
+    another one is running; the completions that arrive meanwhile are seen
+    together by the next decision. When many tasks finish close to each
+    other, the completions can also be coalesced while no decision runs:
+
+    * coalesce_window - wait this many seconds after a completion for other
+      tasks to finish before scheduling the decision
+    * coalesce_count - schedule the decision as soon as this many completions
+      are waiting
+
+    With both, the decision is scheduled when the first limit is reached. It
+    is also scheduled right away when no other task is running. Without
+    either, every completion schedules a decision.
+    """
     def __init__(self, workflow, workflow_executor, activity_executor,
                  input_data,
                  state=None,
-                 tracer=None):
+                 tracer=None,
+                 coalesce_window=None,
+                 coalesce_count=None):
         self.workflow = workflow
         self.workflow_executor = workflow_executor
         self.activity_executor = activity_executor
         self.input_data = input_data
-        self.state = state if state is not None else State()
+        self.state = (state if state is not None
+                      else VersionedExecutionHistory())
         self.tracer = tracer
+        self.coalesce_window = coalesce_window
+        self.coalesce_count = coalesce_count
         self.lock = RLock()
         self.will_restart = True
-        self.history_updated = False
+        self.history_updated = 0  # the completions not seen by a decision
+        self.running = 0  # the activities and child workflows in flight
+        self.timer = None
         self.restarted = False
+        self.spilled = []  # the spilled files held by the input and history
+        self.hold_spilled(input_data)
+
+    def hold_spilled(self, value):
+        """Hold the spilled files referred by a value until the runner ends.
+
+        Once the runner ended, the files are released right away.
+        """
+        spill = self.activity_executor.spill
+        if spill is None:
+            return
+        paths = spill.paths(value)
+        if not paths:
+            return
+        if self.spilled is None:
+            spill.release(paths)  # removed unless someone else holds them
+        else:
+            spill.acquire(paths)
+            self.spilled.extend(paths)
+
+    def release_spilled(self):
+        spill = self.activity_executor.spill
+        if spill is not None and self.spilled:
+            spill.release(self.spilled)
+        self.spilled = None
+
+    def coalesce_options(self):
+        """The options passed to the runners started by this one."""
+        return dict(coalesce_window=self.coalesce_window,
+                    coalesce_count=self.coalesce_count)
 
     def trace_activity(self, a):
         if self.tracer is None:
@@ -61,14 +206,23 @@ class WorkflowRunner(object):
     def reschedule_decision(self):
         if self.restarted:
             return
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
         # Any state that can mutate between the schedule time and the actual
-        # execution time must be copied or otherwise it can be in an
+        # execution time must be frozen or otherwise it can be in an
         # inconsistent state. This includes the tracer if any and the state.
+        # Both are append-only, so the decision gets a view of them, without
+        # copying the whole history each time.
         tracer = self.tracer
         if tracer is not None:
             tracer = tracer.copy()
+        if isinstance(self.state, VersionedExecutionHistory):
+            state = self.state.view()
+        else:
+            state = self.state.copy()
         try:
-            f = self.workflow_executor.submit(self.workflow, self.state.copy(),
+            f = self.workflow_executor.submit(self.workflow, state,
                                               self.input_data, tracer)
         except RuntimeError:
             return  # The executor must be closed
@@ -82,9 +236,12 @@ class WorkflowRunner(object):
                 result = result.result()
             except Exception as e:
                 self.fail(e)
+                self.release_spilled()
                 return
             handle_func = 'handle_%s' % result['type']
             getattr(self, handle_func)(result)
+            if result['type'] != 'schedule':
+                self.release_spilled()  # the runner ended
 
     def fail(self, reason):
         raise NotImplementedError
@@ -98,18 +255,22 @@ class WorkflowRunner(object):
             self.trace_workflow(w)
         self.trace_flush()
         for a in result.get('activities', []):
+            self.running += 1
             try:
-                args, kwargs = serialization.loads(a['input_data'])
-                f = self.activity_executor.submit(a['f'], *args, **kwargs)
-                f.add_done_callback(partial(
-                    self.complete_activity_and_reschedule_decision, a['id']))
+                self.activity_executor.submit(
+                    a['key'], a['input_data'],
+                    self.complete_activity_and_reschedule_decision, a['id'])
             except RuntimeError:
-                pass  # The executor must be closed
+                self.running -= 1  # The executor must be closed
+            except ValueError as e:  # The activity can't be called
+                self.fail_subwf_and_reschedule_decision(a['id'], e)
         for w in result.get('workflows', []):
             r = ChildWorkflowRunner(w['f'], self.workflow_executor,
                                     self.activity_executor, w['input_data'],
                                     parent=self,
-                                    wid=w['id'])
+                                    wid=w['id'],
+                                    **self.coalesce_options())
+            self.running += 1
             r.reschedule_decision()
         self.reschedule_if_history_updated()
 
@@ -126,7 +287,10 @@ class WorkflowRunner(object):
                 self.state.set_error(task_id, str(e))
                 self.trace_error(task_id, e)
             else:
-                self.state.set_result(task_id, serialization.dumps(r))
+                # The result is kept as it is, the proxies don't deserialize
+                # the local activity results
+                self.state.set_result(task_id, r)
+                self.hold_spilled(r)
                 self.trace_result(task_id, r)
             self.update_history_or_reschedule()
 
@@ -139,35 +303,70 @@ class WorkflowRunner(object):
     def complete_subwf_and_reschedule_decision(self, task_id, result):
         with self.lock:
             self.state.set_result(task_id, result)
-            self.trace_result(task_id, serialization.loads(result))
+            self.hold_spilled(result)
+            if self.tracer is not None:  # don't load the spilled data
+                self.trace_result(task_id, loads_handles(result))
             self.update_history_or_reschedule()
 
     def update_history_or_reschedule(self):
-        if self.will_restart:
-            self.history_updated = True
-        else:
-            self.history_updated = False
-            self.will_restart = True
-            self.reschedule_decision()
+        self.running -= 1
+        self.history_updated += 1
+        if not self.will_restart:
+            self.reschedule_if_coalesced()
 
     def reschedule_if_history_updated(self):
+        self.will_restart = False
         if self.history_updated:
-            self.history_updated = False
+            self.reschedule_if_coalesced()
+
+    def reschedule_if_coalesced(self):
+        window, count = self.coalesce_window, self.coalesce_count
+        if (not self.running
+                or (window is None and count is None)
+                or (count is not None and self.history_updated >= count)):
+            self.history_updated = 0
+            self.will_restart = True
+            self.reschedule_decision()
+        elif window is not None and self.timer is None:
+            self.timer = Timer(window, self.reschedule_after_window)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def reschedule_after_window(self):
+        with self.lock:
+            if current_thread() is not self.timer:
+                return  # A decision was scheduled meanwhile
+            self.timer = None
+            if self.will_restart or not self.history_updated:
+                return
+            self.history_updated = 0
+            self.will_restart = True
             self.reschedule_decision()
-        else:
-            self.will_restart = False
 
 
 class RootWorkflowRunner(WorkflowRunner):
+    """Run a workflow execution and report its final value.
+
+    Either call :meth:`run` to wait for the final value and shut down the
+    executors, or pass a future and start the execution with
+    :meth:`reschedule_decision`; the future gets the final value and the
+    executors are left running.
+    """
     def __init__(self, workflow, workflow_executor, activity_executor,
                  input_data,
                  state=None,
-                 tracer=None):
-        super(RootWorkflowRunner, self).__init__(workflow, workflow_executor,
-                                                 activity_executor, input_data,
-                                                 state=state,
-                                                 tracer=tracer)
+                 tracer=None,
+                 coalesce_window=None,
+                 coalesce_count=None,
+                 future=None):
+        super(RootWorkflowRunner, self).__init__(
+            workflow, workflow_executor, activity_executor, input_data,
+            state=state,
+            tracer=tracer,
+            coalesce_window=coalesce_window,
+            coalesce_count=coalesce_count)
         self.stop = Event()
+        self.future = future
 
     def run(self, wait=False):
         self.reschedule_decision()
@@ -182,14 +381,26 @@ class RootWorkflowRunner(WorkflowRunner):
         raise RuntimeError('No final value found.')
 
     def stop_running(self, final_value):
-        self.final_value = final_value
-        self.stop.set()
+        with self.lock:  # the restarted runners call this too
+            if self.stop.is_set():
+                return
+            self.final_value = final_value
+            self.stop.set()
+            if self.future is None:
+                return
+            if isinstance(final_value, Exception):
+                self.future.set_exception(final_value)
+            else:
+                self.future.set_result(final_value)
 
     def handle_fail(self, result):
         self.stop_running(TaskError(result['reason']))
 
     def handle_finish(self, result):
-        self.stop_running(serialization.loads(result['result']))
+        # The spilled files are removed once the execution ends
+        spill = self.activity_executor.spill
+        loads = serialization.loads if spill is None else spill.loads
+        self.stop_running(loads(result['result']))
 
     def fail(self, reason):
         self.stop_running(TaskError(str(reason)))
@@ -198,18 +409,23 @@ class RootWorkflowRunner(WorkflowRunner):
         super(RootWorkflowRunner, self).handle_restart(result)
         RestartedRootRunner(self.workflow, self.workflow_executor,
                             self.activity_executor, result['input_data'], self,
-                            tracer=self.tracer).reschedule_decision()
+                            tracer=self.tracer,
+                            **self.coalesce_options()).reschedule_decision()
 
 
 class RestartedRootRunner(WorkflowRunner):
     def __init__(self, workflow, workflow_executor, activity_executor,
                  input_data, root,
                  state=None,
-                 tracer=None):
+                 tracer=None,
+                 coalesce_window=None,
+                 coalesce_count=None):
         super(RestartedRootRunner, self).__init__(
             workflow, workflow_executor, activity_executor, input_data,
             state=state,
-            tracer=tracer)
+            tracer=tracer,
+            coalesce_window=coalesce_window,
+            coalesce_count=coalesce_count)
         self.root = root
 
     def handle_fail(self, result):
@@ -226,7 +442,8 @@ class RestartedRootRunner(WorkflowRunner):
         r = RestartedRootRunner(self.workflow, self.workflow_executor,
                                 self.activity_executor, result['input_data'],
                                 self.root,
-                                tracer=self.tracer)
+                                tracer=self.tracer,
+                                **self.coalesce_options())
         r.reschedule_decision()
 
 
@@ -234,11 +451,15 @@ class ChildWorkflowRunner(WorkflowRunner):
     def __init__(self, workflow, workflow_executor, activity_executor,
                  input_data, parent, wid,
                  state=None,
-                 tracer=None):
+                 tracer=None,
+                 coalesce_window=None,
+                 coalesce_count=None):
         super(ChildWorkflowRunner, self).__init__(
             workflow, workflow_executor, activity_executor, input_data,
             state=state,
-            tracer=tracer)
+            tracer=tracer,
+            coalesce_window=coalesce_window,
+            coalesce_count=coalesce_count)
         self.parent = parent
         self.wid = wid
 
@@ -258,61 +479,7 @@ class ChildWorkflowRunner(WorkflowRunner):
         r = ChildWorkflowRunner(self.workflow, self.workflow_executor,
                                 self.activity_executor, result['input_data'],
                                 self.parent, self.wid,
-                                tracer=self.tracer)
+                                tracer=self.tracer,
+                                **self.coalesce_options())
         r.reschedule_decision()
 
-
-class State(object):
-    def __init__(self):
-        self.running = set()
-        self.results = {}
-        self.errors = {}
-        self.finish_order = []
-
-    def copy(self):
-        s = State()
-        s.__dict__ = copy.deepcopy(self.__dict__)
-        return s
-
-    def set_running(self, call_key):
-        self.running.add(call_key)
-
-    def set_result(self, call_key, result):
-        self.running.remove(call_key)
-        self.results[call_key] = result
-        self.finish_order.append(call_key)
-
-    def set_error(self, call_key, reason):
-        self.running.remove(call_key)
-        self.errors[call_key] = reason
-        self.finish_order.append(call_key)
-
-    def is_running(self, call_key):
-        return call_key in self.running
-
-    def order(self, call_key):
-        return self.finish_order.index(call_key)
-
-    def has_result(self, call_key):
-        return call_key in self.results
-
-    def result(self, call_key):
-        return self.results[call_key]
-
-    def is_error(self, call_key):
-        return call_key in self.errors
-
-    def error(self, call_key):
-        return self.errors[call_key]
-
-    def is_timeout(self, call_key):
-        return False
-
-    def __repr__(self):
-        if len(self.finish_order) > 6:
-            order = (' '.join(map(str, self.finish_order[:3])) + ' ... ' +
-                     ' '.join(map(str, self.finish_order[-3:])))
-        else:
-            order = ' '.join(map(str, self.finish_order))
-        return "<RUNNING: %d, RESULTS: %d, ERRORS: %d, ORDER: %s>" % (
-            len(self.running), len(self.results), len(self.errors), order)
@@ -0,0 +1,212 @@
+"""Move the large local activity results between processes as files.
+
+With a spill threshold, an activity result above it is written by the pool
+process to a file in the spill directory, on /dev/shm when available, and
+only a :class:`SpilledPayload` handle is sent back. The handle is what the
+workflow sees. When it's passed to another activity, it's serialized as a
+small reference and the activity gets the data back, read with mmap. Call
+:meth:`SpilledPayload.load` to get the data in the workflow.
+
+The bytes and bytearray results are spilled, and so are the numpy arrays,
+which are loaded as read-only arrays backed by the mapped file. The handles
+passed to, or returned by, a child workflow are handles there too, only the
+final result of the execution is loaded.
+
+The references are decoded only by the local backend: as handles, see
+:func:`loads_handles`, and read only by the activities, from the spill
+directory of their engine, see :func:`loads_spilled`.
+
+The files are reference counted by a :class:`Spill`. Each runner holds the
+handles in its history and input, each queued activity holds the handles in
+its input, and a file is removed when none of them holds it anymore. The
+whole spill directory is removed when the engine shuts down.
+"""
+import json
+import mmap
+import os
+import re
+import shutil
+import sys
+import tempfile
+from threading import Lock
+
+from flowy.serialization import _loads
+from flowy.serialization import _obj_hook
+from flowy.serialization import uni
+
+
+__all__ = ['Spill', 'SpilledPayload', 'loads_handles', 'loads_spilled',
+           'spill_result']
+
+
+_TAG = ' m'
+_KINDS = ('bytes', 'bytearray', 'ndarray')
+# The spilled file paths, as they are found in the serialized data, still
+# JSON escaped
+_MARKER = '{" m": '
+_path_re = re.compile(r'\{" m": \["((?:[^"\\]|\\.)*)"')
+
+
+class SpilledPayload(object):
+    """A handle for an activity result spilled to a file."""
+
+    def __init__(self, path, size, kind='bytes', meta=None):
+        self.path = path
+        self.size = size
+        self.kind = kind
+        self.meta = meta  # the dtype and the shape of an array
+
+    def load(self):
+        """Read the data back."""
+        if not self.size:
+            return self._empty()
+        with open(self.path, 'rb') as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.kind == 'ndarray':
+            import numpy
+            dtype, shape = self.meta
+            array = numpy.frombuffer(m, dtype=dtype)  # keeps m open
+            return array.reshape(shape)
+        try:
+            data = m[:]
+        finally:
+            m.close()
+        return bytearray(data) if self.kind == 'bytearray' else data
+
+    def _empty(self):
+        if self.kind == 'ndarray':
+            import numpy
+            dtype, shape = self.meta
+            return numpy.empty(shape, dtype=dtype)
+        return bytearray() if self.kind == 'bytearray' else b''
+
+    def __json__(self):
+        return {_TAG: [self.path, self.size, self.kind, self.meta]}
+
+    def __repr__(self):
+        return '<%s %s %s bytes>' % (self.__class__.__name__, self.kind,
+                                     self.size)
+
+
+def _handle_hook(obj):
+    value = obj.get(_TAG) if len(obj) == 1 else None
+    if (not isinstance(value, list) or len(value) != 4
+            or not isinstance(value[0], (str, uni)) or value[2] not in _KINDS):
+        return _obj_hook(obj)
+    path, size, kind, meta = value
+    if meta is not None:
+        meta = (meta[0], tuple(meta[1]))
+    return SpilledPayload(path, size, kind, meta)
+
+
+_handle_decoder = json.JSONDecoder(object_hook=_handle_hook)
+
+
+def loads_handles(value):
+    """Decode a value with the spilled handles in it, without reading them."""
+    return _loads(value, _handle_decoder)
+
+
+def loads_spilled(value, directory):
+    """Decode a value and read the data of the spilled handles in it.
+
+    Only the files in directory are read, the handles of other files raise
+    ValueError.
+    """
+    directory = os.path.join(os.path.realpath(directory), '')
+
+    def hook(obj):
+        handle = _handle_hook(obj)
+        if not isinstance(handle, SpilledPayload):
+            return handle
+        if not os.path.realpath(handle.path).startswith(directory):
+            raise ValueError('Not a spilled file: %r' % (handle.path, ))
+        return handle.load()
+
+    return _loads(value, json.JSONDecoder(object_hook=hook))
+
+
+def spill_result(result, directory, threshold):
+    """Write the result to a file if it's large enough and return a handle.
+
+    The results that can't be spilled, or are too small, are returned as
+    they are.
+    """
+    kind = meta = None
+    if isinstance(result, (bytes, bytearray)):
+        kind = 'bytearray' if isinstance(result, bytearray) else 'bytes'
+        data = result
+    elif _is_array(result):
+        import numpy
+        if result.dtype.hasobject:
+            return result
+        kind = 'ndarray'
+        meta = (result.dtype.str, result.shape)
+        data = memoryview(numpy.ascontiguousarray(result)).cast('B')
+    if kind is None or len(data) < threshold:
+        return result
+    fd, path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    return SpilledPayload(path, len(data), kind, meta)
+
+
+def _is_array(value):
+    numpy = sys.modules.get('numpy')  # only if the activity uses it
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+class Spill(object):
+    """A spill directory and the reference counts of its files."""
+
+    def __init__(self, threshold, directory=None):
+        if directory is None and os.path.isdir('/dev/shm'):
+            directory = '/dev/shm'
+        self.threshold = threshold
+        self.directory = tempfile.mkdtemp(prefix='flowy-spill-',
+                                          dir=directory)
+        self.refs = {}  # path -> reference count
+        self.lock = Lock()
+
+    @property
+    def options(self):
+        """The options sent with each activity call."""
+        return self.directory, self.threshold
+
+    def loads(self, value):
+        """Decode a value and read its spilled files, see
+        :func:`loads_spilled`."""
+        return loads_spilled(value, self.directory)
+
+    def paths(self, value):
+        """The spilled files referred by a handle or by a serialized value."""
+        if isinstance(value, SpilledPayload):
+            return [value.path]
+        if isinstance(value, (str, uni)) and _MARKER in value:
+            return [json.loads('"%s"' % path)
+                    for path in _path_re.findall(value)]
+        return []
+
+    def acquire(self, paths):
+        with self.lock:
+            for path in paths:
+                self.refs[path] = self.refs.get(path, 0) + 1
+
+    def release(self, paths):
+        with self.lock:
+            for path in paths:
+                count = self.refs.get(path, 0) - 1
+                if count > 0:
+                    self.refs[path] = count
+                    continue
+                self.refs.pop(path, None)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass  # already removed
+
+    def close(self):
+        """Remove the spill directory with all the files left."""
+        with self.lock:
+            self.refs.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
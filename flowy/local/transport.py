@@ -0,0 +1,73 @@
+"""Call the local activities by key instead of sending the callables.
+
+The activity callables of a workflow, and of all its child workflows, are
+collected when the pools are made and registered in every pool process by
+the executor initializer. A call then sends only the activity key and the
+serialized input, which is deserialized in the pool process. The result
+comes back as a Python object and is kept as such by the runner.
+"""
+from flowy.local.proxy import ActivityProxy
+from flowy.local.proxy import WorkflowProxy
+from flowy.local.spill import loads_spilled
+from flowy.local.spill import spill_result
+from flowy.serialization import loads
+
+
+__all__ = ['call_activity', 'collect_activities', 'make_executor',
+           'register_activities']
+
+
+_activities = {}  # key -> callable, in every process running activities
+
+
+def register_activities(activities):
+    """Register a dict of keys and callables in this process."""
+    _activities.update(activities)
+
+
+def call_activity(key, input_data, spill=None):
+    """Call a registered activity.
+
+    With the spill options, a (directory, threshold) tuple, the large
+    results are spilled to files and the spilled files in the input are
+    read, from that directory only, see :mod:`flowy.local.spill`.
+    """
+    if spill is None:
+        args, kwargs = loads(input_data)
+        return _activities[key](*args, **kwargs)
+    args, kwargs = loads_spilled(input_data, spill[0])
+    return spill_result(_activities[key](*args, **kwargs), *spill)
+
+
+def collect_activities(workflow):
+    """Collect the activities of a workflow and of its child workflows."""
+    activities = {}
+    seen = set()
+    workflows = [workflow]
+    while workflows:
+        w = workflows.pop()
+        if id(w) in seen:
+            continue
+        seen.add(id(w))
+        for factory in getattr(w, 'proxy_factory_registry', {}).values():
+            if isinstance(factory, ActivityProxy):
+                activities[factory.key] = factory.task
+            elif isinstance(factory, WorkflowProxy):
+                workflows.append(factory.f)
+    return activities
+
+
+def make_executor(executor, max_workers, activities):
+    """Make an executor with the activities registered in its workers.
+
+    The activities are also registered in this process, for the thread pools
+    and for the process pools whose workers are forked.
+    """
+    register_activities(activities)
+    try:
+        return executor(max_workers=max_workers,
+                        initializer=register_activities,
+                        initargs=(activities,))
+    except TypeError:  # no initializer before Python 3.7
+        return executor(max_workers=max_workers)
+
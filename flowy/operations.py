@@ -2,12 +2,13 @@ import heapq
 import itertools
 
 from flowy.result import is_result_proxy
+from flowy.result import placeholder
 from flowy.result import result
 from flowy.utils import i_or_args
 from flowy.utils import sentinel
 
 
-__all__ = ['first', 'finish_order', 'parallel_reduce']
+__all__ = ['first', 'finish_order', 'parallel_map', 'parallel_reduce']
 
 
 def _order_key(i):
@@ -45,7 +46,49 @@ def finish_order(result, *results):
         yield r
 
 
-def parallel_reduce(f, iterable, initializer=sentinel):
+def parallel_map(proxy, iterable, window=None, ordered=True):
+    """Like map() but with at most window tasks running at the same time.
+
+    The proxy is called with the values from the iterable, in order, for as
+    long as there are less than window calls in flight - scheduled or running.
+    The calls that finished, successfully or not, no longer count, so a new
+    task is started as soon as any other finishes. The values that didn't get
+    a chance to be scheduled yet get a placeholder in the results.
+
+    Because the proxy is always called in the input order, the same values are
+    scheduled every time the workflow is replayed, regardless of the order in
+    which the tasks finish. The values that are not scheduled still use up
+    their call numbers, see :meth:`flowy.proxy.Proxy.skip_call`, so any later
+    call of the same proxy gets the same call number on every replay. A
+    callable that is not a proxy, and has no skip_call method, must not be
+    called again after parallel_map.
+
+    The results are returned in the input order or, if ordered is False, in
+    the finish order, with the unfinished ones at the end.
+    """
+    if window is not None:
+        window = int(window)
+        if window < 1:
+            raise ValueError('parallel_map() window must be at least 1')
+    results = []
+    in_flight = 0
+    skip_call = getattr(proxy, 'skip_call', None)
+    for x in iterable:
+        if window is not None and in_flight >= window:
+            if skip_call is not None:
+                skip_call()
+            results.append(placeholder())
+            continue
+        r = proxy(x)
+        if is_result_proxy(r) and r.__factory__.is_placeholder():
+            in_flight += 1
+        results.append(r)
+    if not ordered:
+        results = list(finish_order(results))
+    return results
+
+
+def parallel_reduce(f, iterable, initializer=sentinel, fan_in=None):
     """Like reduce() but optimized to maximize parallel execution.
 
     The reduce function must be associative and commutative.
@@ -72,7 +115,18 @@ def parallel_reduce(f, iterable, initializer=sentinel):
     reduction as soon as any two results are available. The number of reduce
     operations is always constant and equal to len(iterable) - 1 regardless of
     how the reduction graph looks like.
+
+    If fan_in is set, f is called with a single argument, a list of up to
+    fan_in values, and the number of reduce operations drops to about
+    (len(iterable) - 1) / (fan_in - 1). The values are grouped in their finish
+    order, so a reduction starts when fan_in results are available.
     """
+    if fan_in is None:
+        k, combine = 2, lambda group: f(*group)
+    else:
+        k, combine = int(fan_in), f
+        if k < 2:
+            raise ValueError('parallel_reduce() fan_in must be at least 2')
     if initializer is not sentinel:
         iterable = itertools.chain([initializer], iterable)
     results, non_results = [], []
@@ -81,40 +135,38 @@ def parallel_reduce(f, iterable, initializer=sentinel):
             results.append(x)
         else:
             non_results.append(x)
-    i = iter(non_results)
-    reminder = sentinel
-    for x in i:
-        try:
-            y = next(i)
-            results.append(f(x, y))
-        except StopIteration:
-            reminder = x
-            if not results:  # len(iterable) == 1
-                # Wrap the value in a result for uniform interface
-                return result(x, -1)
-    if not results:  # len(iterable) == 0
-        raise ValueError(
-            'parallel_reduce() of empty sequence with no initial value')
-    if is_result_proxy(results[0]):
-        results = [(r.__factory__, r) for r in results]
-        heapq.heapify(results)
-        return _parallel_reduce_recurse(f, results, reminder)
-    else:
-        # Looks like we don't use a task for reduction, fallback on reduce
-        return reduce(f, results)
-
-
-def _parallel_reduce_recurse(f, results, reminder=sentinel):
-    if reminder is not sentinel:
-        _, first = heapq.heappop(results)
-        new_result = f(reminder, first)
-        heapq.heappush(results, (new_result.__factory__, new_result))
-        return _parallel_reduce_recurse(f, results)
-    _, x = heapq.heappop(results)
-    try:
-        _, y = heapq.heappop(results)
-    except IndexError:
-        return x
-    new_result = f(x, y)
-    heapq.heappush(results, (new_result.__factory__, new_result))
-    return _parallel_reduce_recurse(f, results)
+    reminder = len(non_results) % k
+    for i in range(0, len(non_results) - reminder, k):
+        results.append(combine(non_results[i:i + k]))
+    reminder = non_results[len(non_results) - reminder:]
+    if not results:
+        if not reminder:  # len(iterable) == 0
+            raise ValueError(
+                'parallel_reduce() of empty sequence with no initial value')
+        if len(reminder) == 1:  # len(iterable) == 1
+            # Wrap the value in a result for uniform interface
+            return result(reminder[0], -1)
+        results.append(combine(reminder))
+        reminder = []
+    if not is_result_proxy(results[0]):
+        # Looks like we don't use a task for reduction, reduce locally
+        values = reminder + results
+        while len(values) > 1:
+            groups = [values[i:i + k] for i in range(0, len(values), k)]
+            values = [combine(g) if len(g) > 1 else g[0] for g in groups]
+        return values[0]
+    # The counter breaks the ties without comparing the result proxies
+    counter = itertools.count()
+    heap = [(r.__factory__, next(counter), r) for r in results]
+    heapq.heapify(heap)
+    group = reminder
+    while group or len(heap) > 1:
+        while len(group) < k and heap:
+            group.append(heapq.heappop(heap)[2])
+        new_result = combine(group)
+        if not is_result_proxy(new_result):
+            new_result = result(new_result, -1)
+        heapq.heappush(heap,
+                       (new_result.__factory__, next(counter), new_result))
+        group = []
+    return heap[0][2]
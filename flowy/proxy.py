@@ -1,5 +1,8 @@
 import json
 
+from flowy.history import RESULT
+from flowy.history import RUNNING
+from flowy.history import TIMEDOUT
 from flowy.operations import first
 from flowy.result import copy_result_proxy
 from flowy.result import error
@@ -29,7 +32,8 @@ class Proxy(object):
                  serialize_input=None, deserialize_result=None):
         """Init the proxy object.
 
-        The task execution history contains the execution history and is
+        The task execution history contains the execution history of this
+        proxy identity, see :class:`flowy.history.TaskExecutionHistory`, and is
         used to decide what new tasks should be scheduled.
         The scheduling of new tasks or execution or the execution failure is
         delegated to the task decision object.
@@ -69,30 +73,30 @@ class Proxy(object):
               are unresolved dependencies.
             * Finally, if all the arguments look OK, schedule it for execution.
         """
-        task_exec_history = self.task_exec_history
         call_number = self.call_number
         self.call_number += 1
+        # A tuple of (status, value, order) or None for each retry
+        states = self.task_exec_history.call_states(call_number)
         r = placeholder()
         for retry_number, delay in enumerate(self.retry):
-            if task_exec_history.is_timeout(call_number, retry_number):
-                continue
-            if task_exec_history.is_running(call_number, retry_number):
-                break  # result = Placehloder
-            if task_exec_history.has_result(call_number, retry_number):
-                value = task_exec_history.result(call_number, retry_number)
-                order = task_exec_history.order(call_number, retry_number)
-                try:
-                    value = self.deserialize_result(value)
-                except Exception as e:
-                    logger.exception('Error while deserializing the activity result:')
-                    self.task_decision.fail(e)
-                    break  # result = Placeholder
-                r = result(value, order)
-                break
-            if task_exec_history.is_error(call_number, retry_number):
-                err = task_exec_history.error(call_number, retry_number)
-                order = task_exec_history.order(call_number, retry_number)
-                r = error(err, order)
+            state = states[retry_number] if retry_number < len(states) else None
+            if state is not None:
+                status, value, order = state
+                if status == TIMEDOUT:
+                    continue
+                if status == RUNNING:
+                    break  # result = Placehloder
+                if status == RESULT:
+                    try:
+                        value = self.deserialize_result(value)
+                    except Exception as e:
+                        logger.exception(
+                            'Error while deserializing the activity result:')
+                        self.task_decision.fail(e)
+                        break  # result = Placeholder
+                    r = result(value, order)
+                    break
+                r = error(value, order)  # status == ERROR
                 break
             traversed_args, (err, placeholders) = traverse_data([args, kwargs])
             if err:
@@ -110,11 +114,18 @@ class Proxy(object):
             self.task_decision.schedule(call_number, retry_number, delay, input_data)
             break  # result = Placeholder
         else:
-            # No retries left, it must be a timeout
-            order = task_exec_history.order(call_number, retry_number)
+            # No retries left, it must be a timeout; order is the last one's
             r = timeout(order)
         return r
 
+    def skip_call(self):
+        """Use up the next call number without making the call.
+
+        The call can be made in a later replay, with the same call number,
+        while the calls after it keep their call numbers in every replay.
+        """
+        self.call_number += 1
+
     @staticmethod
     def serialize_input(*args, **kwargs):
         return dumps([args, kwargs])
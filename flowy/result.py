@@ -1,5 +1,7 @@
 from lazy_object_proxy.slots import Proxy
 import collections
+import contextlib
+import threading
 
 from flowy.utils import logger
 from flowy.utils import sentinel
@@ -8,7 +10,7 @@ from flowy.utils import i_or_args
 
 __all__ = ['result', 'error', 'timeout', 'placeholder', 'copy_result_proxy',
            'wait', 'is_result_proxy', 'SuspendTask', 'TaskError',
-           'TaskTimedout', 'restart_type', 'restart']
+           'TaskTimedout', 'restart_type', 'restart', 'warn_ignored_errors']
 
 
 def result(value, order):
@@ -18,12 +20,13 @@ def result(value, order):
 
 def error(reason, order):
     """A result proxy for a task that failed."""
-    return ResultProxy(TaskResult(TaskError(reason), order))
+    return ResultProxy(_track(TaskResult(TaskError(reason), order)))
 
 
 def timeout(order):
     """A result proxy for a task that timed out."""
-    return ResultProxy(TaskResult(TaskTimedout('A task has timedout'), order))
+    task_result = TaskResult(TaskTimedout('A task has timedout'), order)
+    return ResultProxy(_track(task_result))
 
 
 def placeholder():
@@ -34,7 +37,10 @@ def placeholder():
 def copy_result_proxy(rp):
     assert is_result_proxy(rp)
     factory = rp.__factory__
-    return ResultProxy(TaskResult(factory.value, factory.order))
+    task_result = TaskResult(factory.value, factory.order)
+    if task_result.is_error():
+        _track(task_result)
+    return ResultProxy(task_result)
 
 
 def wait(result):
@@ -66,6 +72,9 @@ def is_result_proxy(obj):
 
 
 class TaskResult(object):
+    # node_id is set only when tracing
+    __slots__ = ('value', 'order', 'called', 'node_id')
+
     def __init__(self, value=sentinel, order=None):
         self.value = value
         self.order = order
@@ -94,9 +103,35 @@ class TaskResult(object):
     def is_placeholder(self):
         return self.value is sentinel
 
-    def __del__(self):
-        if not self.called and isinstance(self.value, Exception):
-            logger.warning("Result with error was ignored: %s", self.value)
+
+_tracked = threading.local()
+
+
+def _track(task_result):
+    """Track an error result until the end of the current decision."""
+    errors = getattr(_tracked, 'errors', None)
+    if errors is not None:
+        errors.append(task_result)
+    return task_result
+
+
+@contextlib.contextmanager
+def warn_ignored_errors():
+    """Log a warning, on exit, for each error result that was never used.
+
+    The error results created in this thread, while in this context, are
+    checked once on exit instead of using a finalizer on every result.
+    """
+    previous = getattr(_tracked, 'errors', None)
+    errors = _tracked.errors = []
+    try:
+        yield
+    finally:
+        _tracked.errors = previous
+        for task_result in errors:
+            if not task_result.called:
+                logger.warning("Result with error was ignored: %s",
+                               task_result.value)
 
 
 class SuspendTask(BaseException):
@@ -12,17 +12,31 @@ if sys.version_info < (3,):
 else:
     uni = str
 
-import collections
+import itertools
 import json
 import uuid
+import zlib
 from base64 import b64decode
 from base64 import b64encode
+try:
+    from collections.abc import Iterable
+    from collections.abc import Mapping
+    from collections.abc import Sized
+except ImportError:  # python 2
+    from collections import Iterable
+    from collections import Mapping
+    from collections import Sized
+try:
+    import lzma
+except ImportError:  # python 2
+    lzma = None
 
 from flowy.result import is_result_proxy, TaskError, SuspendTask, wait
 from flowy.operations import first
 
 
-__all__ = ['traverse_data', 'dumps', 'loads']
+__all__ = ['traverse_data', 'dumps', 'loads', 'register_codec',
+           'register_blob_store', 'Serializer']
 
 
 def check_err_and_placeholders(result, value):
@@ -59,52 +73,197 @@ def collect_err_and_results(result, value):
     return err, results
 
 
-def traverse_data(value, f=check_err_and_placeholders, initial=(None, False), seen=frozenset(), make_list=True):
-    if is_result_proxy(value):
-        try:
-            wait(value)
-        except TaskError:
-            return value, f(initial, value)
-        except SuspendTask:
-            return value, f(initial, value)
+# The reducers that ignore any value that is not a result proxy
+_PROXY_REDUCERS = (check_err_and_placeholders, collect_err_and_results)
+# Values of these exact types are never traversed
+_SCALARS = frozenset([int, float, bool, type(None), bytes, uni])
+if sys.version_info < (3,):
+    _SCALARS = _SCALARS | frozenset([long])
+
+_SEQUENCE, _MAPPING = 0, 1
+_PENDING = object()
+
 
-        return value.__wrapped__, f(initial, value)
+def traverse_data(value, f=check_err_and_placeholders, initial=(None, False),
+                  seen=frozenset(), make_list=True):
+    """Traverse a data structure evaluating all the result proxies in it.
 
-    if isinstance(value, (bytes, uni)):
-        return value, f(initial, value)
+    Return a tuple with the traversed data and the reduction with f, starting
+    with initial, of all the values that are not containers. In the traversed
+    data, finished results are replaced with their values, mappings become
+    dicts and other sized iterables become lists or, if they are mapping keys,
+    tuples. Containers that don't need any changes are returned as they are,
+    without copying them.
 
+    The data is traversed iteratively, so deep structures don't hit the
+    recursion limit. ValueError is raised for recursive structures and for
+    unsized iterables.
+    """
     res = initial
+    reduce_all = f not in _PROXY_REDUCERS
+    path = set(seen)  # the ids of the containers being traversed
+    # Each frame is a list of: kind, original container, children iterator,
+    # traversed items (None until something changes), number of processed
+    # children, current child, make_list, original key, traversed key
+    stack = []
+    x = value
+    while 1:
+        t = type(x)
+        if t in _SCALARS:
+            if reduce_all:
+                res = f(res, x)
+            out = x
+        elif is_result_proxy(x):
+            try:
+                wait(x)
+            except (TaskError, SuspendTask):
+                out = x
+            else:
+                out = x.__wrapped__
+            res = f(res, x)
+        elif isinstance(x, (bytes, uni)):
+            if reduce_all:
+                res = f(res, x)
+            out = x
+        elif isinstance(x, Iterable):
+            if id(x) in path:
+                raise ValueError('Recursive structure.')
+            if stack:
+                frame = stack[-1]
+                is_key = frame[0] == _MAPPING and frame[4] % 2 == 0
+                m_l = frame[6] and not is_key
+            else:
+                m_l = make_list
+            if isinstance(x, Mapping):
+                items = None if t is dict else {}
+                frame = [_MAPPING, x, itertools.chain.from_iterable(x.items()),
+                         items, 0, None, m_l, None, None]
+            elif isinstance(x, Sized):
+                items = None if t is (list if m_l else tuple) else []
+                frame = [_SEQUENCE, x, iter(x), items, 0, None, m_l, None, None]
+            else:
+                raise ValueError('Unsized iterables not allowed.')
+            path.add(id(x))
+            stack.append(frame)
+            out = _PENDING
+        else:
+            if reduce_all:
+                res = f(res, x)
+            out = x
+        # Pass the traversed value to its container and find the next one
+        while 1:
+            if out is not _PENDING:
+                if not stack:
+                    return out, res
+                frame = stack[-1]
+                _accept(frame, out)
+            else:
+                frame = stack[-1]
+            x = next(frame[2], _PENDING)
+            if x is _PENDING:
+                stack.pop()
+                path.discard(id(frame[1]))
+                out = _finish(frame)
+                continue
+            frame[5] = x
+            break
 
-    if isinstance(value, collections.Iterable):
-        if id(value) in seen:
-            raise ValueError('Recursive structure.')
-        seen = seen | frozenset([id(value)])
-
-    if isinstance(value, collections.Mapping):
-        d = {}
-        for k, v in value.items():
-            k_, res = traverse_data(k, f, res, seen, make_list=False)
-            v_, res = traverse_data(v, f, res, seen, make_list=make_list)
-            d[k_] = v_
-        return d, res
-    if (
-        isinstance(value, collections.Iterable)
-        and isinstance(value, collections.Sized)
-    ):
-        l = []
-        for x in value:
-            x_, res = traverse_data(x, f, res, seen, make_list=make_list)
-            l.append(x_)
-        if make_list:
-            return l, res
-        return tuple(l), res
-    if isinstance(value, collections.Iterable):
-        raise ValueError('Unsized iterables not allowed.')
-    return value, f(initial, value)
 
+def _accept(frame, out):
+    kind, orig, _, items, n, child = frame[:6]
+    frame[4] = n + 1
+    if kind == _SEQUENCE:
+        if items is not None:
+            items.append(out)
+        elif out is not child:
+            items = frame[3] = list(orig[:n])
+            items.append(out)
+    elif n % 2 == 0:  # a mapping key
+        frame[7], frame[8] = child, out
+    else:  # a mapping value
+        key, t_key = frame[7], frame[8]
+        if items is not None:
+            items[t_key] = out
+        elif t_key is not key or out is not child:
+            items = frame[3] = dict(itertools.islice(orig.items(), n // 2))
+            items[t_key] = out
 
-def dumps(value):
-    return json.dumps(_tag(value))
+
+def _finish(frame):
+    kind, orig, _, items = frame[:4]
+    if items is None:
+        return orig
+    if kind == _SEQUENCE and not frame[6]:
+        return tuple(items)
+    return items
+
+
+def _obj_hook(obj):
+    if len(obj) != 1:
+        return obj
+    key, value = next(iter(obj.items()))
+    if key == ' u':
+        return uuid.UUID(value)
+    elif key == ' b':
+        return b64decode(value)
+    return obj
+
+
+class TaggedJSONEncoder(json.JSONEncoder):
+    """Encode UUIDs, bytes and objects with a __json__ method as tagged dicts.
+
+    The tags are handled in default(), which is called only for the values
+    the JSON encoder doesn't know about, so the data is not copied. The JSON
+    types subclasses, and str on Python 2, are never passed to default(); the
+    data having any of them is tagged in a copy first, see :func:`dumps`.
+    """
+
+    def default(self, value):
+        if isinstance(value, uuid.UUID):
+            return {' u': value.hex}
+        elif isinstance(value, bytes):
+            return {' b': b64encode(value).decode('ascii')}
+        elif callable(getattr(value, '__json__', None)):
+            return _tag_subclasses(value.__json__())
+        return super(TaggedJSONEncoder, self).default(value)
+
+
+# The JSON encoder handles the instances of these types, and of their
+# subclasses, without calling default(). On Python 2, str is bytes and must be
+# tagged, so it's not plain.
+_JSON_TYPES = (dict, list, tuple, uni, int, float)
+_PLAIN = frozenset([dict, list, tuple, uni, int, float, bool, type(None)])
+if sys.version_info < (3,):
+    _JSON_TYPES = _JSON_TYPES + (bytes, long)
+    _PLAIN = _PLAIN | frozenset([long])
+_CONTAINERS = frozenset([dict, list, tuple])
+
+
+def _has_subclasses(value):
+    """Check if a value has instances of JSON types subclasses, like dict
+    subclasses with a __json__ method, that default() would never see.
+
+    The data is walked a level at a time and the types of each level are
+    collected with map(), which is much faster than tagging a copy of it.
+    """
+    level = [value]
+    # The levels never end for recursive structures, the encoder raises
+    for _ in range(sys.getrecursionlimit()):
+        types = set(map(type, level))
+        for t in types - _PLAIN:
+            if issubclass(t, _JSON_TYPES):
+                return True
+        if types.isdisjoint(_CONTAINERS):
+            break
+        children = []
+        for x in level:
+            t = type(x)
+            if t is dict:
+                children.extend(x.values())
+            elif t is list or t is tuple:
+                children.extend(x)
+        level = children
+    return False
 
 
 def _tag(value):
@@ -121,16 +280,140 @@ def _tag(value):
     return value
 
 
+def _tag_subclasses(value):
+    if _has_subclasses(value):
+        return _tag(value)  # the slower path, copying the data
+    return value
+
+
+_encoder = TaggedJSONEncoder()
+_decoder = json.JSONDecoder(object_hook=_obj_hook)
+
+
+def dumps(value):
+    return _encoder.encode(_tag_subclasses(value))
+
+
 def loads(value):
-    return json.loads(value, object_hook=_obj_hook)
+    """Decode a value encoded by dumps or by any :class:`Serializer`."""
+    return _loads(value, _decoder)
 
 
-def _obj_hook(obj):
-    if len(obj) != 1:
-        return obj
-    key, value = next(iter(obj.items()))
-    if key == ' u':
-        return uuid.UUID(value)
-    elif key == ' b':
-        return b64decode(value)
-    return obj
+def _loads(value, decoder):
+    while value[:1] == _CODEC_HEADER:
+        value = decompress(value)
+    return decoder.decode(value)
+
+
+# Encoded payloads look like ~codec~data; a JSON document can't start with ~
+# so they can be decoded together with the plain payloads.
+_CODEC_HEADER = '~'
+_codecs = {}  # name -> (encode, decode), both taking and returning text
+
+
+def register_codec(name, compress, decompress):
+    """Register a compression codec by name.
+
+    Both the compress and decompress callables take and return bytes. Once
+    registered, the payloads compressed with a codec can be decoded by
+    :func:`loads`, regardless of the serializer that was used to encode them.
+    """
+    def encode(value):
+        return b64encode(compress(value.encode('utf-8'))).decode('ascii')
+
+    def decode(data):
+        return decompress(b64decode(data)).decode('utf-8')
+
+    _register(name, encode, decode)
+
+
+def register_blob_store(name, blob_store):
+    """Register a blob store by name.
+
+    The payloads offloaded to a blob store are replaced with a reference to
+    the blob. Once registered, the references are resolved by :func:`loads`.
+    See :class:`flowy.blobstore.BlobStore` for the store interface.
+    """
+    _register(name, blob_store.put, blob_store.get)
+
+
+def _register(name, encode, decode):
+    name = str(name)
+    if not name or _CODEC_HEADER in name:
+        raise ValueError('Invalid codec name: %r' % name)
+    _codecs[name] = (encode, decode)
+
+
+def compress(value, codec):
+    """Encode a serialized value with a registered codec or blob store."""
+    try:
+        encode, _ = _codecs[codec]
+    except KeyError:
+        raise ValueError('Unknown codec: %r' % (codec,))
+    return '%s%s%s%s' % (_CODEC_HEADER, codec, _CODEC_HEADER, encode(value))
+
+
+def decompress(value):
+    """Decode one level of encoding of a value encoded by :func:`compress`."""
+    codec, _, data = value[1:].partition(_CODEC_HEADER)
+    try:
+        _, decode = _codecs[codec]
+    except KeyError:
+        raise ValueError('Unknown codec: %r' % (codec,))
+    return decode(data)
+
+
+register_codec('zlib', zlib.compress, zlib.decompress)
+if lzma is not None:
+    register_codec('lzma', lzma.compress, lzma.decompress)
+
+
+class Serializer(object):
+    """A JSON serializer that compresses or offloads the large payloads.
+
+    The payloads above threshold are compressed with the codec. If they are
+    still larger than blob_threshold, they are put in the blob store
+    registered as blob_store and only a reference to the blob is returned.
+    Its methods can be used for the serialization hooks of the configs and
+    proxies, for example:
+
+        register_blob_store('shared', FileBlobStore('/mnt/shared/blobs'))
+        s = Serializer('lzma', threshold=1024, blob_store='shared')
+        cfg = SWFWorkflowConfig(serialize_result=s.serialize_result)
+        cfg.conf_activity('a', version=1, serialize_input=s.serialize_input)
+
+    The deserialization doesn't need any changes, :func:`loads` recognizes
+    all the registered codecs and blob stores.
+    """
+
+    def __init__(self, codec='zlib', threshold=4096, blob_store=None,
+                 blob_threshold=32768):
+        for name in (codec, blob_store):
+            if name is not None and name not in _codecs:
+                raise ValueError('Unknown codec: %r' % (name,))
+        self.codec = codec
+        self.threshold = threshold
+        self.blob_store = blob_store
+        self.blob_threshold = blob_threshold
+
+    def dumps(self, value):
+        data = dumps(value)
+        if self.codec is not None and len(data) >= self.threshold:
+            compressed = compress(data, self.codec)
+            if len(compressed) < len(data):
+                data = compressed
+        if self.blob_store is not None and len(data) > self.blob_threshold:
+            data = compress(data, self.blob_store)
+        return data
+
+    def serialize_input(self, *args, **kwargs):
+        return self.dumps([args, kwargs])
+
+    serialize_restart_input = serialize_input
+
+    def serialize_result(self, result):
+        return self.dumps(result)
+
+    @staticmethod
+    def loads(value):
+        return loads(value)
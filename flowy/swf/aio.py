@@ -0,0 +1,198 @@
+"""An asyncio activity worker, needs Python 3.5 or newer."""
+import asyncio
+import functools
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flowy.swf.client import get_swf_client
+from flowy.swf.decision import SWFActivityDecision
+from flowy.swf.decision import send_response
+from flowy.swf.worker import _ResponseRecorder
+from flowy.swf.worker import default_identity
+from flowy.swf.worker import poll_activity
+from flowy.swf.worker import SWFActivityWorker
+from flowy.utils import logger
+from flowy.utils import setup_default_logger
+
+
+__all__ = ['AsyncSWFActivityWorker', 'AsyncActivityPool']
+
+
+class AsyncSWFActivityWorker(SWFActivityWorker):
+    """An activity worker that runs coroutine activities on an event loop.
+
+    The activities are registered as usual, with :class:`SWFActivityConfig`,
+    and can be ``async def`` functions. Thousands of them can run concurrently
+    in a single thread. Plain functions are also accepted but they run in the
+    executor used for the SWF calls, so they should be short.
+
+    The heartbeat passed to a coroutine activity doesn't block, it sends the
+    heartbeat in the background and returns an asyncio task that can be
+    awaited for the result.
+    """
+
+    def run_forever(self, domain, task_list,
+                    swf_client=None,
+                    setup_log=True,
+                    register_remote=True,
+                    identity=None,
+                    pollers=1,
+                    concurrency=100,
+                    threads=None):
+        """Same as SWFActivityWorker.run_forever but runs on an event loop.
+
+        At most concurrency activities are in hand at any time; the polling
+        pauses while all of them are running. The blocking SWF calls are made
+        from an executor with a few threads, pollers + 4 by default.
+        """
+        if setup_log:
+            setup_default_logger()
+        identity = default_identity() if identity is None else identity
+        threads = threads or pollers + 4
+        if swf_client is None:
+            # All the SWF calls are made from the executor threads
+            swf_client = get_swf_client(max_pool_connections=threads)
+        if register_remote:
+            self.register_remote(swf_client, domain)
+        pool = AsyncActivityPool(self, swf_client, domain, task_list,
+                                 identity=identity,
+                                 pollers=pollers,
+                                 concurrency=concurrency,
+                                 threads=threads)
+        pool.run()
+
+
+class AsyncActivityPool(object):
+    """Poll activities and run them as tasks on a new event loop.
+
+    Each poller waits for a free slot, polls a task in the executor and starts
+    an asyncio task for it. The task runs the activity, awaiting it if needed,
+    and the outcome goes through :meth:`Worker.dispatch`, same as for the sync
+    workers. The response is recorded and then sent from the executor.
+
+    On KeyboardInterrupt, or when the worker break_loop returns True, the
+    pollers stop after their current poll and the tasks in hand are finished
+    before :meth:`run` returns.
+    """
+
+    def __init__(self, worker, swf_client, domain, task_list, identity=None,
+                 pollers=1, concurrency=100, threads=None):
+        if pollers < 1 or concurrency < 1:
+            raise ValueError('At least one poller and one task are needed.')
+        self.worker = worker
+        self.swf_client = swf_client
+        self.domain = domain
+        self.task_list = task_list
+        self.identity = identity
+        self.pollers = pollers
+        self.concurrency = concurrency
+        self.threads = threads or pollers + 4
+        self.stop_event = threading.Event()
+        self.tasks = set()
+        self.loop = None
+        self.loop_thread = None
+        self.executor = None
+        self.slots = None
+
+    def run(self):
+        """Run the pollers and the activities until stopped."""
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.current_thread()
+        self.executor = ThreadPoolExecutor(max_workers=self.threads)
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.main())
+        except KeyboardInterrupt:
+            self.stop_event.set()
+            self.drain()
+        finally:
+            self.stop_event.set()
+            self.executor.shutdown(wait=True)
+            asyncio.set_event_loop(None)
+            self.loop.close()
+
+    def drain(self):
+        """Finish the tasks in hand after the loop was interrupted."""
+        pending = [t for t in self.tasks if not t.done()]
+        if pending:
+            self.loop.run_until_complete(asyncio.wait(pending))
+
+    def should_stop(self):
+        return self.stop_event.is_set() or self.worker.break_loop()
+
+    async def main(self):
+        # The semaphore is created here to bind it to the running loop
+        self.slots = asyncio.Semaphore(self.concurrency)
+        pollers = [self.spawn(self.poll_loop()) for _ in range(self.pollers)]
+        await asyncio.wait(pollers)
+        while self.tasks:
+            await asyncio.wait(list(self.tasks))
+
+    def spawn(self, coro):
+        task = self.loop.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def call(self, func, *args, **kwargs):
+        """Call a blocking func in the executor."""
+        return await self.loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs))
+
+    async def poll_loop(self):
+        while not self.should_stop():
+            await self.slots.acquire()
+            try:
+                polled = await self.call(poll_activity, self.swf_client,
+                                         self.domain, self.task_list,
+                                         self.identity,
+                                         should_stop=self.should_stop)
+            except Exception:
+                logger.exception('Error while polling:')
+                self.slots.release()
+                continue
+            if polled is None:
+                self.slots.release()
+                break
+            task = self.spawn(self.run_task(polled))
+            task.add_done_callback(lambda t: self.slots.release())
+
+    async def run_task(self, polled):
+        at = polled['activityType']
+        token = polled['taskToken']
+        wrapped_func = self.worker.lookup((str(at['name']),
+                                           str(at['version'])))
+        if wrapped_func is None:
+            return  # Let it timeout
+        recorder = _ResponseRecorder()
+        deadline = self.worker.task_deadline(at['name'], at['version'])
+        decision = SWFActivityDecision(recorder, token, deadline)
+        heartbeat = self.make_heartbeat(token)
+        with self.worker.dispatch(decision) as finish:
+            # Deserializing and creating the coroutine is cheap but a plain
+            # function activity would block the loop
+            result = await self.call(wrapped_func, polled['input'], heartbeat,
+                                     allow_awaitable=True)
+            if inspect.isawaitable(result):
+                result = await result
+            finish(result)
+        for method, args, kwargs in recorder.responses:
+            await self.call(send_response, getattr(self.swf_client, method),
+                            args, kwargs, deadline)
+
+    def make_heartbeat(self, token):
+        """Make a heartbeat callable for the activity with this token.
+
+        Called from the loop, it sends the heartbeat from a task and returns
+        it. Called from another thread, like the plain function activities do,
+        it blocks and returns the result.
+        """
+        decision = SWFActivityDecision(self.swf_client, token)
+
+        def heartbeat(details=None):
+            if threading.current_thread() is not self.loop_thread:
+                return decision.heartbeat(details)
+            return self.spawn(self.call(decision.heartbeat, details))
+
+        return heartbeat
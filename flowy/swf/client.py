@@ -1,9 +1,19 @@
+import collections
+import os
+import random
+import threading
+import time
+
 import boto3
 from botocore.client import Config
+from botocore.exceptions import ClientError
 
+from flowy.utils import logger
 from flowy.utils import str_or_none
 
-__all__ = ['CHILD_POLICY', 'DURATION', 'IDENTITY_SIZE', 'SWFClient']
+__all__ = ['CHILD_POLICY', 'DURATION', 'IDENTITY_SIZE', 'SWFClient',
+           'TokenBucket', 'Throttle', 'DEFAULT_THROTTLE', 'backoff_delay',
+           'get_swf_client']
 
 
 # poor man's enums and constants
@@ -24,6 +34,155 @@ class DURATION:
 
 IDENTITY_SIZE = 256
 
+# The error codes worth retrying after a delay
+RETRYABLE_ERRORS = frozenset([
+    'ThrottlingException', 'Throttling', 'RequestLimitExceeded',
+    'ServiceUnavailable', 'ServiceUnavailableException', 'InternalFailure',
+    'InternalServerError',
+])
+
+_clock = getattr(time, 'monotonic', time.time)
+
+
+def backoff_delay(attempt, base=0.05, cap=5.0):
+    """The delay before retry number attempt, counting from 0.
+
+    The delay is picked at random up to an exponentially growing limit (the
+    "full jitter" backoff) so that the clients throttled together don't retry
+    together.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_retryable(error):
+    """Check if a :class:`ClientError` is worth retrying after a delay."""
+    code = error.response.get('Error', {}).get('Code')
+    return code in RETRYABLE_ERRORS
+
+
+class TokenBucket(object):
+    """A thread-safe token bucket that refills at rate tokens per second.
+
+    It holds at most burst tokens. A call that finds the bucket empty
+    reserves the next token and sleeps until it's available, so the waiting
+    callers are served in order and nobody spins.
+    """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError('The rate must be positive.')
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        if self.burst < 1:
+            raise ValueError('The burst must be at least 1.')
+        self.tokens = self.burst
+        self.last = _clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, waiting if needed; return the time waited."""
+        with self.lock:
+            now = _clock()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class Throttle(object):
+    """Rate limits and retries the SWF calls, grouped in API families.
+
+    The families are: poll, respond, heartbeat, start and register (which
+    also covers the describe calls). Each family has its own
+    :class:`TokenBucket`, or no limit if its rate is None. The calls that
+    fail with a retryable error, like throttling, are retried up to
+    max_retries times, after a :func:`backoff_delay`. The calls of the
+    families in no_retry are only rate limited, their callers retry them:
+    the respond calls are retried by :func:`flowy.swf.decision.send_response`
+    until the task deadline.
+
+    The counters keep, for each family, the number of calls, the number of
+    calls delayed by the bucket (throttled), the retries and the calls that
+    failed after all the retries (gave_up).
+
+    A throttle can be shared between clients and threads, by default all the
+    clients in a process share :data:`DEFAULT_THROTTLE`.
+    """
+
+    # (rate, burst) close to the default SWF quotas for an account; the
+    # registrations come in a burst when a worker starts, a register and a
+    # describe call for each type, made concurrently by the workers
+    DEFAULT_RATES = {
+        'poll': (200, 1000),
+        'respond': (200, 1000),
+        'heartbeat': (160, 1000),
+        'start': (200, 1000),
+        'register': (100, 500),
+    }
+
+    def __init__(self, rates=None, max_retries=5, backoff_base=0.05,
+                 backoff_cap=5.0, no_retry=('respond', )):
+        self.max_retries = max_retries
+        self.no_retry = frozenset(no_retry)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.buckets = {}
+        self.counters = collections.Counter()
+        self.counters_lock = threading.Lock()
+        all_rates = dict(self.DEFAULT_RATES)
+        all_rates.update(rates or {})
+        for family, rate in all_rates.items():
+            self.configure(family, rate)
+
+    def configure(self, family, rate):
+        """Set the (rate, burst) of a family, a plain rate or None."""
+        if rate is None:
+            self.buckets[family] = None
+            return
+        if not isinstance(rate, (tuple, list)):
+            rate = (rate, )
+        self.buckets[family] = TokenBucket(*rate)
+
+    def count(self, family, name):
+        with self.counters_lock:
+            self.counters['%s.%s' % (family, name)] += 1
+
+    def stats(self):
+        """A snapshot of the counters, keyed by family.name."""
+        with self.counters_lock:
+            return dict(self.counters)
+
+    def call(self, family, func, *args, **kwargs):
+        """Call func, waiting for the family bucket and retrying on errors."""
+        bucket = self.buckets.get(family)
+        max_retries = 0 if family in self.no_retry else self.max_retries
+        attempt = 0
+        while 1:
+            self.count(family, 'calls')
+            if bucket is not None and bucket.acquire():
+                self.count(family, 'throttled')
+            try:
+                return func(*args, **kwargs)
+            except ClientError as e:
+                if not is_retryable(e):
+                    raise
+                if attempt >= max_retries:
+                    self.count(family, 'gave_up')
+                    raise
+                delay = backoff_delay(attempt, self.backoff_base,
+                                      self.backoff_cap)
+                logger.warning('Retrying %s in %.2fs: %s', family, delay, e)
+                self.count(family, 'retries')
+                time.sleep(delay)
+                attempt += 1
+
+
+DEFAULT_THROTTLE = Throttle()
+
 
 class SWFClient(object):
     """A thin wrapper around :func:`boto3.client('swf')` for sanitizing
@@ -32,7 +191,7 @@ class SWFClient(object):
     interfacing this class.
     """
 
-    def __init__(self, client=None, config=None, kwargs=None):
+    def __init__(self, client=None, config=None, kwargs=None, throttle=None):
         """Setup initial swf client. Can inject an initialized SWF client,
         ignoring the additional config or config can be passed to create the
         SWF client.
@@ -52,12 +211,21 @@ class SWFClient(object):
         :type kwargs: dict
         :param kwargs: kwargs for passing to client initialisation. The config
             param can be overwritten here
+
+        :type throttle: :class:`Throttle`
+        :param throttle: rate limits and retries the calls; by default the
+            throttle shared by the whole process, :data:`DEFAULT_THROTTLE`
         """
         kwargs = kwargs if isinstance(kwargs, dict) else {}
         config = config or Config(connect_timeout=70, read_timeout=70)
         kwargs.setdefault('config', config)
 
         self.client = client or boto3.client('swf', **kwargs)
+        self.throttle = throttle if throttle is not None else DEFAULT_THROTTLE
+
+    def _call(self, family, method, kwargs):
+        return self.throttle.call(family, getattr(self.client, method),
+                                  **kwargs)
 
     def register_activity_type(self, domain, name, version, desc=None,
                                default_task_list=None,
@@ -86,7 +254,7 @@ class SWFClient(object):
                                                                  'default_close_timeout')
         }
         normalize_data(kwargs)
-        response = self.client.register_activity_type(**kwargs)
+        response = self._call('register', 'register_activity_type', kwargs)
         return response
 
     def register_workflow_type(self, domain, name, version, desc=None,
@@ -114,7 +282,7 @@ class SWFClient(object):
             'defaultLambdaRole': str_or_none(default_lambda_role)
         }
         normalize_data(kwargs)
-        response = self.client.register_workflow_type(**kwargs)
+        response = self._call('register', 'register_workflow_type', kwargs)
         return response
 
     def describe_activity_type(self, domain, name, version):
@@ -127,7 +295,7 @@ class SWFClient(object):
             }
         }
         normalize_data(kwargs)
-        response = self.client.describe_activity_type(**kwargs)
+        response = self._call('register', 'describe_activity_type', kwargs)
         return response
 
     def describe_workflow_type(self, domain, name, version):
@@ -140,7 +308,7 @@ class SWFClient(object):
             }
         }
         normalize_data(kwargs)
-        response = self.client.describe_workflow_type(**kwargs)
+        response = self._call('register', 'describe_workflow_type', kwargs)
         return response
 
     def start_workflow_execution(self, domain, wid, name, version,
@@ -169,7 +337,7 @@ class SWFClient(object):
             'lambda_role': str_or_none(lambda_role)
         }
         normalize_data(kwargs)
-        response = self.client.start_workflow_execution(**kwargs)
+        response = self._call('start', 'start_workflow_execution', kwargs)
         return response
 
     def poll_for_decision_task(self, domain, task_list, identity=None,
@@ -190,7 +358,7 @@ class SWFClient(object):
             'reverseOrder': reverse_order
         }
         normalize_data(kwargs)
-        response = self.client.poll_for_decision_task(**kwargs)
+        response = self._call('poll', 'poll_for_decision_task', kwargs)
         return response
 
     def poll_for_activity_task(self, domain, task_list, identity=None):
@@ -205,7 +373,7 @@ class SWFClient(object):
             'identity': identity,
         }
         normalize_data(kwargs)
-        response = self.client.poll_for_activity_task(**kwargs)
+        response = self._call('poll', 'poll_for_activity_task', kwargs)
         return response
 
     def record_activity_task_heartbeat(self, task_token, details=None):
@@ -215,7 +383,8 @@ class SWFClient(object):
             'details': str_or_none(details),
         }
         normalize_data(kwargs)
-        response = self.client.record_activity_task_heartbeat(**kwargs)
+        response = self._call('heartbeat', 'record_activity_task_heartbeat',
+                              kwargs)
         return response
 
     def respond_activity_task_failed(self, task_token, reason=None, details=None):
@@ -226,7 +395,7 @@ class SWFClient(object):
             'details': str_or_none(details)
         }
         normalize_data(kwargs)
-        response = self.client.respond_activity_task_failed(**kwargs)
+        response = self._call('respond', 'respond_activity_task_failed', kwargs)
         return response
 
     def respond_activity_task_completed(self, task_token, result=None):
@@ -236,7 +405,8 @@ class SWFClient(object):
             'result': str_or_none(result)
         }
         normalize_data(kwargs)
-        response = self.client.respond_activity_task_completed(**kwargs)
+        response = self._call('respond', 'respond_activity_task_completed',
+                              kwargs)
         return response
 
     def respond_decision_task_completed(self, task_token, decisions=None,
@@ -248,10 +418,59 @@ class SWFClient(object):
             'executionContext': str_or_none(exec_context)
         }
         normalize_data(kwargs)
-        response = self.client.respond_decision_task_completed(**kwargs)
+        response = self._call('respond', 'respond_decision_task_completed',
+                              kwargs)
         return response
 
 
+_shared_clients = {}  # (pid, settings) -> SWFClient
+_shared_sessions = {}  # pid -> boto3 session
+_shared_lock = threading.Lock()
+
+
+def get_swf_client(max_pool_connections=None, tcp_keepalive=True,
+                   **kwargs):
+    """Return a :class:`SWFClient` shared by the process for these settings.
+
+    Creating a boto3 session and client is slow and each client opens its
+    own connections, so the clients are created once and reused. The
+    botocore clients are thread-safe and the sessions, which are not, are
+    only used under a lock. A forked process gets its own clients.
+
+    :param max_pool_connections: the size of the connection pool, it should
+        be at least the number of threads making calls at the same time; the
+        botocore default (10) if None
+    :param tcp_keepalive: enable TCP keep-alive for the pooled connections,
+        so the idle ones, in between long polls, are not dropped silently
+    :param kwargs: passed to :py:meth:`boto3.session.Session.client`, like
+        region_name; the values must be hashable
+    """
+    key = (os.getpid(), max_pool_connections, tcp_keepalive,
+           tuple(sorted(kwargs.items())))
+    with _shared_lock:
+        swf_client = _shared_clients.get(key)
+        if swf_client is None:
+            session = _shared_sessions.get(os.getpid())
+            if session is None:
+                session = boto3.session.Session()
+                _shared_sessions[os.getpid()] = session
+            config = _pool_config(max_pool_connections, tcp_keepalive)
+            swf_client = SWFClient(client=session.client('swf', config=config,
+                                                         **kwargs))
+            _shared_clients[key] = swf_client
+    return swf_client
+
+
+def _pool_config(max_pool_connections, tcp_keepalive):
+    config = {'connect_timeout': 70, 'read_timeout': 70}
+    if max_pool_connections is not None:
+        config['max_pool_connections'] = max_pool_connections
+    try:
+        return Config(tcp_keepalive=tcp_keepalive, **config)
+    except TypeError:  # older botocore releases can't set the keep-alive
+        return Config(**config)
+
+
 class SWFDecisions(object):
     """
     Helper class for creating decision responses.
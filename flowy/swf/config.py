@@ -1,9 +1,11 @@
 import functools
+import json
 
 from botocore.exceptions import ClientError
 
 from flowy.swf.client import cp_encode
 from flowy.swf.client import duration_encode
+from flowy.swf.decision import RESULT_SIZE
 from flowy.swf.proxy import SWFActivityProxyFactory
 from flowy.swf.proxy import SWFWorkflowProxyFactory
 from flowy.config import ActivityConfig
@@ -37,16 +39,39 @@ class SWFConfigMixin(object):
         name, version = str(name), str(version)
         registry.register_task((name, version), self.wrap(func))
         registry.add_remote_reg_callback(
-            functools.partial(self.register_remote, name=name, version=version))
+            RemoteRegistration(self, name, version))
 
     def __call__(self, version, name=None):
         key = (name, version)
         return super(SWFConfigMixin, self).__call__(key)
 
 
+class RemoteRegistration(object):
+    """The remote registration callback of a config, name and version.
+
+    It also makes the key used to remember that the registration was
+    verified, see :class:`flowy.swf.worker.RegistrationCache`. The key
+    changes when any of the defaults change.
+    """
+
+    def __init__(self, config, name, version):
+        self.config = config
+        self.name = name
+        self.version = version
+
+    def __call__(self, swf_client, domain):
+        self.config.register_remote(swf_client, domain, self.name,
+                                    self.version)
+
+    def cache_key(self, domain):
+        return json.dumps([self.config.category, str(domain), self.name,
+                           self.version, self.config._cvt_values()])
+
+
 class SWFActivityConfig(SWFConfigMixin, ActivityConfig):
     """A configuration object for Amazon SWF Activities."""
     category = 'swf_activity'  # venusian category used for this type of confs
+    batch_result_size = RESULT_SIZE
 
     def __init__(self,
                  default_task_list=None,
@@ -291,7 +316,8 @@ class SWFWorkflowConfig(SWFConfigMixin, WorkflowConfig):
                       start_to_close=None,
                       serialize_input=None,
                       deserialize_result=None,
-                      retry=(0, 0, 0)):
+                      retry=(0, 0, 0),
+                      batch_size=None):
         """Configure an activity dependency for a workflow implementation.
 
         dep_name is the name of one of the workflow factory arguments
@@ -310,6 +336,12 @@ class SWFWorkflowConfig(SWFConfigMixin, WorkflowConfig):
 
         For convenience, if the activity name is missing, it will be the same
         as the dependency name.
+
+        If batch_size is set, up to batch_size calls are sent as a single
+        activity task, see :class:`flowy.batch.BatchProxy`. The timeouts and
+        the retries apply to the whole batch. A batch is also cut short when
+        its input would get too large for SWF, and the results that don't fit
+        in the batch result fail their own calls.
         """
         if name is None:
             name = dep_name
@@ -324,7 +356,8 @@ class SWFWorkflowConfig(SWFConfigMixin, WorkflowConfig):
             start_to_close=duration_encode(start_to_close, 'start_to_close'),
             serialize_input=serialize_input,
             deserialize_result=deserialize_result,
-            retry=retry)
+            retry=retry,
+            batch_size=batch_size)
         self.conf_proxy_factory(dep_name, proxy_factory)
 
     def conf_workflow(self, dep_name, version,
@@ -1,25 +1,76 @@
+import time
 import uuid
 
+from botocore.exceptions import BotoCoreError
 from botocore.exceptions import ClientError
+from botocore.exceptions import ParamValidationError
 
 from flowy.swf.client import SWFDecisions
+from flowy.swf.client import backoff_delay
+from flowy.swf.client import is_retryable
 from flowy.utils import logger
 
 
 INPUT_SIZE = RESULT_SIZE = 32768
 REASON_SIZE = 256
 
+RESPOND_RETRIES = 8
+RESPOND_BACKOFF = (0.1, 2.0)  # (base, cap) in seconds
+
+
+def task_deadline(timeout, start=None):
+    """The time when a task with this timeout, in seconds, started at start
+    (by default now) times out; None if the timeout is missing or 'NONE'."""
+    if timeout is None or str(timeout).upper() == 'NONE':
+        return None
+    start = time.time() if start is None else start
+    return start + int(timeout)
+
+
+def send_response(func, args=(), kwargs=None, deadline=None,
+                  error_msg='Error while sending the response:'):
+    """Call func, a respond method of the SWF client, retrying on errors.
+
+    Only the transient errors are retried: the throttling and service
+    errors, see :func:`flowy.swf.client.is_retryable`, and the connection
+    errors. The retries stop after RESPOND_RETRIES attempts or when the next
+    one would start after the deadline, when the task times out anyway and
+    SWF reschedules it.
+
+    :rtype: bool
+    :returns: was the response sent?
+    """
+    attempt = 0
+    while 1:
+        try:
+            func(*args, **(kwargs or {}))
+            return True
+        except (ClientError, BotoCoreError) as e:
+            transient = (is_retryable(e) if isinstance(e, ClientError)
+                         else not isinstance(e, ParamValidationError))
+            delay = backoff_delay(attempt, *RESPOND_BACKOFF)
+            late = deadline is not None and time.time() + delay >= deadline
+            if not transient or attempt + 1 >= RESPOND_RETRIES or late:
+                logger.exception(error_msg)
+                return False
+            logger.warning('Retrying the response in %.2fs: %s', delay, e)
+            time.sleep(delay)
+            attempt += 1
+
 
 class SWFActivityDecision(object):
-    def __init__(self, swf_client, token):
+    def __init__(self, swf_client, token, deadline=None):
         """SWF activity type decision.
 
         :type swf_client: :class:`flowy.swf.client.SWFClient`
         :param swf_client: an instanced SWF client
         :param token: the token identifying the ActivityTask worker
+        :param deadline: the time when the activity times out, if known; the
+            responses are not retried past it
         """
         self.swf_client = swf_client
         self.token = token
+        self.deadline = deadline
 
     def heartbeat(self, details=None):
         """Used to report that the activity is still making progress. Details
@@ -40,13 +91,10 @@ class SWFActivityDecision(object):
         return True
 
     def fail(self, reason):
-        try:
-            self.swf_client.respond_activity_task_failed(self.token,
-                                                         reason=reason)
-        except ClientError:
-            logger.exception('Error while failing the activity:')
-            return False
-        return True
+        return send_response(self.swf_client.respond_activity_task_failed,
+                             (self.token, ), {'reason': reason},
+                             self.deadline,
+                             'Error while failing the activity:')
 
     def flush(self):
         self.fail("Cannot flush activities.")
@@ -58,18 +106,16 @@ class SWFActivityDecision(object):
         result = str(result)
         if len(result) > RESULT_SIZE:
             self.fail("Result too large: %s/%s" % (len(result), RESULT_SIZE))
-        try:
-            self.swf_client.respond_activity_task_completed(self.token,
-                                                            result=result)
-        except ClientError:
-            logger.exception('Error while finishing the activity:')
-            return False
-        return True
+        return send_response(self.swf_client.respond_activity_task_completed,
+                             (self.token, ), {'result': result},
+                             self.deadline,
+                             'Error while finishing the activity:')
 
 
 class SWFWorkflowDecision(object):
     def __init__(self, swf_client, token, name, version, task_list,
-                 decision_duration, workflow_duration, tags, child_policy):
+                 decision_duration, workflow_duration, tags, child_policy,
+                 deadline=None):
         """SWF workflow type decision.
 
         :type swf_client: :class:`flowy.swf.client.SWFClient`
@@ -82,6 +128,8 @@ class SWFWorkflowDecision(object):
         :param workflow_duration: exec duration in seconds of workflow
         :param tags: list of str tags, searchable later
         :param child_policy: policy to use for the child workflow executions
+        :param deadline: the time when the decision task times out, if known;
+            the response is not retried past it
         """
         self.swf_client = swf_client
         self.token = token
@@ -92,6 +140,7 @@ class SWFWorkflowDecision(object):
         self.child_policy = child_policy
         self.decisions = SWFDecisions()
         self.closed = False
+        self.deadline = deadline
 
     def fail(self, reason):
         """Fail the workflow and flush.
@@ -108,12 +157,10 @@ class SWFWorkflowDecision(object):
         if self.closed:
             return
         self.closed = True
-        try:
-            self.swf_client.respond_decision_task_completed(
-                self.token, decisions=self.decisions._data)
-        except ClientError:
-            logger.exception('Error while sending the decisions:')
-            # ignore the error and let the decision timeout and retry
+        # On persistent errors let the decision timeout and retry
+        send_response(self.swf_client.respond_decision_task_completed,
+                      (self.token, ), {'decisions': self.decisions._data},
+                      self.deadline, 'Error while sending the decisions:')
 
     def restart(self, input_data):
         """Restart the workflow and flush.
@@ -195,16 +242,20 @@ class SWFWorkflowTaskDecision(object):
         self.decision.fail(reason)
 
     def schedule(self, call_number, retry_number, delay, input_data):
+        """Schedule the task, or a timer for it, and return True if the task
+        was scheduled."""
         if not self.rate_limit.consume():
-            return
+            return False
         tk = task_key(self.proxy_factory.identity, call_number, retry_number)
         if delay > 0:
             if self.execution_history.is_timer_ready(tk):
                 self._schedule(tk, input_data)
+                return True
             elif not self.execution_history.is_timer_running(tk):
                 self.decision.schedule_timer(tk, delay)
-        else:
-            self._schedule(tk, input_data)
+            return False
+        self._schedule(tk, input_data)
+        return True
 
     def _schedule(self, task_key, input_data):
         self.decision.schedule_workflow(
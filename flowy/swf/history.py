@@ -1,57 +1,134 @@
-from flowy.swf.decision import task_key, timer_key
+from flowy.history import ERROR
+from flowy.history import ExecutionHistory
+from flowy.history import HistoryView
+from flowy.history import RESULT
+from flowy.history import TIMEDOUT
+from flowy.history import VersionedExecutionHistory
+from flowy.swf.decision import timer_key
+
+
+class SWFExecutionHistory(ExecutionHistory):
+    """An execution history that also knows about the SWF timers."""
+
+    def __init__(self, running=(), timedout=(), results=None, errors=None,
+                 order=()):
+        """Build the history from the call keys of the tasks in each state.
+
+        The order is the list of call keys in the order they finished.
+        """
+        super(SWFExecutionHistory, self).__init__()
+        self.timers_running = set()
+        self.timers_fired = set()
+        self.finish_order = list(order)
+        positions = dict((call_key, i) for i, call_key in enumerate(order))
+        for call_key in running:
+            if _is_timer_key(call_key):
+                self.timers_running.add(call_key)
+            else:
+                self.set_running(call_key)
+        for call_key, result in (results or {}).items():
+            if _is_timer_key(call_key):
+                self.timers_fired.add(call_key)
+            else:
+                self.set_state(call_key,
+                               (RESULT, result, positions.get(call_key)))
+        for call_key, reason in (errors or {}).items():
+            self.set_state(call_key, (ERROR, reason, positions.get(call_key)))
+        for call_key in timedout:
+            self.set_state(call_key, (TIMEDOUT, None, positions.get(call_key)))
+
+    def set_timer_running(self, timer_id):
+        self.timers_running.add(timer_id)
+
+    def set_timer_fired(self, timer_id):
+        self.timers_running.discard(timer_id)
+        self.timers_fired.add(timer_id)
 
+    def is_timer_ready(self, call_key):
+        return timer_key(call_key) in self.timers_fired
+
+    def is_timer_running(self, call_key):
+        return timer_key(call_key) in self.timers_running
 
-class SWFExecutionHistory(object):
-    def __init__(self, running, timedout, results, errors, order):
-        self.running = running
-        self.timedout = timedout
-        self.results = results
-        self.errors = errors
-        self.order_ = order
 
-    def is_running(self, call_key):
-        return str(call_key) in self.running
+class VersionedSWFExecutionHistory(VersionedExecutionHistory):
+    """A :class:`flowy.history.VersionedExecutionHistory` that also knows
+    about the SWF timers.
 
-    def order(self, call_key):
-        return self.order_.index(str(call_key))
+    The timer changes get new versions too, so a :class:`SWFHistoryView`
+    sees the timers as they were when it was made.
+    """
 
-    def has_result(self, call_key):
-        return str(call_key) in self.results
+    def __init__(self):
+        super(VersionedSWFExecutionHistory, self).__init__()
+        self.timers = {}  # timer_id -> [(version, fired), ...]
 
-    def result(self, call_key):
-        return self.results[str(call_key)]
+    def set_timer_running(self, timer_id):
+        self._set_timer(timer_id, False)
 
-    def is_error(self, call_key):
-        return str(call_key) in self.errors
+    def set_timer_fired(self, timer_id):
+        self._set_timer(timer_id, True)
 
-    def error(self, call_key):
-        return self.errors[str(call_key)]
+    def _set_timer(self, timer_id, fired):
+        self.version += 1
+        self.timers.setdefault(timer_id, []).append((self.version, fired))
 
-    def is_timeout(self, call_key):
-        return str(call_key) in self.timedout
+    def timer_state(self, timer_id, version=None):
+        """True if the timer fired, False if it's running and None if it was
+        not started, at a version, by default the last one."""
+        for v, fired in reversed(self.timers.get(timer_id, ())):
+            if version is None or v <= version:
+                return fired
+        return None
 
     def is_timer_ready(self, call_key):
-        return timer_key(call_key) in self.results
+        return self.timer_state(timer_key(call_key)) is True
 
     def is_timer_running(self, call_key):
-        return timer_key(call_key) in self.running
+        return self.timer_state(timer_key(call_key)) is False
 
+    def view(self):
+        return SWFHistoryView(self, self.version, len(self.finish_order))
 
-class SWFTaskExecutionHistory(object):
-    def __init__(self, exec_history, identity):
-        self.exec_history = exec_history
-        self.identity = identity
 
-    def __getattr__(self, fname):
-        """Compute the key and delegate to exec_history."""
-        if fname not in ['is_running', 'is_timeout', 'is_error', 'has_result',
-                         'result', 'order', 'error']:
-            return getattr(super(SWFTaskExecutionHistory, self), fname)
+class SWFHistoryView(HistoryView):
+    """A read-only view of a :class:`VersionedSWFExecutionHistory` version.
 
-        delegate_to = getattr(self.exec_history, fname)
+    When pickled, it's loaded as a plain :class:`SWFExecutionHistory`.
+    """
 
-        def clos(call_number, retry_number):
-            return delegate_to(task_key(self.identity, call_number, retry_number))
+    def is_timer_ready(self, call_key):
+        return self.history.timer_state(timer_key(call_key),
+                                        self.version) is True
 
-        setattr(self, fname, clos)  # cache it
-        return clos
+    def is_timer_running(self, call_key):
+        return self.history.timer_state(timer_key(call_key),
+                                        self.version) is False
+
+    def materialize(self):
+        h = super(SWFHistoryView, self).materialize()
+        timers_running, timers_fired = set(), set()
+        for timer_id in list(self.history.timers):
+            fired = self.history.timer_state(timer_id, self.version)
+            if fired is not None:
+                (timers_fired if fired else timers_running).add(timer_id)
+        return _plain_swf_history(h.tasks, h.finish_order, timers_running,
+                                  timers_fired)
+
+    def __reduce__(self):
+        h = self.materialize()
+        return _plain_swf_history, (h.tasks, h.finish_order,
+                                    h.timers_running, h.timers_fired)
+
+
+def _plain_swf_history(tasks, finish_order, timers_running, timers_fired):
+    h = SWFExecutionHistory()
+    h.tasks = tasks
+    h.finish_order = finish_order
+    h.timers_running = timers_running
+    h.timers_fired = timers_fired
+    return h
+
+
+def _is_timer_key(call_key):
+    return str(call_key).endswith(':t')
@@ -1,6 +1,7 @@
+from flowy.batch import BatchProxy
+from flowy.swf.decision import INPUT_SIZE
 from flowy.swf.decision import SWFActivityTaskDecision
 from flowy.swf.decision import SWFWorkflowTaskDecision
-from flowy.swf.history import SWFTaskExecutionHistory
 from flowy.proxy import Proxy
 from flowy.utils import DescCounter
 
@@ -16,7 +17,8 @@ class SWFActivityProxyFactory(object):
                  start_to_close=None,
                  retry=(0, 0, 0),
                  serialize_input=None,
-                 deserialize_result=None):
+                 deserialize_result=None,
+                 batch_size=None):
         # This is a unique name used to generate unique identifiers
         self.identity = identity
         self.name = name
@@ -29,11 +31,16 @@ class SWFActivityProxyFactory(object):
         self.retry = retry
         self.serialize_input = serialize_input
         self.deserialize_result = deserialize_result
+        self.batch_size = batch_size
 
     def __call__(self, decision, execution_history, rate_limit=DescCounter()):
         """Instantiate Proxy."""
-        task_exec_hist = SWFTaskExecutionHistory(execution_history, self.identity)
+        task_exec_hist = execution_history.task_history(self.identity)
         task_decision = SWFActivityTaskDecision(decision, execution_history, self, rate_limit)
+        if self.batch_size is not None:
+            return BatchProxy(task_exec_hist, task_decision, self.retry,
+                              self.serialize_input, self.deserialize_result,
+                              self.batch_size, max_size=INPUT_SIZE)
         return Proxy(task_exec_hist, task_decision, self.retry,
                      self.serialize_input, self.deserialize_result)
 
@@ -62,7 +69,7 @@ class SWFWorkflowProxyFactory(object):
 
     def __call__(self, decision, execution_history, rate_limit):
         """Instantiate Proxy."""
-        task_exec_hist = SWFTaskExecutionHistory(execution_history, self.identity)
+        task_exec_hist = execution_history.task_history(self.identity)
         task_decision = SWFWorkflowTaskDecision(decision, execution_history, self, rate_limit)
         return Proxy(task_exec_hist, task_decision, self.retry,
                      self.serialize_input, self.deserialize_result)
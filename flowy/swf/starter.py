@@ -1,7 +1,16 @@
 from botocore.exceptions import ClientError
+import json
 import uuid
+try:
+    from concurrent.futures import FIRST_COMPLETED
+    from concurrent.futures import ThreadPoolExecutor
+    from concurrent.futures import wait
+except ImportError:
+    from futures import FIRST_COMPLETED
+    from futures import ThreadPoolExecutor
+    from futures import wait
 
-from flowy.swf.client import SWFClient
+from flowy.swf.client import get_swf_client
 from flowy.swf.decision import INPUT_SIZE
 from flowy.utils import logger
 from flowy.proxy import Proxy
@@ -26,7 +35,7 @@ def SWFWorkflowStarter(domain, name, version,
 
     def really_start(*args, **kwargs):
         """Use this function to start a workflow by passing in the args."""
-        swf = swf_client if swf_client is not None else SWFClient()
+        swf = swf_client if swf_client is not None else get_swf_client()
         l_wid = wid  # closure hack
         if l_wid is None:
             l_wid = uuid.uuid4()
@@ -52,3 +61,88 @@ def SWFWorkflowStarter(domain, name, version,
         return r['runId']
 
     return really_start
+
+
+def SWFWorkflowBatchStarter(domain, name, version,
+                            swf_client=None,
+                            concurrency=10,
+                            **starter_kwargs):
+    """Prepare to start many workflows, returns a callable.
+
+    The callable takes an iterable of (wid, args, kwargs) tuples, see
+    :func:`read_batch`, and starts a workflow execution for each of them
+    using concurrency threads. It returns an iterator over (wid, run_id,
+    error) tuples, as soon as each start completes, with either the run id
+    or the exception raised while starting the execution. A missing wid is
+    generated.
+
+    The iterable is consumed lazily, so it can be larger than the memory,
+    and the calls are rate limited by the client throttle, see
+    :class:`flowy.swf.client.Throttle`. The rest of the keyword arguments
+    are the same as for :func:`SWFWorkflowStarter`.
+    """
+    if concurrency < 1:
+        raise ValueError('The concurrency must be at least 1.')
+    if 'wid' in starter_kwargs:
+        raise TypeError('The wid is set for each workflow in the batch.')
+
+    def start_one(swf, wid, args, kwargs):
+        starter = SWFWorkflowStarter(domain, name, version, swf_client=swf,
+                                     wid=wid, **starter_kwargs)
+        return starter(*args, **kwargs)
+
+    def start_batch(items):
+        swf = swf_client
+        if swf is None:
+            swf = get_swf_client(max_pool_connections=concurrency)
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        in_flight = {}
+        items = iter(items)
+        try:
+            while 1:
+                # Keep a few items queued for each thread, not the whole batch
+                for wid, args, kwargs in items:
+                    wid = uuid.uuid4() if wid is None else wid
+                    f = executor.submit(start_one, swf, wid, args, kwargs)
+                    in_flight[f] = wid
+                    if len(in_flight) >= 2 * concurrency:
+                        break
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for f in done:
+                    wid = in_flight.pop(f)
+                    try:
+                        yield wid, f.result(), None
+                    except Exception as e:
+                        yield wid, None, e
+        finally:
+            for f in in_flight:
+                f.cancel()
+            executor.shutdown(wait=True)
+
+    return start_batch
+
+
+def read_batch(lines):
+    """Parse JSON lines into (wid, args, kwargs) tuples for a batch start.
+
+    Each line is an object, like {"wid": "w1", "args": [1], "kwargs": {}},
+    or an array, like ["w1", [1], {}]. All the fields are optional and the
+    blank lines are skipped.
+    """
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            if isinstance(item, dict):
+                item = (item.get('wid'), item.get('args'), item.get('kwargs'))
+            wid, args, kwargs = (list(item) + [None] * 3)[:3]
+            if not isinstance(args or [], list):
+                raise ValueError('args must be an array')
+            if not isinstance(kwargs or {}, dict):
+                raise ValueError('kwargs must be an object')
+        except (ValueError, TypeError) as e:
+            raise ValueError('Invalid batch line %s: %s' % (line_number, e))
+        yield wid, args or [], kwargs or {}
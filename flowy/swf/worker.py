@@ -1,35 +1,96 @@
+import collections
+import functools
+import hashlib
+import json
+import multiprocessing
 import os
 import socket
+import tempfile
+import threading
+import time
 
 import venusian
 from botocore.exceptions import ClientError
-
-from flowy.swf.client import SWFClient, IDENTITY_SIZE
+try:
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    from futures import ProcessPoolExecutor
+    from futures import ThreadPoolExecutor
+
+from flowy.swf.client import IDENTITY_SIZE
+from flowy.swf.client import backoff_delay
+from flowy.swf.client import get_swf_client
 from flowy.swf.decision import SWFActivityDecision
 from flowy.swf.decision import SWFWorkflowDecision
-from flowy.swf.history import SWFExecutionHistory
+from flowy.swf.decision import send_response
+from flowy.swf.decision import task_deadline
+from flowy.swf.history import VersionedSWFExecutionHistory
 from flowy.utils import logger
 from flowy.utils import setup_default_logger
 from flowy.worker import Worker
 
 
-__all__ = ['SWFWorkflowWorker', 'SWFActivityWorker']
+__all__ = ['SWFWorkflowWorker', 'SWFActivityWorker', 'WorkerPool',
+           'DecisionPool', 'ActivityPool', 'RegistrationCache']
+
+# (base, cap) in seconds of the delay between the polls that keep failing
+POLL_ERROR_BACKOFF = (0.5, 10.0)
 
 
 class SWFWorker(Worker):
-    def __init__(self):
+    def __init__(self, registration_cache=None, register_concurrency=8):
+        """Initialize the worker.
+
+        The remote registrations are made with up to register_concurrency
+        threads. If a :class:`RegistrationCache` is set, the registrations
+        verified recently, by this or other workers on the same host, are
+        skipped.
+        """
         super(SWFWorker, self).__init__()
         self.remote_reg_callbacks = []
+        self.registration_cache = registration_cache
+        self.register_concurrency = register_concurrency
 
     def __call__(self, name, version, input_data, decision, *extra_args):
         return super(SWFWorker, self).__call__(
             (str(name), str(version)), input_data, decision, *extra_args)
 
     def register_remote(self, swf_client, domain):
-        """Register or check compatibility of all configs in Amazon SWF."""
+        """Register or check compatibility of all configs in Amazon SWF.
+
+        All the registrations are tried, concurrently, and the error of the
+        first one that failed, in the registration order, is raised.
+        """
+        cache = self.registration_cache
+        pending = []
         for remote_reg_callback in self.remote_reg_callbacks:
-            # Raises if there are registration problems
-            remote_reg_callback(swf_client, domain)
+            key = _registration_key(remote_reg_callback, domain)
+            if cache is not None and key is not None and cache.verified(key):
+                continue
+            pending.append((remote_reg_callback, key))
+        if not pending:
+            return
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, min(self.register_concurrency, len(pending))))
+        try:
+            futures = [executor.submit(callback, swf_client, domain)
+                       for callback, _ in pending]
+        finally:
+            executor.shutdown(wait=True)
+        first_error = None
+        for (callback, key), f in zip(pending, futures):
+            try:
+                f.result()  # raises if there are registration problems
+            except Exception as e:
+                first_error = first_error or e
+                continue
+            if cache is not None and key is not None:
+                cache.add(key)
+        if cache is not None:
+            cache.save()
+        if first_error is not None:
+            raise first_error
 
     def register(self, config, func, version, name=None):
         super(SWFWorker, self).register(config, func, (name, version))
@@ -60,8 +121,12 @@ class SWFWorkflowWorker(SWFWorker):
                     swf_client=None,
                     setup_log=True,
                     register_remote=True,
-                    identity=None):
-        """Starts an endless single threaded/single process worker loop.
+                    identity=None,
+                    history_cache_size=None,
+                    pollers=None,
+                    workers=None,
+                    processes=False):
+        """Starts an endless worker loop.
 
         The worker polls endlessly for new decisions from the specified domain
         and task list and runs them.
@@ -74,21 +139,60 @@ class SWFWorkflowWorker(SWFWorker):
 
         If setup_log is set, a default configuration for the logger is loaded.
 
-        A custom SWF client can be passed in swf_client, otherwise a default
-        client is used.
+        A custom SWF client can be passed in swf_client, otherwise a client
+        shared by the process, with enough connections for all the pollers and
+        workers, is used. See :func:`flowy.swf.client.get_swf_client`.
+
+        If history_cache_size is set, the parsed execution histories of up to
+        that many workflow executions are kept in memory and only the new
+        events are fetched and parsed for subsequent decisions of the same
+        execution. Each decision gets a read-only view of the cached history,
+        made in constant time. In the process mode the view is pickled, so
+        there the cache saves the fetching and the parsing of the events but
+        not a pass over the whole history.
+
+        By default, the loop is single threaded: it polls a decision, runs it
+        and only then polls for the next one. If pollers or workers are set,
+        the decisions are polled by that many poller threads and run on a pool
+        of workers threads, or processes if processes is set. All of them
+        share the same SWF client and registry. A poller waits for a free
+        worker before polling, so no more than workers decisions are in hand
+        at any time. See :class:`DecisionPool` for details.
         """
         if setup_log:
             setup_default_logger()
         identity = default_identity() if identity is None else identity
-        swf_client = SWFClient() if swf_client is None else swf_client
+        pooled = pollers is not None or workers is not None
+        if pooled:
+            pollers = pollers or 1
+            workers = workers or pollers
+        if swf_client is None:
+            swf_client = get_swf_client(
+                max_pool_connections=_pool_size(pollers, workers, processes))
+        history_cache = None
+        if history_cache_size:
+            history_cache = HistoryCache(history_cache_size)
         if register_remote:
             self.register_remote(swf_client, domain)
+        if pooled:
+            pool = DecisionPool(self, swf_client, domain, task_list,
+                                identity=identity,
+                                history_cache=history_cache,
+                                pollers=pollers,
+                                workers=workers,
+                                processes=processes)
+            pool.run()
+            return
         try:
             while 1:
                 if self.break_loop():
                     break
-                name, version, input_data, exec_history, decision = poll_decision(
-                    swf_client, domain, task_list, identity)
+                polled = poll_decision(swf_client, domain, task_list, identity,
+                                       history_cache,
+                                       should_stop=self.break_loop)
+                if polled is None:
+                    break
+                name, version, input_data, exec_history, decision = polled
                 self(name, version, input_data, decision, exec_history)
         except KeyboardInterrupt:
             pass
@@ -97,6 +201,11 @@ class SWFWorkflowWorker(SWFWorker):
 class SWFActivityWorker(SWFWorker):
     categories = ['swf_activity']
 
+    def __init__(self, registration_cache=None, register_concurrency=8):
+        super(SWFActivityWorker, self).__init__(registration_cache,
+                                                register_concurrency)
+        self.start_to_close = {}  # (name, version) -> the default timeout
+
     # Be explicit about what arguments are expected
     def __call__(self, name, version, input_data, decision):
         # No extra arguments are used
@@ -108,109 +217,219 @@ class SWFActivityWorker(SWFWorker):
         """Used to exit the loop in tests. Return True to break."""
         return False
 
+    def add_remote_reg_callback(self, callback):
+        super(SWFActivityWorker, self).add_remote_reg_callback(callback)
+        config = getattr(callback, 'config', None)
+        if config is not None:
+            self.start_to_close[(callback.name, callback.version)] = (
+                config.default_start_to_close)
+
+    def task_deadline(self, name, version, start=None):
+        """The time when an activity task started at start times out.
+
+        The poll response doesn't carry the timeout of the task, the default
+        start to close timeout of the registered config is used instead. None
+        if the activity has no default timeout. The responses are not retried
+        past the deadline, so the activities scheduled with a longer timeout
+        than their default one should be sent as soon as possible.
+        """
+        timeout = self.start_to_close.get((str(name), str(version)))
+        return task_deadline(timeout, start)
+
     def run_forever(self, domain, task_list,
                     swf_client=None,
                     setup_log=True,
                     register_remote=True,
-                    identity=None):
-        """Same as SWFWorkflowWorker.run_forever but for activities."""
+                    identity=None,
+                    pollers=None,
+                    workers=None,
+                    processes=False):
+        """Same as SWFWorkflowWorker.run_forever but for activities.
+
+        In the pooled mode the activities are run, and their responses sent,
+        by the pool workers, see :class:`ActivityPool`.
+        """
         if setup_log:
             setup_default_logger()
         identity = default_identity() if identity is None else identity
-        swf_client = SWFClient() if swf_client is None else swf_client
+        pooled = pollers is not None or workers is not None
+        if pooled:
+            pollers = pollers or 1
+            workers = workers or pollers
+        if swf_client is None:
+            swf_client = get_swf_client(
+                max_pool_connections=_pool_size(pollers, workers, processes))
         if register_remote:
             self.register_remote(swf_client, domain)
+        if pooled:
+            pool = ActivityPool(self, swf_client, domain, task_list,
+                                identity=identity,
+                                pollers=pollers,
+                                workers=workers,
+                                processes=processes)
+            pool.run()
+            return
         try:
             while 1:
                 if self.break_loop():
                     break
-                swf_response = {}
-                while not swf_response.get('taskToken'):
-                    try:
-                        swf_response = swf_client.poll_for_activity_task(
-                            domain, task_list, identity=identity)
-                    except ClientError:
-                        # add a delay before retrying?
-                        logger.exception('Error while polling for activities:')
-
+                swf_response = poll_activity(swf_client, domain, task_list,
+                                             identity,
+                                             should_stop=self.break_loop)
+                if swf_response is None:
+                    break
                 at = swf_response['activityType']
-                decision = SWFActivityDecision(swf_client, swf_response['taskToken'])
+                decision = SWFActivityDecision(
+                    swf_client, swf_response['taskToken'],
+                    self.task_deadline(at['name'], at['version']))
                 self(at['name'], at['version'], swf_response['input'], decision)
         except KeyboardInterrupt:
             pass
 
 
+def _pool_size(pollers, workers, processes):
+    """The connections needed by a worker; None for the single thread loop.
+
+    Each poller and each worker thread can make a call at the same time. The
+    responses of the worker processes are sent from a single thread.
+    """
+    if pollers is None:
+        return None
+    return pollers + 1 if processes else pollers + workers
+
+
 def default_identity():
     """Generate a local identity string for this process."""
     identity = "%s-%s" % (socket.getfqdn(), os.getpid())
     return identity[-IDENTITY_SIZE:]    # keep the most important part
 
 
-def poll_decision(swf_client, domain, task_list, identity=None):
+def poll_activity(swf_client, domain, task_list, identity=None,
+                  should_stop=None):
+    """Poll until an activity task is received or should_stop returns True.
+
+    :type swf_client: :class:`SWFClient`
+    :param swf_client: an implementation or duck typing of :class:`SWFClient`
+    :param domain: the domain containing the task list to poll
+    :param task_list: the task list from which to poll activities
+    :param identity: an identity str of the request maker
+    :param should_stop: an optional callable checked between the polls that
+        return no task; return True to stop polling
+
+    :rtype: dict
+    :returns: the activity task or None if the polling was stopped
+    """
+    swf_response = {}
+    errors = 0
+    while not swf_response.get('taskToken'):
+        if should_stop is not None and should_stop():
+            return None
+        try:
+            swf_response = swf_client.poll_for_activity_task(
+                domain, task_list, identity=identity)
+            errors = 0
+        except ClientError:
+            logger.exception('Error while polling for activities:')
+            time.sleep(backoff_delay(errors, *POLL_ERROR_BACKOFF))
+            errors += 1
+    return swf_response
+
+
+def poll_decision(swf_client, domain, task_list, identity=None,
+                  history_cache=None, should_stop=None):
     """Poll a decision and create a SWFWorkflowContext structure.
 
+    If a history cache is used, the pages are loaded in reverse order and
+    the paging stops as soon as an event that was already parsed is reached.
+
     :type swf_client: :class:`SWFClient`
     :param swf_client: an implementation or duck typing of :class:`SWFClient`
     :param domain: the domain containing the task list to poll
     :param task_list: the task list from which to poll decision
     :param identity: an identity str of the request maker
+    :type history_cache: :class:`HistoryCache`
+    :param history_cache: an optional cache of parsed execution histories
+    :param should_stop: an optional callable checked between the polls that
+        return no decision; return True to stop polling
 
     :rtype: tuple
     :returns: a tuple consisting of (name, version, input_data,
-        :class:'SWFExecutionHistory', :class:`SWFWorkflowDecision`)
+        :class:'SWFExecutionHistory', :class:`SWFWorkflowDecision`) or None
+        if the polling was stopped
     """
-    first_page = poll_first_page(swf_client, domain, task_list, identity)
+    reverse_order = history_cache is not None
+    first_page = poll_first_page(swf_client, domain, task_list, identity,
+                                 reverse_order=reverse_order,
+                                 should_stop=should_stop)
+    if first_page is None:
+        return None
+    polled_at = time.time()
     token = first_page['taskToken']
-    all_events = events(swf_client, domain, task_list, first_page, identity)
-    # Sometimes the first event is on the second page,
-    # and the first page is empty
-    first_event = next(all_events)
-    assert first_event['eventType'] == 'WorkflowExecutionStarted'
-    wesea = 'workflowExecutionStartedEventAttributes'
-    assert first_event[wesea]['taskList']['name'] == task_list
-    task_duration = first_event[wesea]['taskStartToCloseTimeout']
-    workflow_duration = first_event[wesea]['executionStartToCloseTimeout']
-    tags = first_event[wesea].get('tagList', None)
-    child_policy = first_event[wesea]['childPolicy']
-    name = first_event[wesea]['workflowType']['name']
-    version = first_event[wesea]['workflowType']['version']
-    input_data = first_event[wesea]['input']
     try:
-        running, timedout, results, errors, order = load_events(all_events)
+        if history_cache is None:
+            state = ExecutionState()
+            state.load(events(swf_client, domain, task_list, first_page,
+                              identity))
+        else:
+            state = load_cached_events(history_cache, swf_client, domain,
+                                       task_list, first_page, identity)
     except _PaginationError:
         # There's nothing better to do than to retry
-        return poll_decision(swf_client, domain, task_list, identity)
-    execution_history = SWFExecutionHistory(running, timedout, results, errors, order)
+        return poll_decision(swf_client, domain, task_list, identity,
+                             history_cache, should_stop)
+    wesea = state.started
+    assert wesea is not None, 'WorkflowExecutionStarted event not found.'
+    assert wesea['taskList']['name'] == task_list
+    task_duration = wesea['taskStartToCloseTimeout']
+    workflow_duration = wesea['executionStartToCloseTimeout']
+    tags = wesea.get('tagList', None)
+    child_policy = wesea['childPolicy']
+    name = wesea['workflowType']['name']
+    version = wesea['workflowType']['version']
+    input_data = wesea['input']
     decision = SWFWorkflowDecision(swf_client, token, name, version, task_list,
                                    task_duration, workflow_duration, tags,
-                                   child_policy)
-    return name, version, input_data, execution_history, decision
+                                   child_policy,
+                                   task_deadline(task_duration, polled_at))
+    return name, version, input_data, state.history.view(), decision
 
 
-def poll_first_page(swf_client, domain, task_list, identity=None):
+def poll_first_page(swf_client, domain, task_list, identity=None,
+                    reverse_order=False, should_stop=None):
     """Return the response from loading the first page. In case of errors,
-    empty responses or whatnot retry until a valid response.
+    empty responses or whatnot retry until a valid response or until
+    should_stop, if set, returns True. In the latter case return None.
 
     :type swf_client: :class:`SWFClient`
     :param swf_client: an implementation or duck typing of :class:`SWFClient`
     :param domain: the domain containing the task list to poll
     :param task_list: the task list from which to poll for events
     :param identity: an identity str of the request maker
+    :param reverse_order: load the events starting with the most recent one
+    :param should_stop: an optional callable, return True to stop polling
 
     :rtype: dict[str, str|int|list|dict]
     :returns: a dict containing workflow information and list of events
     """
     swf_response = {}
+    errors = 0
     while not swf_response.get('taskToken'):
+        if should_stop is not None and should_stop():
+            return None
         try:
-            swf_response = swf_client.poll_for_decision_task(domain, task_list,
-                                                             identity=identity)
+            swf_response = swf_client.poll_for_decision_task(
+                domain, task_list, identity=identity,
+                reverse_order=reverse_order)
+            errors = 0
         except ClientError:
             logger.exception('Error while polling for decisions:')
+            time.sleep(backoff_delay(errors, *POLL_ERROR_BACKOFF))
+            errors += 1
     return swf_response
 
 
-def poll_page(swf_client, domain, task_list, token, identity=None):
+def poll_page(swf_client, domain, task_list, token, identity=None,
+              reverse_order=False):
     """Return a specific page. In case of errors retry a number of times.
 
     :type swf_client: :class:`SWFClient`
@@ -219,25 +438,32 @@ def poll_page(swf_client, domain, task_list, token, identity=None):
     :param task_list: the task list from which to poll for events
     :param token: the token string for the requested page
     :param identity: an identity str of the request maker
+    :param reverse_order: must be the same value used for the first page
 
     :rtype: dict[str, str|int|list|dict]
     :returns: a dict containing workflow information and list of events
     """
-    for _ in range(7):  # give up after a limited number of retries
+    for attempt in range(7):  # give up after a limited number of retries
         try:
             swf_response = swf_client.poll_for_decision_task(
-                domain, task_list, identity=identity, next_page_token=token)
+                domain, task_list, identity=identity, next_page_token=token,
+                reverse_order=reverse_order)
             break
         except ClientError:
             logger.exception('Error while polling for decision page:')
+            time.sleep(backoff_delay(attempt, *POLL_ERROR_BACKOFF))
     else:
         raise _PaginationError()
     return swf_response
 
 
-def events(swf_client, domain, task_list, first_page, identity=None):
+def events(swf_client, domain, task_list, first_page, identity=None,
+           reverse_order=False):
     """Load pages one by one and generate all events found.
 
+    The next page is loaded only when all the events on the current page were
+    consumed, so breaking early from the iteration stops the paging.
+
     :type swf_client: :class:`SWFClient`
     :param swf_client: an implementation or duck typing of :class:`SWFClient`
     :param domain: the domain containing the task list to poll
@@ -245,6 +471,7 @@ def events(swf_client, domain, task_list, first_page, identity=None):
     :param first_page: the page dict structure from which to start generating
         the events, usually the response from :func:`poll_first_page`
     :param identity: an identity str of the request maker
+    :param reverse_order: must be the same value used for the first page
 
     :rtype: collections.Iterator[dict[str, int|str|dict[str, int|str|dict]]
     :returns: iterator over all of the events
@@ -256,97 +483,495 @@ def events(swf_client, domain, task_list, first_page, identity=None):
         if not page.get('nextPageToken'):
             break
         page = poll_page(swf_client, domain, task_list, page['nextPageToken'],
-                         identity=identity)
+                         identity=identity, reverse_order=reverse_order)
+
 
+def load_cached_events(history_cache, swf_client, domain, task_list,
+                       first_page, identity=None):
+    """Update the cached state of an execution with the new events only.
 
-def load_events(event_iter):
-    """Combine all events in their order.
+    The first page must be loaded in reverse order. The pages are consumed
+    until an event older than the last one in the cached state is found. If
+    there is no cached state, or the cached event can't be found, the entire
+    history is loaded and parsed.
 
-    This returns a tuple of the following things:
-        running  - a set of the ids of running tasks
-        timedout - a set of the ids of tasks that have timedout
-        results  - a dictionary of id -> result for each finished task
-        errors   - a dictionary of id -> error message for each failed task
-        order    - an list of task ids in the order they finished
+    :type history_cache: :class:`HistoryCache`
+    :param history_cache: the cache holding the :class:`ExecutionState`
+        objects of the executions seen so far
+    :type swf_client: :class:`SWFClient`
+    :param swf_client: an implementation or duck typing of :class:`SWFClient`
+    :param domain: the domain containing the task list to poll
+    :param task_list: the task list from which to poll for events
+    :param first_page: the reverse ordered first page
+    :param identity: an identity str of the request maker
+
+    The state is taken out of the cache while the new events are loaded, so
+    no other poller can load events into it at the same time. The history is
+    append-only and the decisions get views of it, so a decision that timed
+    out can keep replaying its view in another thread while the state is
+    updated.
+
+    :rtype: :class:`ExecutionState`
+    :returns: the updated state, also stored in the cache
+    """
+    w_exec = first_page['workflowExecution']
+    key = (w_exec['workflowId'], w_exec['runId'])
+    state = history_cache.pop(key)
+    last_event_id = state.last_event_id if state is not None else 0
+    new_events = []
+    for event in events(swf_client, domain, task_list, first_page, identity,
+                        reverse_order=True):
+        if event['eventId'] <= last_event_id:
+            break
+        new_events.append(event)
+    else:
+        state = None
+    if state is None:
+        state = ExecutionState()
+    new_events.reverse()
+    # Put back only fully updated states, if the parsing fails it's dropped
+    state.load(new_events)
+    history_cache.put(key, state)
+    return state
+
+
+class ExecutionState(object):
+    """The parsed history of a workflow execution.
+
+    The events can be loaded incrementally, in multiple steps, as long as they
+    are loaded in their order and each event is loaded only once. The history
+    is a :class:`VersionedSWFExecutionHistory`; the views made before loading
+    more events don't see them.
+    """
+
+    def __init__(self):
+        self.history = VersionedSWFExecutionHistory()
+        self.event2call = {}
+        self.started = None  # the WorkflowExecutionStarted attributes
+        self.last_event_id = 0
+
+    def load(self, event_iter):
+        """Update the state with the events from event_iter."""
+        history = self.history
+        event2call = self.event2call
+        for event in event_iter:
+            self.last_event_id = max(self.last_event_id,
+                                     event.get('eventId', 0))
+            e_type = event.get('eventType')
+            if e_type == 'WorkflowExecutionStarted':
+                self.started = event['workflowExecutionStartedEventAttributes']
+            elif e_type == 'ActivityTaskScheduled':
+                attrs = event['activityTaskScheduledEventAttributes']
+                eid = attrs['activityId']
+                event2call[event['eventId']] = eid
+                history.set_running(eid)
+            elif e_type == 'ActivityTaskCompleted':
+                atcea = 'activityTaskCompletedEventAttributes'
+                eid = event2call[event[atcea]['scheduledEventId']]
+                history.set_result(eid, event[atcea]['result'])
+            elif e_type == 'ActivityTaskFailed':
+                atfea = 'activityTaskFailedEventAttributes'
+                eid = event2call[event[atfea]['scheduledEventId']]
+                history.set_error(eid, event[atfea]['reason'])
+            elif e_type == 'ActivityTaskTimedOut':
+                attoea = 'activityTaskTimedOutEventAttributes'
+                eid = event2call[event[attoea]['scheduledEventId']]
+                history.set_timeout(eid)
+            elif e_type == 'ScheduleActivityTaskFailed':
+                satfea = 'scheduleActivityTaskFailedEventAttributes'
+                eid = event[satfea]['activityId']
+                # when a job is not found it's not even started
+                history.set_error(eid, event[satfea]['cause'])
+            elif e_type == 'StartChildWorkflowExecutionInitiated':
+                scweiea = 'startChildWorkflowExecutionInitiatedEventAttributes'
+                eid = _subworkflow_call_key(event[scweiea]['workflowId'])
+                history.set_running(eid)
+            elif e_type == 'ChildWorkflowExecutionCompleted':
+                cwecea = 'childWorkflowExecutionCompletedEventAttributes'
+                eid = _subworkflow_call_key(
+                    event[cwecea]['workflowExecution']['workflowId'])
+                history.set_result(eid, event[cwecea]['result'])
+            elif e_type == 'ChildWorkflowExecutionFailed':
+                cwefea = 'childWorkflowExecutionFailedEventAttributes'
+                eid = _subworkflow_call_key(
+                    event[cwefea]['workflowExecution']['workflowId'])
+                history.set_error(eid, event[cwefea]['reason'])
+            elif e_type == 'ChildWorkflowExecutionTimedOut':
+                cwetoea = 'childWorkflowExecutionTimedOutEventAttributes'
+                eid = _subworkflow_call_key(
+                    event[cwetoea]['workflowExecution']['workflowId'])
+                history.set_timeout(eid)
+            elif e_type == 'StartChildWorkflowExecutionFailed':
+                scwefea = 'startChildWorkflowExecutionFailedEventAttributes'
+                eid = _subworkflow_call_key(event[scwefea]['workflowId'])
+                history.set_error(eid, event[scwefea]['cause'])
+            elif e_type == 'TimerStarted':
+                history.set_timer_running(
+                    event['timerStartedEventAttributes']['timerId'])
+            elif e_type == 'TimerFired':
+                history.set_timer_fired(
+                    event['timerFiredEventAttributes']['timerId'])
+
+
+class HistoryCache(object):
+    """A LRU cache of parsed execution histories.
+
+    The keys are (workflowId, runId) tuples and the values are
+    :class:`ExecutionState` objects.
+    """
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()  # the cache is shared by the pollers
+
+    def get(self, key):
+        """Return the cached value or None, marking it as recently used."""
+        with self.lock:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                return None
+            self.entries[key] = value
+            return value
+
+    def pop(self, key):
+        """Remove and return the cached value or None."""
+        with self.lock:
+            return self.entries.pop(key, None)
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class RegistrationCache(object):
+    """A file with the remote registrations verified in the last ttl seconds.
+
+    The file is shared by the workers on the same host, so they don't check
+    the same registrations on every restart. It only stores digests of the
+    keys and their expiration times. Any errors while reading or writing the
+    file are logged and ignored; the registrations are checked again.
     """
-    running, timedout = set(), set()
-    results, errors = {}, {}
-    order = []
-    event2call = {}
-    for event in event_iter:
-        e_type = event.get('eventType')
-        if e_type == 'ActivityTaskScheduled':
-            eid = event['activityTaskScheduledEventAttributes']['activityId']
-            event2call[event['eventId']] = eid
-            running.add(eid)
-        elif e_type == 'ActivityTaskCompleted':
-            atcea = 'activityTaskCompletedEventAttributes'
-            eid = event2call[event[atcea]['scheduledEventId']]
-            result = event[atcea]['result']
-            running.remove(eid)
-            results[eid] = result
-            order.append(eid)
-        elif e_type == 'ActivityTaskFailed':
-            atfea = 'activityTaskFailedEventAttributes'
-            eid = event2call[event[atfea]['scheduledEventId']]
-            reason = event[atfea]['reason']
-            running.remove(eid)
-            errors[eid] = reason
-            order.append(eid)
-        elif e_type == 'ActivityTaskTimedOut':
-            attoea = 'activityTaskTimedOutEventAttributes'
-            eid = event2call[event[attoea]['scheduledEventId']]
-            running.remove(eid)
-            timedout.add(eid)
-            order.append(eid)
-        elif e_type == 'ScheduleActivityTaskFailed':
-            satfea = 'scheduleActivityTaskFailedEventAttributes'
-            eid = event[satfea]['activityId']
-            reason = event[satfea]['cause']
-            # when a job is not found it's not even started
-            errors[eid] = reason
-            order.append(eid)
-        elif e_type == 'StartChildWorkflowExecutionInitiated':
-            scweiea = 'startChildWorkflowExecutionInitiatedEventAttributes'
-            eid = _subworkflow_call_key(event[scweiea]['workflowId'])
-            running.add(eid)
-        elif e_type == 'ChildWorkflowExecutionCompleted':
-            cwecea = 'childWorkflowExecutionCompletedEventAttributes'
-            eid = _subworkflow_call_key(
-                event[cwecea]['workflowExecution']['workflowId'])
-            result = event[cwecea]['result']
-            running.remove(eid)
-            results[eid] = result
-            order.append(eid)
-        elif e_type == 'ChildWorkflowExecutionFailed':
-            cwefea = 'childWorkflowExecutionFailedEventAttributes'
-            eid = _subworkflow_call_key(
-                event[cwefea]['workflowExecution']['workflowId'])
-            reason = event[cwefea]['reason']
-            running.remove(eid)
-            errors[eid] = reason
-            order.append(eid)
-        elif e_type == 'ChildWorkflowExecutionTimedOut':
-            cwetoea = 'childWorkflowExecutionTimedOutEventAttributes'
-            eid = _subworkflow_call_key(
-                event[cwetoea]['workflowExecution']['workflowId'])
-            running.remove(eid)
-            timedout.add(eid)
-            order.append(eid)
-        elif e_type == 'StartChildWorkflowExecutionFailed':
-            scwefea = 'startChildWorkflowExecutionFailedEventAttributes'
-            eid = _subworkflow_call_key(event[scwefea]['workflowId'])
-            reason = event[scwefea]['cause']
-            errors[eid] = reason
-            order.append(eid)
-        elif e_type == 'TimerStarted':
-            eid = event['timerStartedEventAttributes']['timerId']
-            running.add(eid)
-        elif e_type == 'TimerFired':
-            eid = event['timerFiredEventAttributes']['timerId']
-            running.remove(eid)
-            results[eid] = None
-    return running, timedout, results, errors, order
+
+    def __init__(self, path=None, ttl=3600):
+        if path is None:
+            cache_dir = os.environ.get('XDG_CACHE_HOME',
+                                       os.path.expanduser('~/.cache'))
+            path = os.path.join(cache_dir, 'flowy', 'registrations.json')
+        self.path = path
+        self.ttl = ttl
+        self.entries = None
+        self.lock = threading.Lock()
+
+    def verified(self, key):
+        """Check if the registration with key was verified recently."""
+        with self.lock:
+            if self.entries is None:
+                self.entries = self.load()
+            return self.entries.get(_digest(key), 0) > time.time()
+
+    def add(self, key):
+        with self.lock:
+            if self.entries is None:
+                self.entries = self.load()
+            self.entries[_digest(key)] = time.time() + self.ttl
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        now = time.time()
+        return dict((k, v) for k, v in entries.items() if v > now)
+
+    def save(self):
+        """Write the entries, merged with the ones added by other workers."""
+        with self.lock:
+            entries = self.load()
+            entries.update(self.entries or {})
+            try:
+                cache_dir = os.path.dirname(self.path)
+                if not os.path.isdir(cache_dir):
+                    os.makedirs(cache_dir)
+                fd, tmp_path = tempfile.mkstemp(dir=cache_dir,
+                                                prefix='.registrations')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(entries, f)
+                getattr(os, 'replace', os.rename)(tmp_path, self.path)
+            except (IOError, OSError):
+                logger.exception('Error while saving the registration cache:')
+            self.entries = entries
+
+
+def _digest(key):
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _registration_key(remote_reg_callback, domain):
+    """The cache key of a registration callback, if it has one."""
+    cache_key = getattr(remote_reg_callback, 'cache_key', None)
+    if cache_key is None:
+        return None
+    try:
+        return cache_key(domain)
+    except ValueError:  # the registration raises it too
+        return None
+
+
+class WorkerPool(object):
+    """Poll tasks with multiple threads and run them on a pool of workers.
+
+    Each poller thread waits for a free worker slot, polls a task and submits
+    it to the pool. The slot is released only after the task was run and its
+    response was sent, so there are never more tasks in hand than workers to
+    run them; the rest are left in SWF for other hosts to pick up.
+
+    The workers are threads or, if processes is set, processes. The process
+    pool relies on fork to make the registry available in the worker
+    processes, and the pool is started before the pollers so the fork happens
+    while the process is still single threaded.
+
+    On KeyboardInterrupt, or when the worker break_loop returns True, the
+    pollers stop after their current poll. The tasks already in hand are run
+    and responded to before :meth:`run` returns.
+
+    The tasks are polled by calling poll, without arguments, which returns
+    the task or None if the polling was stopped. A polled task is passed to
+    submit, with the executor, which must submit it and call
+    :meth:`task_done` when it's finished.
+    """
+
+    def __init__(self, worker, swf_client, domain, task_list, poll, submit,
+                 identity=None, pollers=1, workers=1, processes=False):
+        if pollers < 1 or workers < 1:
+            raise ValueError('At least one poller and one worker are needed.')
+        self.worker = worker
+        self.swf_client = swf_client
+        self.domain = domain
+        self.task_list = task_list
+        self.poll = poll
+        self.submit = submit
+        self.identity = identity
+        self.pollers = pollers
+        self.workers = workers
+        self.processes = processes
+        self.slots = threading.Semaphore(workers)
+        self.stop_event = threading.Event()
+
+    def run(self):
+        """Run the pollers and the workers until stopped."""
+        executor = self.make_executor()
+        threads = []
+        for i in range(self.pollers):
+            t = threading.Thread(target=self.poll_loop, args=(executor, ),
+                                 name='flowy-poller-%s' % i)
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        try:
+            for t in threads:
+                # Join with a timeout to still receive KeyboardInterrupt
+                while t.is_alive():
+                    t.join(1)
+        except KeyboardInterrupt:
+            self.stop_event.set()
+            for t in threads:
+                t.join()
+        finally:
+            self.stop_event.set()
+            executor.shutdown(wait=True)
+            _process_pools.pop(id(self), None)
+
+    def should_stop(self):
+        return self.stop_event.is_set() or self.worker.break_loop()
+
+    def make_executor(self):
+        if not self.processes:
+            return ThreadPoolExecutor(max_workers=self.workers)
+        # The worker processes find the pool in this module after fork
+        _process_pools[id(self)] = self
+        try:
+            context = multiprocessing.get_context('fork')
+            executor = ProcessPoolExecutor(max_workers=self.workers,
+                                           mp_context=context)
+        except (AttributeError, TypeError):  # python 2 always forks
+            executor = ProcessPoolExecutor(max_workers=self.workers)
+        # Start all the processes now, before the poller threads
+        list(executor.map(abs, range(self.workers)))
+        return executor
+
+    def poll_loop(self, executor):
+        while not self.should_stop():
+            self.slots.acquire()
+            try:
+                polled = self.poll()
+            except Exception:
+                logger.exception('Error while polling:')
+                self.slots.release()
+                continue
+            if polled is None:
+                self.slots.release()
+                break
+            try:
+                self.submit(executor, polled)
+            except Exception:
+                logger.exception('Error while submitting the task:')
+                self.slots.release()
+
+    def task_done(self, future, respond=None):
+        """Release the slot of a task, sending the recorded responses first.
+
+        The tasks run in processes record their responses, which are sent
+        here, using the shared SWF client.
+        """
+        try:
+            responses = future.result()
+            if respond is not None:
+                for method, args, kwargs in responses or ():
+                    respond(method, args, kwargs)
+        except Exception:
+            logger.exception('Error while running the task:')
+        finally:
+            self.slots.release()
+
+    def respond(self, method, args, kwargs, deadline=None):
+        send_response(getattr(self.swf_client, method), args, kwargs,
+                      deadline)
+
+
+class DecisionPool(WorkerPool):
+    """A :class:`WorkerPool` for decisions.
+
+    The decisions run in a process are recorded there and their response is
+    sent by the parent process. Processes make sense only for CPU heavy
+    workflows: the execution history of every decision is pickled and sent
+    to the worker process, cached or not.
+    """
+
+    def __init__(self, worker, swf_client, domain, task_list, identity=None,
+                 history_cache=None, pollers=1, workers=1, processes=False):
+        super(DecisionPool, self).__init__(worker, swf_client, domain,
+                                           task_list, self.poll_decision,
+                                           self.submit_decision, identity,
+                                           pollers, workers, processes)
+        self.history_cache = history_cache
+
+    def poll_decision(self):
+        return poll_decision(self.swf_client, self.domain, self.task_list,
+                             self.identity, self.history_cache,
+                             should_stop=self.should_stop)
+
+    def submit_decision(self, executor, polled):
+        name, version, input_data, exec_history, decision = polled
+        if not self.processes:
+            f = executor.submit(self.worker, name, version, input_data,
+                                decision, exec_history)
+            f.add_done_callback(self.task_done)
+            return
+        decision.swf_client = _ResponseRecorder()
+        f = executor.submit(_run_recorded_decision, id(self), name, version,
+                            input_data, decision, exec_history)
+        respond = functools.partial(self.respond, deadline=decision.deadline)
+        f.add_done_callback(lambda f: self.task_done(f, respond))
+
+
+class ActivityPool(WorkerPool):
+    """A :class:`WorkerPool` for activities.
+
+    The responses are sent by the workers as soon as each activity finishes.
+    The activities run in a process send their heartbeats with a client made
+    by swf_client_factory, once per process, and record their response, which
+    is then sent by the parent process.
+    """
+
+    def __init__(self, worker, swf_client, domain, task_list, identity=None,
+                 pollers=1, workers=1, processes=False,
+                 swf_client_factory=None):
+        super(ActivityPool, self).__init__(worker, swf_client, domain,
+                                           task_list, self.poll_activity,
+                                           self.submit_activity, identity,
+                                           pollers, workers, processes)
+        self.swf_client_factory = swf_client_factory or get_swf_client
+
+    def poll_activity(self):
+        return poll_activity(self.swf_client, self.domain, self.task_list,
+                             self.identity, should_stop=self.should_stop)
+
+    def submit_activity(self, executor, polled):
+        at = polled['activityType']
+        token = polled['taskToken']
+        deadline = self.worker.task_deadline(at['name'], at['version'])
+        if not self.processes:
+            decision = SWFActivityDecision(self.swf_client, token, deadline)
+            f = executor.submit(self.worker, at['name'], at['version'],
+                                polled['input'], decision)
+            f.add_done_callback(self.task_done)
+            return
+        f = executor.submit(_run_recorded_activity, id(self), at['name'],
+                            at['version'], polled['input'], token)
+        respond = functools.partial(self.respond, deadline=deadline)
+        f.add_done_callback(lambda f: self.task_done(f, respond))
+
+
+_process_pools = {}  # id(WorkerPool) -> WorkerPool, for the pool processes
+_process_swf_client = None  # created on demand in the activity processes
+
+
+def _run_recorded_decision(pool_id, name, version, input_data, decision,
+                           exec_history):
+    """Run a decision in a pool process and return the recorded responses."""
+    _process_pools[pool_id].worker(name, version, input_data, decision,
+                                   exec_history)
+    return decision.swf_client.responses
+
+
+def _run_recorded_activity(pool_id, name, version, input_data, token):
+    """Run an activity in a pool process and return the recorded responses."""
+    pool = _process_pools[pool_id]
+    recorder = _ResponseRecorder(pool.swf_client_factory)
+    pool.worker(name, version, input_data,
+                SWFActivityDecision(recorder, token))
+    return recorder.responses
+
+
+class _ResponseRecorder(object):
+    """Stands in for the SWF client of a task run in a pool process.
+
+    The responses are recorded, to be sent by the parent process, and the
+    heartbeats are sent right away with a client local to the process.
+    """
+
+    def __init__(self, swf_client_factory=None):
+        self.swf_client_factory = swf_client_factory
+        self.responses = []
+
+    def respond_decision_task_completed(self, *args, **kwargs):
+        self.responses.append(('respond_decision_task_completed', args, kwargs))
+
+    def respond_activity_task_completed(self, *args, **kwargs):
+        self.responses.append(('respond_activity_task_completed', args, kwargs))
+
+    def respond_activity_task_failed(self, *args, **kwargs):
+        self.responses.append(('respond_activity_task_failed', args, kwargs))
+
+    def record_activity_task_heartbeat(self, *args, **kwargs):
+        global _process_swf_client
+        if _process_swf_client is None:
+            _process_swf_client = self.swf_client_factory()
+        return _process_swf_client.record_activity_task_heartbeat(*args,
+                                                                  **kwargs)
 
 
 class _PaginationError(Exception):
@@ -1,7 +1,4 @@
-import copy
-import tempfile
 import warnings
-import webbrowser
 
 from flowy.operations import first
 from flowy.proxy import Proxy
@@ -12,7 +9,7 @@ from flowy.utils import logger
 from flowy.utils import short_repr
 
 
-__all__ = ['TracingProxy', 'ExecutionTracer']
+__all__ = ['TracingProxy', 'ExecutionTracer', 'TraceState']
 
 
 # XXX: Trace dependencies even if data structures containing result proxies are used
@@ -48,16 +45,110 @@ class TracingProxy(Proxy):
             error_factory = err.__factory__
             self.tracer.error(node_id, str(error_factory.value))
         for dep in results or []:
-            self.tracer.add_dependency(dep.__factory__.node_id, node_id)
+            # The results of untraced proxies, like BatchProxy, have no node
+            dep_node_id = getattr(dep.__factory__, 'node_id', None)
+            if dep_node_id is not None:
+                self.tracer.add_dependency(dep_node_id, node_id)
         return r
 
 
 class ExecutionTracer(object):
-    """Record the execution history for display and analysis."""
+    """Record the execution history for display and analysis.
+
+    The tracer calls are appended to a log and only replayed, into a
+    :class:`TraceState`, when the execution is rendered. A copy shares the
+    log recorded so far with the original tracer, so it's made in constant
+    time, and the calls made on either of them are not seen by the other.
+    """
 
     def __init__(self):
         self.reset()
 
+    def schedule_activity(self, node_id, name):
+        self.log.append(('schedule_activity', node_id, name))
+
+    def schedule_workflow(self, node_id, name):
+        self.log.append(('schedule_workflow', node_id, name))
+
+    def flush_scheduled(self):
+        self.log.append(('flush_scheduled',))
+
+    def result(self, node_id, result):
+        self.log.append(('result', node_id, result))
+
+    def error(self, node_id, reason):
+        self.log.append(('error', node_id, reason))
+
+    def timeout(self, node_id):
+        self.log.append(('timeout', node_id))
+
+    def add_dependency(self, from_node, to_node):
+        """ node_id -> node_id """
+        self.log.append(('add_dependency', from_node, to_node))
+
+    def copy(self):
+        et = ExecutionTracer()
+        # The log is only appended to, the copy sees a prefix of it
+        et.shared = (self.shared, self.log, len(self.log))
+        return et
+
+    def reset(self):
+        self.shared = None  # (shared, log, length) of the copied tracer
+        self.log = []
+
+    def calls(self):
+        """All the recorded calls, in order."""
+        prefixes = []
+        shared = self.shared
+        while shared is not None:
+            shared, log, length = shared
+            prefixes.append((log, length))
+        calls = []
+        for log, length in reversed(prefixes):
+            calls.extend(log[:length])
+        calls.extend(self.log)
+        return calls
+
+    def state(self):
+        """Replay the recorded calls into a new :class:`TraceState`."""
+        state = TraceState()
+        for call in self.calls():
+            getattr(state, call[0])(*call[1:])
+        return state
+
+    def __getstate__(self):
+        return {'shared': None, 'log': self.calls()}
+
+    def to_dot(self):
+        """Render the dot for the recorded execution."""
+        return self.state().to_dot()
+
+    def display(self):
+        """Create a temp file and render the dot in it."""
+        graph = self.to_dot()
+        if not graph:
+            return
+        import tempfile
+        import webbrowser
+        tf = tempfile.NamedTemporaryFile(mode='w+b', prefix='dot_', suffix='.svg', delete=False)
+        graph.draw(tf.name, format='svg', prog='dot')
+        logger.info('Workflow execution traced: %s', tf.name)
+        webbrowser.open(tf.name)
+
+
+class TraceState(object):
+    """The execution recorded by an :class:`ExecutionTracer`."""
+
+    def __init__(self):
+        self.levels = []
+        self.current_schedule = []
+        self.timeouts = {}
+        self.results = {}
+        self.errors = {}
+        self.activities = set()
+        self.deps = {}
+        self.nodes = {}
+
     def schedule_activity(self, node_id, name):
         assert node_id not in self.nodes
         self.nodes[node_id] = name
@@ -93,24 +184,8 @@ class ExecutionTracer(object):
         self.timeouts[node_id] += 1
 
     def add_dependency(self, from_node, to_node):
-        """ node_id -> node_id """
         self.deps.setdefault(from_node, []).append(to_node)
 
-    def copy(self):
-        et = ExecutionTracer()
-        et.__dict__ = copy.deepcopy(self.__dict__)
-        return et
-
-    def reset(self):
-        self.levels = []
-        self.current_schedule = []
-        self.timeouts = {}
-        self.results = {}
-        self.errors = {}
-        self.activities = set()
-        self.deps = {}
-        self.nodes = {}
-
     def to_dot(self):
         """Render the dot for the recorded execution."""
         try:
@@ -188,13 +263,3 @@ class ExecutionTracer(object):
                                fontcolor='orange', fontsize=8)
 
         return graph
-
-    def display(self):
-        """Create a temp file and render the dot in it."""
-        graph = self.to_dot()
-        if not graph:
-            return
-        tf = tempfile.NamedTemporaryFile(mode='w+b', prefix='dot_', suffix='.svg', delete=False)
-        graph.draw(tf.name, format='svg', prog='dot')
-        logger.info('Workflow execution traced: %s', tf.name)
-        webbrowser.open(tf.name)
@@ -1,3 +1,5 @@
+import contextlib
+
 import venusian
 
 from flowy.config import Restart
@@ -44,13 +46,33 @@ class Worker(object):
             * finish(e) - ignore pending actions, complete the execution
             * restart(serialized_input) - ignore pending actions, restart the execution
         """
+        wrapped_func = self.lookup(key)
+        if wrapped_func is None:
+            return  # Let it timeout
+        with self.dispatch(decision) as finish:
+            finish(wrapped_func(input_data, *extra_args))
+
+    def lookup(self, key):
+        """Return the wrapped func registered with key or None."""
         try:
-            wrapped_func = self.registry[key]
+            return self.registry[key]
         except KeyError:
             logger.error("Colud not find implementation for key: %r", (key,))
-            return  # Let it timeout
+            return None
+
+    @contextlib.contextmanager
+    def dispatch(self, decision):
+        """Dispatch the outcome of running a task to the decision object.
+
+        The context yields a callable that must be called with the serialized
+        result. If an exception is raised instead, the decision is flushed,
+        failed or restarted, as described in :meth:`__call__`. This allows
+        running the task in different ways, like awaiting it, with the same
+        dispatch logic.
+        """
+        serialized_result = []
         try:
-            serialized_result = wrapped_func(input_data, *extra_args)
+            yield serialized_result.append
         except SuspendTask:  # only from workflows
             decision.flush()
         except TaskError as e:  # only from workflows
@@ -62,7 +84,7 @@ class Worker(object):
             logger.exception('Unhandled exception in task:')
             decision.fail(e)
         else:
-            decision.finish(serialized_result)
+            decision.finish(serialized_result[0])
 
     def scan(self, categories=None, package=None, ignore=None, level=0):
         """Scan for registered implementations and their configs.
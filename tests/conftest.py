@@ -0,0 +1,6 @@
+import sys
+
+collect_ignore = []
+if sys.version_info < (3, 5):
+    # Coroutine activities need the async syntax
+    collect_ignore.append('test_swf_aio.py')
@@ -5,6 +5,7 @@ from functools import partial
 
 from flowy import LocalWorkflow
 from flowy import TaskError
+from flowy import parallel_map
 from flowy import parallel_reduce
 from flowy import restart
 
@@ -42,6 +43,25 @@ class W(object):
         return parallel_reduce(self.r, map(self.m, range(n + 1)))
 
 
+class WM(object):
+    def __init__(self, m):
+        self.m = m
+
+    def __call__(self, n, window):
+        return sum(parallel_map(self.m, range(n + 1), window=window))
+
+
+class WMF(object):
+    """Call the parallel_map proxy again after the map."""
+    def __init__(self, m):
+        self.m = m
+
+    def __call__(self, n, window):
+        results = parallel_map(self.m, range(n + 1), window=window)
+        last = self.m(99)
+        return [sum(results), last]
+
+
 class F(object):
     def __init__(self, task):
         self.task = task
@@ -117,6 +137,34 @@ class TestLocalWorkflow(unittest.TestCase):
         result = main.run(8, r=True, _wait=True)
         self.assertEquals(result, 165)
 
+    def test_parallel_map(self):
+        main = LocalWorkflow(WM, executor=ThreadPoolExecutor)
+        main.conf_activity('m', tactivity)
+        result = main.run(8, 3, _wait=True)
+        self.assertEquals(result, 45)
+
+    def test_parallel_map_follow_up_call(self):
+        main = LocalWorkflow(WMF, executor=ThreadPoolExecutor)
+        main.conf_activity('m', tactivity)
+        self.assertEqual(main.run(8, 2, _wait=True), [45, 100])
+
+    def test_parallel_map_follow_up_batch(self):
+        main = LocalWorkflow(WMF, executor=ThreadPoolExecutor)
+        main.conf_activity('m', tactivity, batch_size=2)
+        self.assertEqual(main.run(8, 2, _wait=True), [45, 100])
+
+    def test_batched_activities(self):
+        main = LocalWorkflow(W)
+        main.conf_activity('m', tactivity, batch_size=4)
+        main.conf_activity('r', tactivity, batch_size=4)
+        result = main.run(8, r=True, _wait=True)
+        self.assertEquals(result, 45)
+
+    def test_batched_activity_errors(self):
+        main = LocalWorkflow(F)
+        main.conf_activity('task', tactivity, batch_size=4)
+        self.assertRaises(TaskError, lambda: main.run(_wait=True))
+
     def test_fail_activity(self):
         main = LocalWorkflow(F)
         main.conf_activity('task', tactivity)
@@ -184,6 +232,466 @@ def make_t(wf_name, wf):
     return test
 
 
+class CountingWorkflow(LocalWorkflow):
+    """Count the workflow replays."""
+    def __init__(self, *args, **kwargs):
+        super(CountingWorkflow, self).__init__(*args, **kwargs)
+        self.replays = 0
+
+    def __call__(self, state, input_data, tracer):
+        self.replays += 1  # one decision at a time
+        return super(CountingWorkflow, self).__call__(state, input_data,
+                                                      tracer)
+
+
+def sleepy(x):
+    time.sleep(0.01)
+    return x
+
+
+class TestCoalescing(unittest.TestCase):
+    def run_wm(self, **kwargs):
+        main = CountingWorkflow(WM, activity_workers=20,
+                                executor=ThreadPoolExecutor, **kwargs)
+        main.conf_activity('m', sleepy)
+        self.assertEqual(main.run(39, 40, _wait=True), 780)
+        return main.replays
+
+    def test_count(self):
+        self.assertLessEqual(self.run_wm(coalesce_count=20), 4)
+
+    def test_window(self):
+        self.assertLessEqual(self.run_wm(coalesce_window=5), 3)
+
+    def test_window_and_count(self):
+        self.assertLessEqual(self.run_wm(coalesce_window=5,
+                                         coalesce_count=10), 6)
+
+    def test_subworkflows_restart(self):
+        sub = LocalWorkflow(TWorkflow)
+        main = LocalWorkflow(W, executor=ThreadPoolExecutor,
+                             coalesce_window=0.05, coalesce_count=3)
+        main.conf_workflow('m', sub)
+        main.conf_activity('r', tactivity)
+        self.assertEqual(main.run(8, r=True, _wait=True), 45)
+
+
+class Gauge(object):
+    """Record the most calls running at once."""
+    def __init__(self):
+        import threading
+        self.lock = threading.Lock()
+        self.running = self.most = 0
+
+    def __call__(self, x):
+        with self.lock:
+            self.running += 1
+            self.most = max(self.most, self.running)
+        time.sleep(0.005)
+        with self.lock:
+            self.running -= 1
+        return x
+
+
+class TestBoundedSubmitter(unittest.TestCase):
+    def test_bounded(self):
+        import threading
+        from flowy import serialization
+        from flowy.local.runner import BoundedSubmitter
+        from flowy.local.transport import register_activities
+        gauge = Gauge()
+        register_activities({'gauge': gauge})
+        submitter = BoundedSubmitter(ThreadPoolExecutor(max_workers=16), 3)
+        results = {}
+        done = threading.Event()
+
+        def callback(task_id, future):
+            results[task_id] = future.result()
+            if len(results) == 20:
+                done.set()
+
+        for i in range(20):
+            submitter.submit('gauge', serialization.dumps([[i], {}]),
+                             callback, i)
+        self.assertTrue(done.wait(10))
+        submitter.shutdown()
+        self.assertEqual(results, dict((i, i) for i in range(20)))
+        self.assertEqual(gauge.most, 3)
+        self.assertRaises(RuntimeError, submitter.submit, 'gauge',
+                          serialization.dumps([[0], {}]), callback, 0)
+
+    def test_workflow(self):
+        main = LocalWorkflow(WM, max_in_flight=1)
+        main.conf_activity('m', tactivity)
+        self.assertEqual(main.run(8, 4, _wait=True), 45)
+
+
+class TestLocalEngine(unittest.TestCase):
+    def test_concurrent_executions(self):
+        main = LocalWorkflow(W, executor=ThreadPoolExecutor)
+        main.conf_activity('m', tactivity)
+        main.conf_activity('r', tactivity)
+        with main.engine() as engine:
+            futures = [engine.submit(n, r=bool(n % 2)) for n in range(20)]
+            results = [f.result(timeout=10) for f in futures]
+        self.assertEqual(results, [n * (n + 1) // 2 + n + 1
+                                   for n in range(20)])
+        self.assertRaises(RuntimeError, engine.submit, 1)
+
+    def test_errors(self):
+        from flowy import LocalEngine
+        sub = LocalWorkflow(TWorkflow)
+        main = LocalWorkflow(F, executor=ThreadPoolExecutor)
+        main.conf_workflow('task', sub)
+        with LocalEngine(main) as engine:
+            failed = engine.submit(r=2)
+            thrown = engine.submit(throw=True)
+            self.assertRaises(TaskError, failed.result, 10)
+            self.assertRaises(TaskError, thrown.result, 10)
+
+    def test_processes(self):
+        main = LocalWorkflow(W)
+        main.conf_activity('m', tactivity)
+        main.conf_activity('r', tactivity)
+        with main.engine() as engine:
+            futures = [engine.submit(8, r=False) for _ in range(4)]
+            self.assertEqual([f.result() for f in futures], [45] * 4)
+
+    def test_shutdown_fails_running(self):
+        main = LocalWorkflow(WM, executor=ThreadPoolExecutor)
+        main.conf_activity('m', sleepy)
+        engine = main.engine()
+        future = engine.submit(39, 1)
+        engine.shutdown()
+        self.assertRaises(RuntimeError, future.result, 5)
+
+    def test_configured_after_engine(self):
+        main = LocalWorkflow(W, executor=ThreadPoolExecutor)
+        main.conf_activity('m', tactivity)
+        with main.engine() as engine:
+            main.conf_activity('r', tactivity)
+            future = engine.submit(3, r=False)
+            with self.assertRaises(TaskError) as cm:
+                future.result(5)
+        self.assertIn("Activity 'r' is not registered", str(cm.exception))
+
+
+def digits(n):
+    return set(str(n))
+
+
+class Digits(object):
+    def __init__(self, digits):
+        self.digits = digits
+
+    def __call__(self, n):
+        return sorted(self.digits(n))
+
+
+def listed(n):
+    return [n]
+
+
+class Mutating(object):
+    """Change the activity results, in every replay."""
+    def __init__(self, listed):
+        self.listed = listed
+
+    def __call__(self):
+        r = self.listed(1)
+        r.append('x')
+        self.listed(2).append('y')
+        self.listed(3).append('z')
+        return r
+
+
+class TestTransport(unittest.TestCase):
+    def test_results_are_not_serialized(self):
+        main = LocalWorkflow(Digits)
+        main.conf_activity('digits', digits)
+        self.assertEqual(main.run(1211, _wait=True), ['1', '2'])
+
+    def test_results_are_private(self):
+        for batch_size in None, 2:
+            main = LocalWorkflow(Mutating, executor=ThreadPoolExecutor)
+            main.conf_activity('listed', listed, batch_size=batch_size)
+            self.assertEqual(main.run(_wait=True), [1, 'x'])
+
+    def test_only_containers_copied(self):
+        from flowy.history import VersionedExecutionHistory
+        from flowy.local.proxy import result_reader
+        shared = (object(), (1, [2]), b'x' * 10, bytearray(10), 'y', 1)
+        read = result_reader(VersionedExecutionHistory().view())
+        for value in shared:
+            self.assertIs(read(value), value)
+        for value in [1, [2]], {'a': [1]}, set([1]):
+            self.assertEqual(read(value), value)
+            self.assertIsNot(read(value), value)
+        value = [1]
+        self.assertIs(result_reader(VersionedExecutionHistory())(value),
+                      value)
+
+    def test_batch_results(self):
+        main = LocalWorkflow(Digits, executor=ThreadPoolExecutor)
+        main.conf_activity('digits', digits, batch_size=4)
+        self.assertEqual(main.run(1211, _wait=True), ['1', '2'])
+
+    def test_collect_activities(self):
+        from flowy.local.transport import collect_activities
+        sub = LocalWorkflow(W)
+        sub.conf_activity('m', tactivity)
+        sub.conf_activity('r', tactivity, batch_size=2)
+        main = LocalWorkflow(W)
+        main.conf_activity('m', tactivity)
+        main.conf_workflow('r', sub)
+        activities = collect_activities(main)
+        self.assertEqual(len(activities), 3)
+        self.assertEqual(sorted(k.split('/')[0] for k in activities),
+                         ['m', 'm', 'r'])
+
+
+def blob(n):
+    return b'x' * n
+
+
+def size(data):
+    assert isinstance(data, bytes)
+    return len(data)
+
+
+class Blobs(object):
+    def __init__(self, blob, size):
+        self.blob = blob
+        self.size = size
+
+    def __call__(self, n, load=False):
+        b = self.blob(n)
+        if load:
+            return len(b.load())
+        return self.size(b) + self.size(b)
+
+
+class TestSpill(unittest.TestCase):
+    def blobs(self, **kwargs):
+        main = LocalWorkflow(Blobs, spill_threshold=1000, **kwargs)
+        main.conf_activity('blob', blob)
+        main.conf_activity('size', size)
+        return main
+
+    def wait_empty(self, path):
+        import os
+        for _ in range(100):
+            if not os.listdir(path):
+                return True
+            time.sleep(0.01)
+        return False
+
+    def test_processes(self):
+        import os
+        with self.blobs().engine() as engine:
+            self.assertEqual(engine.submit(10000).result(), 20000)
+            self.assertEqual(engine.submit(10).result(), 20)
+            self.assertEqual(engine.submit(10000, load=True).result(), 10000)
+            self.assertTrue(self.wait_empty(engine.spill.directory))
+        self.assertFalse(os.path.exists(engine.spill.directory))
+
+    def test_subworkflows(self):
+        class Sub(object):
+            def __init__(self, blob):
+                self.blob = blob
+
+            def __call__(self, n):
+                return self.blob(n)
+
+        sub = LocalWorkflow(Sub)
+        sub.conf_activity('blob', blob)
+        main = LocalWorkflow(Blobs, executor=ThreadPoolExecutor,
+                             spill_threshold=1000)
+        main.conf_workflow('blob', sub)
+        main.conf_activity('size', size)
+        with main.engine() as engine:
+            self.assertEqual(engine.submit(5000).result(), 10000)
+            self.assertTrue(self.wait_empty(engine.spill.directory))
+
+    def test_refs(self):
+        import os
+        from flowy.local.spill import Spill
+        from flowy.local.spill import spill_result
+        from flowy.serialization import dumps
+        spill = Spill(10)
+        try:
+            self.assertEqual(spill_result(b'small', *spill.options), b'small')
+            handle = spill_result(bytearray(100), *spill.options)
+            self.assertEqual(handle.load(), bytearray(100))
+            serialized = dumps([[handle, 1], {}])
+            self.assertEqual(spill.paths(serialized), [handle.path])
+            spill.acquire(spill.paths(handle))
+            spill.acquire(spill.paths(serialized))
+            spill.release([handle.path])
+            self.assertTrue(os.path.exists(handle.path))
+            spill.release([handle.path])
+            self.assertFalse(os.path.exists(handle.path))
+        finally:
+            spill.close()
+        self.assertFalse(os.path.exists(spill.directory))
+
+    def test_escaped_paths(self):
+        import os
+        import shutil
+        import tempfile
+        from flowy.local.spill import Spill
+        from flowy.local.spill import spill_result
+        from flowy.serialization import dumps
+        parent = tempfile.mkdtemp(prefix=u'flowy-\u00e9\\"-')
+        spill = Spill(10, directory=parent)
+        try:
+            handle = spill_result(b'x' * 100, *spill.options)
+            serialized = dumps([handle])
+            self.assertNotIn(handle.path, serialized)  # escaped
+            self.assertEqual(spill.paths(serialized), [handle.path])
+            spill.acquire(spill.paths(serialized))
+            spill.release(spill.paths(serialized))
+            self.assertFalse(os.path.exists(handle.path))
+        finally:
+            spill.close()
+            shutil.rmtree(parent)
+
+    def test_child_workflow_input(self):
+        class SizeOf(object):
+            def __init__(self, size):
+                self.size = size
+
+            def __call__(self, data):
+                return self.size(data)
+
+        sub = LocalWorkflow(SizeOf)
+        sub.conf_activity('size', size)
+        main = LocalWorkflow(Blobs, executor=ThreadPoolExecutor,
+                             spill_threshold=1000)
+        main.conf_activity('blob', blob)
+        main.conf_workflow('size', sub)
+        with main.engine() as engine:
+            self.assertEqual(engine.submit(5000).result(), 10000)
+            self.assertTrue(self.wait_empty(engine.spill.directory))
+
+    def test_final_result(self):
+        class Blob(object):
+            def __init__(self, blob):
+                self.blob = blob
+
+            def __call__(self, n):
+                return self.blob(n)
+
+        main = LocalWorkflow(Blob, executor=ThreadPoolExecutor,
+                             spill_threshold=1000)
+        main.conf_activity('blob', blob)
+        self.assertEqual(main.run(5000, _wait=True), b'x' * 5000)
+
+    def test_scoped_decoding(self):
+        import flowy.local.spill  # noqa, nothing is registered on import
+        from flowy.local.spill import Spill
+        from flowy.local.spill import spill_result
+        from flowy.serialization import dumps
+        from flowy.serialization import loads
+        outside = '[{" m": ["/etc/hostname", 5, "bytes", null]}]'
+        self.assertEqual(loads(outside),
+                         [{' m': ['/etc/hostname', 5, 'bytes', None]}])
+        self.assertEqual(loads('{" m": 1}'), {' m': 1})
+        spill = Spill(10)
+        try:
+            self.assertRaises(ValueError, spill.loads, outside)
+            handle = spill_result(b'y' * 100, *spill.options)
+            self.assertEqual(spill.loads(dumps([handle, {' m': 1}])),
+                             [b'y' * 100, {' m': 1}])
+        finally:
+            spill.close()
+
+
+class TestHistoryView(unittest.TestCase):
+    def history(self):
+        from flowy.history import VersionedExecutionHistory
+        h = VersionedExecutionHistory()
+        h.set_running('a-0-0')
+        h.set_running('b-0-0')
+        return h
+
+    def test_view_is_frozen(self):
+        h = self.history()
+        view = h.view()
+        h.set_result('a-0-0', 'r')
+        h.set_error('b-0-0', 'err')
+        h.set_running('b-0-1')
+        h.set_running('a-1-0')
+        self.assertEqual(view.task_history('a').call_states(0),
+                         [('RUNNING', None, None)])
+        self.assertEqual(view.task_history('b').call_states(0),
+                         [('RUNNING', None, None)])
+        self.assertEqual(view.task_history('a').call_states(1), ())
+        self.assertEqual(view.task_history('a').calls,
+                         [[('RUNNING', None, None)]])
+        self.assertEqual(view.task_history('c').calls, [])
+        self.assertEqual(view.finish_order, [])
+        view = h.view()
+        self.assertEqual(view.task_history('a').call_states(0),
+                         [('RESULT', 'r', 0)])
+        self.assertEqual(view.task_history('b').call_states(0),
+                         [('ERROR', 'err', 1), ('RUNNING', None, None)])
+        self.assertEqual(view.finish_order, ['a-0-0', 'b-0-0'])
+
+    def test_pickle(self):
+        import pickle
+        from flowy.history import ExecutionHistory
+        h = self.history()
+        view = h.view()
+        h.set_result('a-0-0', 'r')
+        copy = pickle.loads(pickle.dumps(view))
+        self.assertIsInstance(copy, ExecutionHistory)
+        self.assertEqual(copy.task_history('a').call_states(0),
+                         [('RUNNING', None, None)])
+        self.assertEqual(copy.finish_order, [])
+        self.assertEqual(repr(copy), repr(view))
+
+    def test_tracer_copy(self):
+        import pickle
+        from flowy.tracer import ExecutionTracer
+        tracer = ExecutionTracer()
+        tracer.schedule_activity('a-0', 'a')
+        tracer.flush_scheduled()
+        decision_tracer = tracer.copy()
+        tracer.result('a-0', 1)
+        decision_tracer.schedule_activity('b-0', 'b')
+        state = decision_tracer.state()
+        self.assertEqual(state.nodes, {'a-0': 'a', 'b-0': 'b'})
+        self.assertEqual(state.results, {})
+        self.assertEqual(tracer.state().results, {'a-0': 1})
+        state = pickle.loads(pickle.dumps(decision_tracer)).state()
+        self.assertEqual(state.nodes, {'a-0': 'a', 'b-0': 'b'})
+
+
+class TestLazyImports(unittest.TestCase):
+    def run_python(self, code):
+        import subprocess
+        import sys
+        return subprocess.check_output([sys.executable, '-c', code]).decode()
+
+    def test_local_only(self):
+        out = self.run_python('import sys, flowy; flowy.LocalWorkflow; '
+                              'print("boto3" in sys.modules)')
+        self.assertEqual(out.strip(), 'False')
+
+    def test_swf_names(self):
+        out = self.run_python('import sys, flowy; '
+                              'from flowy import SWFWorkflowWorker; '
+                              'print(flowy.SWFClient.__module__); '
+                              'print("boto3" in sys.modules)')
+        self.assertEqual(out.split(), ['flowy.swf.client', 'True'])
+
+    def test_missing_name(self):
+        import flowy
+        self.assertRaises(AttributeError, getattr, flowy, 'missing')
+        self.assertIn('SWFClient', dir(flowy))
+
+
 import examples
 for wf_name, wf in vars(examples).items():
     if inspect.isclass(wf) and wf.__module__ == 'flowy.examples':
@@ -1,3 +1,5 @@
+import sys
+
 import pytest
 
 def make_traverse_cases():
@@ -122,3 +124,202 @@ x_uuid = uuid.uuid4()
 def test_dumps_loads(value, result):
     from flowy.serialization import dumps, loads
     assert loads(dumps(value)) == result
+
+
+def test_traverse_no_copy():
+    from flowy.serialization import traverse_data
+    value = [list(range(10)), {'a': [1, 2]}, 'x']
+    traversed, (err, placeholders) = traverse_data(value)
+    assert traversed is value
+    assert err is None and not placeholders
+
+
+def test_traverse_copy_changed_only():
+    from flowy.result import result
+    from flowy.serialization import traverse_data
+    unchanged = [1, 2, 3]
+    value = [unchanged, [result(1, 0)], {'a': result(2, 1)}]
+    traversed, _ = traverse_data(value)
+    assert traversed == [[1, 2, 3], [1], {'a': 2}]
+    assert traversed is not value
+    assert traversed[0] is unchanged
+
+
+def test_traverse_deep():
+    from flowy.serialization import traverse_data
+    value = []
+    for _ in range(10000):
+        value = [value]
+    traversed, _ = traverse_data(value)
+    assert traversed is value
+
+
+def test_dumps_wire_format():
+    from flowy.serialization import dumps
+    u = uuid.UUID('12345678123456781234567812345678')
+    assert dumps([u, b'ab', (1, 2)]) == (
+        '[{" u": "12345678123456781234567812345678"}, {" b": "YWI="}, [1, 2]]')
+
+
+def test_dumps_json_method():
+    from flowy.serialization import dumps, loads
+
+    class X(object):
+        def __json__(self):
+            return {'x': b'x'}
+
+    assert loads(dumps([X()])) == [{'x': b'x'}]
+
+
+def test_dumps_json_method_subclasses():
+    from flowy.serialization import dumps, loads
+
+    class D(dict):
+        def __json__(self):
+            return {'d': b'x'}
+
+    class L(list):
+        def __json__(self):
+            return ['l', x_uuid]
+
+    assert loads(dumps([D(a=1), {'x': L([1])}])) == [
+        {'d': b'x'}, {'x': ['l', x_uuid]}]
+    assert loads(dumps(D())) == {'d': b'x'}
+
+
+def test_dumps_plain_subclasses():
+    import collections
+    from flowy.serialization import dumps
+    P = collections.namedtuple('P', 'x y')
+    assert dumps([P(1, b'ab')]) == '[[1, {" b": "YWI="}]]'
+
+
+@pytest.mark.skipif(sys.version_info >= (3,), reason='str is bytes on py2')
+def test_dumps_py2_str():
+    from flowy.serialization import dumps
+    assert dumps(['ab', u'ab']) == '[{" b": "YWI="}, "ab"]'
+
+
+@pytest.mark.parametrize(['value', 'result'], (
+    ('{" u": "12345678123456781234567812345678"}',
+     uuid.UUID('12345678123456781234567812345678')),
+    ('{" b": "YWI="}', b'ab'),
+    ('{" b": "YWI=", "c": 1}', {' b': 'YWI=', 'c': 1}),
+    ('["\\" u\\""]', ['" u"']),
+    ('[{" b":"YWI="}]', [b'ab']),
+    ('[ {\n  " b": "YWI="\n} ]', [b'ab']),
+    ('{"\\u0020b": "YWI="}', b'ab'),
+))
+def test_loads_tags(value, result):
+    from flowy.serialization import loads
+    assert loads(value) == result
+
+
+try:
+    import lzma
+except ImportError:  # python 2
+    lzma = None
+
+
+@pytest.mark.parametrize('codec', [
+    'zlib',
+    pytest.param('lzma', marks=pytest.mark.skipif(lzma is None,
+                                                  reason='needs lzma')),
+])
+def test_serializer_compression(codec):
+    from flowy.serialization import Serializer, loads
+    s = Serializer(codec, threshold=100)
+    value = [list(range(1000)), {'x': b'abc', 'y': x_uuid}]
+    data = s.dumps(value)
+    assert data.startswith('~%s~' % codec)
+    assert len(data) < len(dumps_plain(value))
+    assert loads(data) == value
+    assert not s.dumps([1, 2]).startswith('~')
+    args, kwargs = loads(s.serialize_input(*value[0], a=1))
+    assert args == value[0] and kwargs == {'a': 1}
+
+
+def dumps_plain(value):
+    from flowy.serialization import dumps
+    return dumps(value)
+
+
+def test_unknown_codec():
+    from flowy.serialization import Serializer, loads
+    with pytest.raises(ValueError):
+        Serializer('nope')
+    with pytest.raises(ValueError):
+        loads('~nope~eJwDAAAAAAE=')
+
+
+@pytest.fixture
+def z9():
+    """Register the z9 codec for a test."""
+    import zlib
+    from flowy.serialization import _codecs
+    from flowy.serialization import register_codec
+    register_codec('z9', lambda b: zlib.compress(b, 9), zlib.decompress)
+    yield 'z9'
+    _codecs.pop('z9', None)
+
+
+def test_register_codec(z9):
+    from flowy.serialization import Serializer, loads, register_codec
+    value = {'a': 'x' * 1000}
+    data = Serializer('z9', threshold=0).dumps(value)
+    assert data.startswith('~z9~')
+    assert loads(data) == value
+    with pytest.raises(ValueError):
+        register_codec('a~b', None, None)
+
+
+def test_blob_store_offload(tmpdir):
+    from flowy.blobstore import FileBlobStore
+    from flowy.serialization import Serializer, loads, register_blob_store
+    store = FileBlobStore(str(tmpdir))
+    register_blob_store('test-fs', store)
+    s = Serializer(codec=None, blob_store='test-fs', blob_threshold=100)
+    value = [str(x) for x in range(1000)]
+    data = s.dumps(value)
+    assert data.startswith('~test-fs~') and len(data) < 100
+    assert loads(data) == value
+    assert s.dumps(value) == data  # content-addressed, stored only once
+    assert len(tmpdir.listdir()) == 1
+    assert s.dumps([1]) == '[1]'
+
+
+def test_blob_store_compressed(tmpdir):
+    from flowy.blobstore import FileBlobStore
+    from flowy.serialization import Serializer, loads, register_blob_store
+    register_blob_store('test-fs-z', FileBlobStore(str(tmpdir)))
+    s = Serializer('zlib', threshold=10, blob_store='test-fs-z', blob_threshold=100)
+    value = [x_uuid.hex + str(x) for x in range(1000)]
+    data = s.dumps(value)
+    assert data.startswith('~test-fs-z~')
+    assert loads(data) == value
+
+
+def test_blob_store_invalid_key(tmpdir):
+    from flowy.blobstore import FileBlobStore
+    with pytest.raises(ValueError):
+        FileBlobStore(str(tmpdir)).get('../../etc/passwd')
+
+
+def test_blob_store_mode(tmpdir):
+    import os
+    import stat
+    from flowy.blobstore import FileBlobStore
+    store = FileBlobStore(str(tmpdir))
+    umask = os.umask(0o027)
+    try:
+        key = store.put(u'data')
+    finally:
+        os.umask(umask)
+    mode = os.stat(store._blob_path(key)).st_mode
+    assert stat.S_IMODE(mode) == 0o640
+    assert store.get(key) == u'data'
+    assert store.get(store.put(u'')) == u''
+    store = FileBlobStore(str(tmpdir.join('private')), mode=0o600)
+    key = store.put(u'data')
+    assert stat.S_IMODE(os.stat(store._blob_path(key)).st_mode) == 0o600
+    assert os.listdir(os.path.dirname(store._blob_path(key))) == [key]
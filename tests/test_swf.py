@@ -1,5 +1,8 @@
 import json
+import os
 import pprint
+import threading
+import time
 import unittest
 
 from flowy.swf.history import SWFExecutionHistory
@@ -223,6 +226,85 @@ class TestScan(unittest.TestCase):
         assert ('Named', '1') in worker.registry
 
 
+class TestParallelMap(unittest.TestCase):
+    def make_proxy(self, finished=(), errors=()):
+        """A proxy where the finished calls have a result in the given order."""
+        from flowy.result import error, placeholder, result
+        calls = []
+
+        def proxy(x):
+            calls.append(x)
+            if x in finished:
+                return result(x * 2, list(finished).index(x))
+            if x in errors:
+                return error('err', 100)
+            return placeholder()
+
+        return proxy, calls
+
+    def test_window(self):
+        from flowy import parallel_map
+        proxy, calls = self.make_proxy()
+        results = parallel_map(proxy, range(10), window=3)
+        self.assertEqual(calls, [0, 1, 2])
+        self.assertEqual(len(results), 10)
+
+    def test_start_when_finished(self):
+        from flowy import parallel_map
+        proxy, calls = self.make_proxy(finished=[4, 0, 1], errors=[2])
+        results = parallel_map(proxy, range(10), window=3)
+        self.assertEqual(calls, [0, 1, 2, 3, 4, 5, 6])
+        self.assertEqual(results[0], 0)
+        self.assertEqual(results[4], 8)
+
+    def test_unbounded(self):
+        from flowy import parallel_map
+        proxy, calls = self.make_proxy()
+        parallel_map(proxy, range(10))
+        self.assertEqual(calls, list(range(10)))
+
+    def test_finish_order(self):
+        from flowy import parallel_map
+        proxy, calls = self.make_proxy(finished=[2, 0])
+        results = parallel_map(proxy, range(4), window=2, ordered=False)
+        self.assertEqual(results[:2], [4, 0])
+        self.assertEqual(len(results), 4)
+
+    def test_skipped_call_numbers(self):
+        from flowy import parallel_map
+        from flowy.history import ExecutionHistory
+        from flowy.proxy import Proxy
+
+        class Decision(object):
+            def __init__(self):
+                self.scheduled = []
+
+            def schedule(self, call_number, retry_number, delay, input_data):
+                self.scheduled.append(call_number)
+                return True
+
+        h = ExecutionHistory()
+        d = Decision()
+        proxy = Proxy(h.task_history('a'), d)
+        parallel_map(proxy, range(4), window=2)
+        proxy(99)
+        self.assertEqual(d.scheduled, [0, 1, 4])
+        for call_key in ['a-0-0', 'a-1-0', 'a-4-0']:
+            h.set_running(call_key)
+        h.set_result('a-0-0', '0')
+        h.set_result('a-4-0', '99')
+        d = Decision()
+        proxy = Proxy(h.task_history('a'), d)
+        results = parallel_map(proxy, range(4), window=2)
+        self.assertEqual(proxy(99), 99)
+        self.assertEqual(d.scheduled, [2])
+        self.assertEqual(results[0], 0)
+
+    def test_invalid_window(self):
+        from flowy import parallel_map
+        self.assertRaises(ValueError, lambda: parallel_map(abs, [1], window=0))
+
+
 class TestParallelReduce(unittest.TestCase):
     def test_empty_iterable(self):
         from flowy import parallel_reduce
@@ -237,6 +319,54 @@ class TestParallelReduce(unittest.TestCase):
         # python 2.6 doesn't have assertIs
         assert x is parallel_x.__wrapped__
 
+    def make_task(self):
+        """A reduce function behaving like a task that finishes instantly."""
+        from flowy.result import result
+        calls = []
+
+        def f(*args):
+            calls.append(args)
+            values = args[0] if len(args) == 1 else args
+            return result(sum(values), len(calls) + 1000)
+
+        return f, calls
+
+    def test_large_iterable(self):
+        from flowy import parallel_reduce
+        from flowy.result import result
+        f, calls = self.make_task()
+        r = parallel_reduce(f, [result(i, i) for i in range(100000)])
+        self.assertEqual(r.__wrapped__, sum(range(100000)))
+        self.assertEqual(len(calls), 99999)
+
+    def test_finish_order(self):
+        from flowy import parallel_reduce
+        from flowy.result import result
+        f, calls = self.make_task()
+        parallel_reduce(f, [result(1, 3), result(2, 1), 5, result(3, 2)])
+        self.assertEqual(calls[0], (5, 2))
+        self.assertEqual(calls[1], (3, 1))
+
+    def test_fan_in(self):
+        from flowy import parallel_reduce
+        from flowy.result import result
+        f, calls = self.make_task()
+        r = parallel_reduce(f, [result(i, i) for i in range(10)] + [10, 11],
+                            fan_in=4)
+        self.assertEqual(r.__wrapped__, sum(range(12)))
+        self.assertEqual(calls[0], ([10, 11, 0, 1], ))
+        self.assertEqual(calls[1], ([2, 3, 4, 5], ))
+        self.assertEqual(len(calls), 4)
+
+    def test_invalid_fan_in(self):
+        from flowy import parallel_reduce
+        self.assertRaises(ValueError, lambda: parallel_reduce(sum, [1, 2], fan_in=1))
+
+    def test_local_reduce(self):
+        from flowy import parallel_reduce
+        self.assertEqual(parallel_reduce(lambda x, y: x + y, [1, 2, 3]), 6)
+        self.assertEqual(parallel_reduce(sum, range(10), fan_in=3), 45)
+
 
 class TestFinishOrder(unittest.TestCase):
     def test_non_results(self):
@@ -292,3 +422,1123 @@ class TestFinishOrder(unittest.TestCase):
         e = error('err!', 3)
         p = placeholder()
         self.assertEquals(first([e, p, r, t]).__factory__, r.__factory__)
+
+
+class TestExecutionHistory(unittest.TestCase):
+    def test_call_states(self):
+        h = SWFExecutionHistory(running=['a-0-1', 'b-3-0', 'a-0-0:t'],
+                                timedout=['a-0-0'],
+                                results={'b-1-0': '1'},
+                                errors={'b-0-0': 'err'},
+                                order=['b-0-0', 'a-0-0', 'b-1-0'])
+        self.assertEqual(h.task_history('a').call_states(0),
+                         [('TIMEDOUT', None, 1), ('RUNNING', None, None)])
+        self.assertEqual(h.task_history('b').call_states(0), [('ERROR', 'err', 0)])
+        self.assertEqual(h.task_history('b').call_states(1), [('RESULT', '1', 2)])
+        self.assertEqual(h.task_history('b').call_states(2), ())
+        self.assertEqual(h.task_history('b').call_states(100), ())
+        self.assertEqual(h.task_history('c').call_states(0), ())
+        self.assertTrue(h.is_timer_running('a-0-0'))
+
+    def test_finish_order(self):
+        from flowy.history import ExecutionHistory
+        h = ExecutionHistory()
+        h.set_running('x-1-0')
+        h.set_running('x-0-0')
+        h.set_result('x-1-0', 'r')
+        h.set_error('x-0-0', 'e')
+        self.assertEqual(h.task_history('x').call_states(0), [('ERROR', 'e', 1)])
+        self.assertEqual(h.task_history('x').call_states(1), [('RESULT', 'r', 0)])
+        self.assertEqual(h.finish_order, ['x-1-0', 'x-0-0'])
+
+    def test_timer_views(self):
+        import pickle
+        from flowy.swf.history import VersionedSWFExecutionHistory
+        h = VersionedSWFExecutionHistory()
+        h.set_timer_running('a-0-0:t')
+        h.set_running('b-0-0')
+        running = h.view()
+        h.set_timer_fired('a-0-0:t')
+        h.set_result('b-0-0', 'r')
+        fired = h.view()
+        self.assertTrue(running.is_timer_running('a-0-0'))
+        self.assertFalse(running.is_timer_ready('a-0-0'))
+        self.assertTrue(fired.is_timer_ready('a-0-0'))
+        self.assertFalse(fired.is_timer_running('a-0-0'))
+        self.assertFalse(fired.is_timer_running('b-0-0'))
+        plain = pickle.loads(pickle.dumps(running))
+        self.assertIsInstance(plain, SWFExecutionHistory)
+        self.assertTrue(plain.is_timer_running('a-0-0'))
+        self.assertEqual(plain.task_history('b').call_states(0),
+                         [('RUNNING', None, None)])
+        plain = pickle.loads(pickle.dumps(fired))
+        self.assertTrue(plain.is_timer_ready('a-0-0'))
+        self.assertEqual(plain.finish_order, ['b-0-0'])
+
+
+class FakePagingClient(object):
+    """Serve a decision task history in pages, like SWF does."""
+
+    def __init__(self, events, page_size=2):
+        self.events = events
+        self.page_size = page_size
+        self.pages_loaded = 0
+
+    def poll_for_decision_task(self, domain, task_list, identity=None,
+                               next_page_token=None, reverse_order=False):
+        self.pages_loaded += 1
+        events = self.events[::-1] if reverse_order else self.events
+        start = int(next_page_token or 0)
+        end = start + self.page_size
+        page = {
+            'taskToken': 'token',
+            'workflowExecution': {'workflowId': 'wid', 'runId': 'rid'},
+            'events': events[start:end],
+        }
+        if end < len(events):
+            page['nextPageToken'] = str(end)
+        return page
+
+
+def make_events(activities):
+    events = [{
+        'eventId': 1,
+        'eventType': 'WorkflowExecutionStarted',
+        'workflowExecutionStartedEventAttributes': {
+            'taskList': {'name': 'tl'},
+            'taskStartToCloseTimeout': '10',
+            'executionStartToCloseTimeout': '100',
+            'childPolicy': 'TERMINATE',
+            'workflowType': {'name': 'W', 'version': '1'},
+            'input': '[[], {}]',
+        },
+    }]
+    for i in range(activities):
+        events.append({
+            'eventId': len(events) + 1,
+            'eventType': 'ActivityTaskScheduled',
+            'activityTaskScheduledEventAttributes': {'activityId': 'a-%s-0' % i},
+        })
+    for i in range(activities):
+        events.append({
+            'eventId': len(events) + 1,
+            'eventType': 'ActivityTaskCompleted',
+            'activityTaskCompletedEventAttributes': {
+                'scheduledEventId': i + 2,
+                'result': str(i),
+            },
+        })
+    return events
+
+
+class TestHistoryCache(unittest.TestCase):
+    def test_incremental_load(self):
+        from flowy.swf.worker import HistoryCache, poll_decision
+        cache = HistoryCache(max_size=2)
+        events = make_events(5)
+        client = FakePagingClient(events[:8])
+        _, _, _, history, _ = poll_decision(client, 'd', 'tl', history_cache=cache)
+        self.assertEqual(client.pages_loaded, 4)
+        self.assertEqual(history.task_history('a').call_states(4),
+                         [('RUNNING', None, None)])
+        client = FakePagingClient(events)
+        _, _, _, history, _ = poll_decision(client, 'd', 'tl', history_cache=cache)
+        self.assertEqual(client.pages_loaded, 2)  # only the new events
+        self.assertEqual(history.task_history('a').call_states(4),
+                         [('RESULT', '4', 4)])
+        self.assertEqual(history.task_history('a').call_states(2)[0][2], 2)
+
+    def test_same_as_full_load(self):
+        from flowy.swf.worker import HistoryCache, poll_decision
+        events = make_events(7)
+        full = poll_decision(FakePagingClient(events), 'd', 'tl')[3]
+        cache = HistoryCache()
+        for i in range(1, len(events) + 1, 3):
+            poll_decision(FakePagingClient(events[:i]), 'd', 'tl', history_cache=cache)
+        cached = poll_decision(FakePagingClient(events), 'd', 'tl', history_cache=cache)[3]
+        self.assertEqual(full.task_history('a').calls,
+                         cached.task_history('a').calls)
+        self.assertEqual(full.finish_order, cached.finish_order)
+
+    def test_cached_history_not_updated(self):
+        from flowy.swf.worker import HistoryCache, poll_decision
+        cache = HistoryCache()
+        events = make_events(3)
+        client = FakePagingClient(events[:4])
+        _, _, _, old, _ = poll_decision(client, 'd', 'tl', history_cache=cache)
+        client = FakePagingClient(events)
+        _, _, _, new, _ = poll_decision(client, 'd', 'tl', history_cache=cache)
+        self.assertEqual(old.task_history('a').call_states(0),
+                         [('RUNNING', None, None)])
+        self.assertEqual(old.finish_order, [])
+        self.assertEqual(new.task_history('a').call_states(0),
+                         [('RESULT', '0', 0)])
+
+    def test_state_loaded_in_place(self):
+        from flowy.swf.worker import HistoryCache, poll_decision
+        cache = HistoryCache()
+        events = make_events(3)
+        poll_decision(FakePagingClient(events[:4]), 'd', 'tl',
+                      history_cache=cache)
+        state = cache.get(('wid', 'rid'))
+        history = state.history
+        poll_decision(FakePagingClient(events), 'd', 'tl', history_cache=cache)
+        state = cache.get(('wid', 'rid'))
+        self.assertIs(state.history, history)  # no copy of the history
+        self.assertEqual(state.last_event_id, len(events))
+
+    def test_failed_load_dropped(self):
+        from flowy.swf.worker import HistoryCache, poll_decision
+        cache = HistoryCache()
+        events = make_events(3)
+        poll_decision(FakePagingClient(events[:4]), 'd', 'tl',
+                      history_cache=cache)
+        broken = dict(events[4], activityTaskCompletedEventAttributes={
+            'scheduledEventId': 100, 'result': '0'})
+        client = FakePagingClient(events[:4] + [broken])
+        self.assertRaises(KeyError, poll_decision, client, 'd', 'tl',
+                          history_cache=cache)
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction(self):
+        from flowy.swf.worker import HistoryCache
+        cache = HistoryCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(len(cache), 2)
+
+
+class TestIgnoredErrors(unittest.TestCase):
+    def setUp(self):
+        import logging
+        from flowy.utils import logger
+
+        class ListHandler(logging.Handler):
+            def emit(self, record):
+                messages.append(record.getMessage())
+
+        messages = self.messages = []
+        self.handler = ListHandler()
+        logger.addHandler(self.handler)
+
+    def tearDown(self):
+        from flowy.utils import logger
+        logger.removeHandler(self.handler)
+
+    def test_warn_once_per_scope(self):
+        from flowy.result import error, timeout, result, warn_ignored_errors
+        from flowy.result import wait, TaskError
+        with warn_ignored_errors():
+            e1 = error('err1', 1)
+            e2 = error('err2', 2)
+            timeout(3)
+            result(1, 4)
+            self.assertRaises(TaskError, lambda: wait(e1))
+            self.assertEqual(self.messages, [])
+        self.assertEqual(self.messages, [
+            'Result with error was ignored: err2',
+            'Result with error was ignored: A task has timedout'])
+
+    def test_no_scope(self):
+        from flowy.result import error
+        error('err', 1)
+        self.assertEqual(self.messages, [])
+
+
+class RecordingTaskDecision(object):
+    def __init__(self):
+        self.scheduled = []
+        self.failed = None
+
+    def fail(self, reason):
+        self.failed = reason
+
+    def schedule(self, call_number, retry_number, delay, input_data):
+        self.scheduled.append((call_number, retry_number, delay, input_data))
+        return True
+
+
+class BatchDummyDecision(DummyDecision):
+    def schedule_activity(self, call_key, name, version, input_data, *args):
+        self.queued['schedule'].append({'call_key': call_key,
+                                        'input_data': input_data})
+
+
+class TestBatchProxy(unittest.TestCase):
+    def make_proxy(self, batch_size=3, retry=(0, ), **history):
+        from flowy.batch import BatchProxy
+        execution_history = SWFExecutionHistory(**history)
+        task_decision = RecordingTaskDecision()
+        proxy = BatchProxy(execution_history.task_history('task'),
+                           task_decision, retry, batch_size=batch_size)
+        return proxy, task_decision
+
+    def scheduled(self, task_decision):
+        from flowy.batch import loads_batch
+        return [(call_number, retry_number,
+                 [deserialize_input(i)[0] for i in loads_batch(input_data)])
+                for call_number, retry_number, _, input_data
+                in task_decision.scheduled]
+
+    def test_batches(self):
+        proxy, task_decision = self.make_proxy()
+        for i in range(7):
+            proxy(i)
+        self.assertEqual(len(task_decision.scheduled), 2)
+        proxy.flush()
+        self.assertEqual(self.scheduled(task_decision), [
+            (2, 0, [[0], [1], [2]]),
+            (5, 0, [[3], [4], [5]]),
+            (6, 0, [[6]]),
+        ])
+
+    def test_placeholder_ends_batching(self):
+        from flowy.result import placeholder
+        proxy, task_decision = self.make_proxy(results={'task-1-0': '[]'})
+        proxy(0), proxy(1)
+        proxy(2), proxy(placeholder()), proxy(3)
+        proxy.flush()
+        self.assertEqual(self.scheduled(task_decision), [(2, 0, [[2]])])
+
+    def test_results(self):
+        from flowy.result import error, TaskError
+        from flowy.serialization import dumps
+        batch_result = dumps([[True, dumps(2)], [False, 'boom'], None])
+        proxy, task_decision = self.make_proxy(
+            results={'task-2-0': batch_result}, running=['task-4-0'])
+        r0, r1 = proxy(1), proxy(2)
+        r2 = proxy(error('bad arg', 0))
+        r3, r4 = proxy(3), proxy(4)
+        self.assertEqual(r0, 2)
+        self.assertRaises(TaskError, lambda: r1.__wrapped__)
+        self.assertEqual(str(r1.__factory__.value), 'boom')
+        self.assertRaises(TaskError, lambda: r2.__wrapped__)
+        self.assertEqual(str(r2.__factory__.value), 'bad arg')
+        self.assertTrue(r3.__factory__.is_placeholder())
+        self.assertTrue(r4.__factory__.is_placeholder())
+        proxy.flush()
+        self.assertEqual(task_decision.scheduled, [])
+        self.assertEqual(task_decision.failed, None)
+
+    def test_batch_error(self):
+        from flowy.result import TaskError
+        proxy, task_decision = self.make_proxy(errors={'task-1-0': 'lost'})
+        rs = [proxy(1), proxy(2)]
+        for r in rs:
+            self.assertRaises(TaskError, lambda: r.__wrapped__)
+            self.assertEqual(str(r.__factory__.value), 'lost')
+
+    def test_batch_retry(self):
+        proxy, task_decision = self.make_proxy(retry=(0, 5),
+                                               timedout=['task-1-0'])
+        proxy(1), proxy(2)
+        self.assertEqual(self.scheduled(task_decision), [(1, 1, [[1], [2]])])
+        self.assertEqual(task_decision.scheduled[0][2], 5)
+
+    def test_batch_timeout(self):
+        from flowy.result import TaskTimedout
+        proxy, task_decision = self.make_proxy(timedout=['task-0-0'])
+        r = proxy(1)
+        self.assertRaises(TaskTimedout, lambda: r.__wrapped__)
+
+    def test_activity_batch(self):
+        from flowy.batch import dumps_batch
+        from flowy.serialization import loads
+
+        def f(x):
+            if x == 3:
+                raise ValueError('three')
+            return x * 2
+
+        wrapped = ActivityConfig().wrap(f)
+        input_data = dumps_batch(
+            [serialize_input(1), serialize_input(3), None])
+        self.assertEqual(loads(wrapped(input_data)),
+                         [[True, '2'], [False, 'three'], None])
+
+    def test_flushed_by_workflow(self):
+        from flowy import SWFWorkflowConfig, SWFWorkflowWorker
+        from flowy.batch import loads_batch
+        from workflows import Parallel
+        w = SWFWorkflowConfig()
+        w.conf_activity('task', version=1, batch_size=4)
+        worker = SWFWorkflowWorker()
+        worker.register(w, Parallel, version=1)
+        decision = BatchDummyDecision()
+        worker('Parallel', '1', serialize_input(6), decision,
+               SWFExecutionHistory())
+        self.assertEqual(decision.result, decision.queued)
+        self.assertEqual(
+            [(s['call_key'], len(loads_batch(s['input_data'])))
+             for s in decision.queued['schedule']],
+            [('task-3-0', 4), ('task-5-0', 2)])
+
+    def test_not_flushed_by_failing_workflow(self):
+        from flowy import SWFWorkflowConfig, SWFWorkflowWorker
+
+        class Failing(object):
+            def __init__(self, task):
+                self.task = task
+
+            def __call__(self):
+                self.task(1), self.task(2)
+                raise RuntimeError('err!')
+
+        w = SWFWorkflowConfig()
+        w.conf_activity('task', version=1, batch_size=4)
+        worker = SWFWorkflowWorker()
+        worker.register(w, Failing, version=1)
+        decision = BatchDummyDecision()
+        worker('Failing', '1', serialize_input(), decision,
+               SWFExecutionHistory())
+        self.assertEqual(decision.result, {'fail': 'err!'})
+        self.assertEqual(decision.queued['schedule'], [])
+
+    def test_max_size(self):
+        from flowy.batch import BatchProxy
+        task_decision = RecordingTaskDecision()
+        proxy = BatchProxy(SWFExecutionHistory().task_history('task'),
+                           task_decision, batch_size=10, max_size=100)
+        for x in ['a' * 20, 'b' * 20, 'c' * 20, 'd' * 200, 'e']:
+            proxy(x)
+        proxy.flush()
+        self.assertEqual(
+            [(n, [args[0][0] for args in batch])
+             for n, _, batch in self.scheduled(task_decision)],
+            [(1, ['a', 'b']), (2, ['c']), (3, ['d']), (4, ['e'])])
+        self.assertTrue(all(len(s[3]) <= 100
+                            for s in task_decision.scheduled[:2]))
+
+    def test_batch_result_size(self):
+        from flowy.batch import run_batch
+        results = run_batch(lambda x: x * 40, ['a', 'b', None, 'c'],
+                            max_size=160)
+        self.assertEqual(results[:3], [[True, 'a' * 40], [True, 'b' * 40],
+                                       None])
+        self.assertEqual(results[3][0], False)
+        self.assertIn('too large', results[3][1])
+        self.assertTrue(len(json.dumps(results)) <= 160)
+
+    def test_invalid_batch_size(self):
+        self.assertRaises(ValueError, lambda: self.make_proxy(batch_size=0))
+
+
+class FakeDecisionClient(object):
+    """Serve a number of single page decision tasks, one per execution."""
+
+    def __init__(self, tasks, delay=0):
+        self.tasks = tasks
+        self.delay = delay
+        self.polled = 0
+        self.responses = {}
+        self.max_in_hand = 0
+        self.lock = threading.Lock()
+
+    def poll_for_decision_task(self, domain, task_list, identity=None,
+                               next_page_token=None, reverse_order=False):
+        with self.lock:
+            if self.polled >= self.tasks:
+                time.sleep(0.01)
+                return {}
+            i = self.polled
+            self.polled += 1
+            in_hand = self.polled - len(self.responses)
+            self.max_in_hand = max(self.max_in_hand, in_hand)
+        events = make_events(0)
+        events[0]['workflowExecutionStartedEventAttributes'].update(
+            workflowType={'name': 'NoTask', 'version': '1'},
+            input=serialize_input(i))
+        return {
+            'taskToken': 'token-%s' % i,
+            'workflowExecution': {'workflowId': 'wid-%s' % i, 'runId': 'rid'},
+            'events': events,
+        }
+
+    def respond_decision_task_completed(self, task_token, decisions=None,
+                                        exec_context=None):
+        time.sleep(self.delay)
+        with self.lock:
+            self.responses[task_token] = decisions
+
+
+class SlowNoTask(object):
+    def __call__(self, n):
+        time.sleep(0.01)
+        return n
+
+
+class TestDecisionPool(unittest.TestCase):
+    def run_pool(self, tasks, workflow=None, **kwargs):
+        from flowy import SWFWorkflowConfig, SWFWorkflowWorker
+        from workflows import NoTask
+        client = FakeDecisionClient(tasks)
+
+        class StoppingWorker(SWFWorkflowWorker):
+            def break_loop(self):
+                return len(client.responses) >= tasks
+
+        worker = StoppingWorker()
+        worker.register(SWFWorkflowConfig(), workflow or NoTask, version=1,
+                        name='NoTask')
+        worker.run_forever('domain', 'tl', swf_client=client, setup_log=False,
+                           register_remote=False, **kwargs)
+        return client
+
+    def assert_finished(self, client, tasks):
+        self.assertEqual(len(client.responses), tasks)
+        for i in range(tasks):
+            decision, = client.responses['token-%s' % i]
+            attrs = decision['completeWorkflowExecutionDecisionAttributes']
+            self.assertEqual(deserialize_result(attrs['result']), i)
+
+    def test_single_threaded(self):
+        client = self.run_pool(5)
+        self.assert_finished(client, 5)
+
+    def test_threads(self):
+        client = self.run_pool(20, pollers=3, workers=4, history_cache_size=10)
+        self.assert_finished(client, 20)
+
+    def test_processes(self):
+        client = self.run_pool(10, pollers=2, workers=2, processes=True)
+        self.assert_finished(client, 10)
+
+    def test_backpressure(self):
+        client = self.run_pool(12, pollers=4, workers=2,
+                               workflow=SlowNoTask)
+        self.assert_finished(client, 12)
+        self.assertEqual(client.max_in_hand, 2)
+
+    def test_invalid_pool(self):
+        from flowy.swf.worker import DecisionPool
+        self.assertRaises(ValueError,
+                          lambda: DecisionPool(None, None, 'd', 'tl', workers=0))
+
+
+class FakeActivityClient(object):
+    """Serve a number of activity tasks and record their responses."""
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.polled = 0
+        self.responses = {}
+        self.max_in_hand = 0
+        self.lock = threading.Lock()
+
+    def poll_for_activity_task(self, domain, task_list, identity=None):
+        with self.lock:
+            if self.polled >= self.tasks:
+                time.sleep(0.01)
+                return {}
+            i = self.polled
+            self.polled += 1
+            in_hand = self.polled - len(self.responses)
+            self.max_in_hand = max(self.max_in_hand, in_hand)
+        return {
+            'taskToken': 'token-%s' % i,
+            'activityType': {'name': 'double', 'version': '1'},
+            'input': serialize_input(i),
+        }
+
+    def respond_activity_task_completed(self, task_token, result=None):
+        with self.lock:
+            self.responses[task_token] = deserialize_result(result)
+
+    def respond_activity_task_failed(self, task_token, reason=None,
+                                     details=None):
+        with self.lock:
+            self.responses[task_token] = str(reason)
+
+
+def double(heartbeat, n):
+    time.sleep(0.01)
+    if n == 3:
+        raise ValueError('three')
+    return n * 2
+
+
+class TestActivityPool(unittest.TestCase):
+    def run_pool(self, tasks, **kwargs):
+        from flowy import SWFActivityConfig, SWFActivityWorker
+        client = FakeActivityClient(tasks)
+
+        class StoppingWorker(SWFActivityWorker):
+            def break_loop(self):
+                return len(client.responses) >= tasks
+
+        worker = StoppingWorker()
+        worker.register(SWFActivityConfig(), double, version=1)
+        worker.run_forever('domain', 'tl', swf_client=client, setup_log=False,
+                           register_remote=False, **kwargs)
+        return client
+
+    def assert_finished(self, client, tasks):
+        self.assertEqual(len(client.responses), tasks)
+        for i in range(tasks):
+            expected = 'three' if i == 3 else i * 2
+            self.assertEqual(client.responses['token-%s' % i], expected)
+
+    def test_single_threaded(self):
+        client = self.run_pool(5)
+        self.assert_finished(client, 5)
+        self.assertEqual(client.max_in_hand, 1)
+
+    def test_threads(self):
+        client = self.run_pool(20, pollers=4, workers=3)
+        self.assert_finished(client, 20)
+        self.assertEqual(client.max_in_hand, 3)
+
+    def test_processes(self):
+        client = self.run_pool(8, pollers=2, workers=2, processes=True)
+        self.assert_finished(client, 8)
+
+    def test_deadline(self):
+        from flowy import SWFActivityConfig, SWFActivityWorker
+        client = FakeActivityClient(4)
+        deadlines = []
+
+        class RecordingWorker(SWFActivityWorker):
+            def __call__(self, name, version, input_data, decision):
+                deadlines.append(decision.deadline)
+                super(RecordingWorker, self).__call__(name, version,
+                                                      input_data, decision)
+
+            def break_loop(self):
+                return len(client.responses) >= 4
+
+        worker = RecordingWorker()
+        worker.register(SWFActivityConfig(default_start_to_close=60), double,
+                        version=1)
+        start = time.time()
+        worker.run_forever('domain', 'tl', swf_client=client, setup_log=False,
+                           register_remote=False, pollers=2, workers=2)
+        self.assertEqual(len(deadlines), 4)
+        for deadline in deadlines:
+            self.assertTrue(start + 60 <= deadline <= time.time() + 60)
+
+    def test_no_deadline(self):
+        from flowy import SWFActivityConfig, SWFActivityWorker
+        worker = SWFActivityWorker()
+        worker.register(SWFActivityConfig(), double, version=1)
+        worker.register(SWFActivityConfig(default_start_to_close=10), double,
+                        version=2)
+        self.assertIsNone(worker.task_deadline('double', 1))
+        self.assertEqual(worker.task_deadline('double', 2, 100), 110)
+        self.assertIsNone(worker.task_deadline('missing', 1))
+
+
+def client_error(code):
+    from botocore.exceptions import ClientError
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'Op')
+
+
+class FlakyLowLevelClient(object):
+    """Fail the first calls with the given error codes."""
+
+    def __init__(self, codes):
+        self.codes = list(codes)
+        self.calls = 0
+
+    def poll_for_activity_task(self, **kwargs):
+        self.calls += 1
+        if self.codes:
+            raise client_error(self.codes.pop(0))
+        return {'taskToken': 'token'}
+
+    def respond_activity_task_completed(self, **kwargs):
+        self.calls += 1
+        if self.codes:
+            raise client_error(self.codes.pop(0))
+        return {}
+
+
+class TestThrottle(unittest.TestCase):
+    def make_client(self, codes, **kwargs):
+        from flowy.swf.client import SWFClient, Throttle
+        kwargs.setdefault('backoff_base', 0.001)
+        throttle = Throttle(**kwargs)
+        low_level = FlakyLowLevelClient(codes)
+        return SWFClient(client=low_level, throttle=throttle), low_level
+
+    def test_token_bucket(self):
+        from flowy.swf.client import TokenBucket
+        bucket = TokenBucket(100, 5)
+        start = time.time()
+        waited = [bucket.acquire() for _ in range(15)]
+        self.assertEqual(waited[:5], [0] * 5)
+        self.assertTrue(all(waited[5:]))
+        self.assertGreaterEqual(time.time() - start, 0.09)
+
+    def test_token_bucket_threads(self):
+        from flowy.swf.client import TokenBucket
+        bucket = TokenBucket(200, 1)
+        start = time.time()
+        threads = [threading.Thread(target=bucket.acquire) for _ in range(21)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertGreaterEqual(time.time() - start, 0.095)
+
+    def test_invalid_bucket(self):
+        from flowy.swf.client import TokenBucket
+        self.assertRaises(ValueError, TokenBucket, 0)
+        self.assertRaises(ValueError, TokenBucket, 10, 0.5)
+
+    def test_retry_throttling(self):
+        client, low_level = self.make_client(
+            ['ThrottlingException', 'ServiceUnavailable'])
+        r = client.poll_for_activity_task('domain', 'tl')
+        self.assertEqual(r, {'taskToken': 'token'})
+        self.assertEqual(low_level.calls, 3)
+        stats = client.throttle.stats()
+        self.assertEqual(stats['poll.calls'], 3)
+        self.assertEqual(stats['poll.retries'], 2)
+        self.assertNotIn('poll.gave_up', stats)
+
+    def test_give_up(self):
+        from botocore.exceptions import ClientError
+        client, low_level = self.make_client(['ThrottlingException'] * 5,
+                                             max_retries=2)
+        self.assertRaises(ClientError, client.poll_for_activity_task,
+                          'domain', 'tl')
+        self.assertEqual(low_level.calls, 3)
+        self.assertEqual(client.throttle.stats()['poll.gave_up'], 1)
+
+    def test_no_retry(self):
+        from botocore.exceptions import ClientError
+        client, low_level = self.make_client(['UnknownResourceFault'])
+        self.assertRaises(ClientError, client.poll_for_activity_task,
+                          'domain', 'tl')
+        self.assertEqual(low_level.calls, 1)
+        self.assertNotIn('poll.retries', client.throttle.stats())
+
+    def test_rate_limited(self):
+        client, low_level = self.make_client([], rates={'poll': (100, 1)})
+        for _ in range(3):
+            client.poll_for_activity_task('domain', 'tl')
+        self.assertEqual(client.throttle.stats()['poll.throttled'], 2)
+
+    def test_unlimited(self):
+        client, low_level = self.make_client([], rates={'poll': None})
+        for _ in range(3):
+            client.poll_for_activity_task('domain', 'tl')
+        self.assertNotIn('poll.throttled', client.throttle.stats())
+
+    def test_backoff_delay(self):
+        from flowy.swf.client import backoff_delay
+        for attempt in range(10):
+            d = backoff_delay(attempt, 0.1, 1.0)
+            self.assertTrue(0 <= d <= min(1.0, 0.1 * 2 ** attempt))
+
+    def test_poll_loop_backoff(self):
+        import flowy.swf.worker as w
+        from flowy.swf.client import SWFClient, Throttle
+        low_level = FlakyLowLevelClient(['AccessDenied'] * 3)
+        client = SWFClient(client=low_level, throttle=Throttle())
+        backoff, w.POLL_ERROR_BACKOFF = w.POLL_ERROR_BACKOFF, (0.02, 0.02)
+        try:
+            r = w.poll_activity(client, 'domain', 'tl')
+        finally:
+            w.POLL_ERROR_BACKOFF = backoff
+        self.assertEqual(r, {'taskToken': 'token'})
+        self.assertEqual(low_level.calls, 4)
+
+
+class FlakyResponder(object):
+    """Fail the first responses with the given errors."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = []
+
+    def respond_activity_task_completed(self, token, result=None):
+        self.calls.append((token, result))
+        if self.errors:
+            raise self.errors.pop(0)
+
+    def respond_decision_task_completed(self, token, decisions=None):
+        self.calls.append((token, decisions))
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+class TestRespondRetries(unittest.TestCase):
+    def setUp(self):
+        import flowy.swf.decision as d
+        self.backoff = d.RESPOND_BACKOFF
+        d.RESPOND_BACKOFF = (0.001, 0.001)
+
+    def tearDown(self):
+        import flowy.swf.decision as d
+        d.RESPOND_BACKOFF = self.backoff
+
+    def test_retry_transient(self):
+        from botocore.exceptions import EndpointConnectionError
+        from flowy.swf.decision import SWFActivityDecision
+        client = FlakyResponder([
+            client_error('ThrottlingException'),
+            EndpointConnectionError(endpoint_url='https://swf'),
+        ])
+        decision = SWFActivityDecision(client, 'token')
+        self.assertTrue(decision.finish('result'))
+        self.assertEqual(client.calls, [('token', 'result')] * 3)
+
+    def test_no_retry(self):
+        from flowy.swf.decision import SWFActivityDecision
+        client = FlakyResponder([client_error('UnknownResourceFault')])
+        decision = SWFActivityDecision(client, 'token')
+        self.assertFalse(decision.finish('result'))
+        self.assertEqual(len(client.calls), 1)
+
+    def test_bounded(self):
+        from flowy.swf.decision import RESPOND_RETRIES, SWFActivityDecision
+        client = FlakyResponder([client_error('ServiceUnavailable')] * 100)
+        decision = SWFActivityDecision(client, 'token')
+        self.assertFalse(decision.finish('result'))
+        self.assertEqual(len(client.calls), RESPOND_RETRIES)
+
+    def test_deadline(self):
+        from flowy.swf.decision import SWFActivityDecision
+        client = FlakyResponder([client_error('ServiceUnavailable')] * 100)
+        decision = SWFActivityDecision(client, 'token',
+                                       deadline=time.time() - 1)
+        self.assertFalse(decision.finish('result'))
+        self.assertEqual(len(client.calls), 1)
+
+    def test_decision_flush(self):
+        from flowy.swf.decision import SWFWorkflowDecision
+        client = FlakyResponder([client_error('ThrottlingException')])
+        decision = SWFWorkflowDecision(client, 'token', 'name', 1, 'tl', 10,
+                                       100, None, 'TERMINATE',
+                                       deadline=time.time() + 10)
+        decision.finish('result')
+        self.assertEqual(len(client.calls), 2)
+
+    def make_client(self, codes):
+        from flowy.swf.client import SWFClient, Throttle
+        low_level = FlakyLowLevelClient(codes)
+        client = SWFClient(client=low_level,
+                           throttle=Throttle(backoff_base=0.001))
+        return client, low_level
+
+    def test_swf_client_bounded(self):
+        from flowy.swf.decision import RESPOND_RETRIES, SWFActivityDecision
+        client, low_level = self.make_client(['ServiceUnavailable'] * 100)
+        decision = SWFActivityDecision(client, 'token')
+        self.assertFalse(decision.finish('result'))
+        self.assertEqual(low_level.calls, RESPOND_RETRIES)
+        stats = client.throttle.stats()
+        self.assertEqual(stats['respond.calls'], RESPOND_RETRIES)
+        self.assertNotIn('respond.retries', stats)
+
+    def test_swf_client_deadline(self):
+        from flowy.swf.decision import SWFActivityDecision
+        client, low_level = self.make_client(['ServiceUnavailable'] * 100)
+        decision = SWFActivityDecision(client, 'token',
+                                       deadline=time.time() - 1)
+        self.assertFalse(decision.finish('result'))
+        self.assertEqual(low_level.calls, 1)
+
+    def test_swf_client_retry(self):
+        from flowy.swf.decision import SWFActivityDecision
+        client, low_level = self.make_client(['ThrottlingException'] * 2)
+        decision = SWFActivityDecision(client, 'token',
+                                       deadline=time.time() + 10)
+        self.assertTrue(decision.finish('result'))
+        self.assertEqual(low_level.calls, 3)
+
+    def test_task_deadline(self):
+        from flowy.swf.decision import task_deadline
+        self.assertEqual(task_deadline('10', 100), 110)
+        self.assertIsNone(task_deadline('NONE', 100))
+        self.assertIsNone(task_deadline(None, 100))
+
+
+class TestSharedClient(unittest.TestCase):
+    kwargs = {'region_name': 'us-east-1', 'aws_access_key_id': 'x',
+              'aws_secret_access_key': 'x'}
+
+    def test_cached(self):
+        from flowy.swf.client import get_swf_client
+        c1 = get_swf_client(max_pool_connections=7, **self.kwargs)
+        c2 = get_swf_client(max_pool_connections=7, **self.kwargs)
+        self.assertIs(c1, c2)
+        config = c1.client.meta.config
+        self.assertEqual(config.max_pool_connections, 7)
+        self.assertEqual(config.read_timeout, 70)
+
+    def test_per_settings(self):
+        from flowy.swf.client import get_swf_client
+        c1 = get_swf_client(max_pool_connections=8, **self.kwargs)
+        c2 = get_swf_client(max_pool_connections=9, **self.kwargs)
+        self.assertIsNot(c1, c2)
+        self.assertEqual(c2.client.meta.config.max_pool_connections, 9)
+
+    def test_threads(self):
+        from flowy.swf.client import get_swf_client
+        clients = []
+
+        def get():
+            clients.append(get_swf_client(max_pool_connections=11,
+                                          **self.kwargs))
+
+        threads = [threading.Thread(target=get) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(clients), 8)
+        self.assertEqual(len(set(map(id, clients))), 1)
+
+    def test_pool_size(self):
+        from flowy.swf.worker import _pool_size
+        self.assertIsNone(_pool_size(None, None, False))
+        self.assertEqual(_pool_size(2, 8, False), 10)
+        self.assertEqual(_pool_size(2, 8, True), 3)
+
+
+class FakeStartClient(object):
+    """Start workflows, failing the ones with a 'bad' wid."""
+
+    def __init__(self):
+        self.started = {}
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def start_workflow_execution(self, domain, wid, name, version, input=None,
+                                 **kwargs):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.01)
+        with self.lock:
+            self.running -= 1
+            if str(wid).startswith('bad'):
+                raise client_error('WorkflowExecutionAlreadyStartedFault')
+            self.started[wid] = deserialize_input(input)
+        return {'runId': 'run-%s' % wid}
+
+
+class TestBatchStarter(unittest.TestCase):
+    def test_start(self):
+        from flowy import SWFWorkflowBatchStarter
+        client = FakeStartClient()
+        start = SWFWorkflowBatchStarter('domain', 'name', 1, swf_client=client,
+                                        concurrency=4)
+        items = [('w%s' % i, [i], {'x': i}) for i in range(30)]
+        items.append(('bad1', [], {}))
+        results = dict((wid, (run_id, error))
+                       for wid, run_id, error in start(items))
+        self.assertEqual(len(results), 31)
+        for i in range(30):
+            self.assertEqual(results['w%s' % i], ('run-w%s' % i, None))
+            self.assertEqual(client.started['w%s' % i], ([i], {'x': i}))
+        self.assertIsNone(results['bad1'][0])
+        self.assertIn('WorkflowExecutionAlreadyStartedFault',
+                      str(results['bad1'][1]))
+        self.assertEqual(client.max_running, 4)
+
+    def test_lazy(self):
+        from flowy import SWFWorkflowBatchStarter
+        client = FakeStartClient()
+        start = SWFWorkflowBatchStarter('domain', 'name', 1, swf_client=client,
+                                        concurrency=2)
+        consumed = []
+
+        def items():
+            for i in range(100):
+                consumed.append(i)
+                yield 'w%s' % i, [], {}
+
+        results = start(items())
+        next(results)
+        self.assertLess(len(consumed), 10)
+        results.close()
+
+    def test_generated_wid(self):
+        from flowy import SWFWorkflowBatchStarter
+        client = FakeStartClient()
+        start = SWFWorkflowBatchStarter('domain', 'name', 1, swf_client=client)
+        [(wid, run_id, error)] = list(start([(None, [], {})]))
+        self.assertIsNotNone(wid)
+        self.assertEqual(run_id, 'run-%s' % wid)
+
+    def test_invalid(self):
+        from flowy import SWFWorkflowBatchStarter
+        self.assertRaises(ValueError, SWFWorkflowBatchStarter, 'd', 'n', 1,
+                          concurrency=0)
+        self.assertRaises(TypeError, SWFWorkflowBatchStarter, 'd', 'n', 1,
+                          wid='w')
+
+    def test_read_batch(self):
+        from flowy.swf.starter import read_batch
+        lines = ['{"wid": "w1", "args": [1, 2], "kwargs": {"a": 1}}\n',
+                 '\n',
+                 '["w2", [3]]\n',
+                 '{"args": [4]}\n']
+        self.assertEqual(list(read_batch(lines)), [
+            ('w1', [1, 2], {'a': 1}),
+            ('w2', [3], {}),
+            (None, [4], {}),
+        ])
+        self.assertRaises(ValueError, list, read_batch(['{"args": 1}']))
+        self.assertRaises(ValueError, list, read_batch(['not json']))
+
+    def test_cli(self):
+        import io
+        import sys
+        from flowy import SWFWorkflowBatchStarter
+        from flowy.__main__ import start_batch
+        client = FakeStartClient()
+        start = SWFWorkflowBatchStarter('domain', 'name', 1, swf_client=client)
+        batch = io.StringIO(u'["w1", [1]]\n["bad", [2]]\n')
+        out = []
+
+        class Output(object):
+            write = out.append
+
+            def flush(self):
+                pass
+
+        stdout, sys.stdout = sys.stdout, Output()
+        try:
+            failed = start_batch(start, batch)
+        finally:
+            sys.stdout = stdout
+        lines = dict((l['wid'], l) for l in map(json.loads, out))
+        self.assertEqual(failed, 1)
+        self.assertEqual(lines['w1'], {'wid': 'w1', 'run_id': 'run-w1'})
+        self.assertIn('error', lines['bad'])
+
+
+class FakeRegistrationClient(object):
+    """All the types are registered already, with the default config."""
+
+    def __init__(self):
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def call(self, method, name):
+        with self.lock:
+            self.calls.append((method, name))
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.01)
+        with self.lock:
+            self.running -= 1
+
+    def register_activity_type(self, domain, name, version, **kwargs):
+        self.call('register', name)
+        raise client_error('TypeAlreadyExistsFault')
+
+    def describe_activity_type(self, domain, name, version):
+        self.call('describe', name)
+        if name.startswith('bad'):
+            return {'configuration': {'defaultTaskList': {'name': 'other'}}}
+        return {'configuration': {}}
+
+
+def noop(heartbeat):
+    pass
+
+
+class TestRemoteRegistration(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'cache', 'registrations.json')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir)
+
+    def make_worker(self, names, cache=None, config=None, **kwargs):
+        from flowy import SWFActivityConfig, SWFActivityWorker
+        worker = SWFActivityWorker(registration_cache=cache, **kwargs)
+        for name in names:
+            worker.register(config or SWFActivityConfig(), noop, version=1,
+                            name=name)
+        return worker
+
+    def test_concurrent(self):
+        client = FakeRegistrationClient()
+        names = ['a%s' % i for i in range(20)]
+        self.make_worker(names, register_concurrency=4).register_remote(
+            client, 'domain')
+        self.assertEqual(len(client.calls), 40)
+        self.assertEqual(client.max_running, 4)
+
+    def test_first_error(self):
+        from flowy.swf.config import SWFRegistrationError
+        from flowy.swf.worker import RegistrationCache
+        client = FakeRegistrationClient()
+        cache = RegistrationCache(self.path)
+        worker = self.make_worker(['a', 'bad1', 'b', 'bad2'], cache)
+        with self.assertRaises(SWFRegistrationError) as r:
+            worker.register_remote(client, 'domain')
+        self.assertIn("'bad1'", str(r.exception))
+        # All were tried, the good ones are cached
+        self.assertEqual(len(client.calls), 8)
+        client.calls = []
+        self.assertRaises(SWFRegistrationError, worker.register_remote,
+                          client, 'domain')
+        self.assertEqual(sorted(set(n for _, n in client.calls)),
+                         ['bad1', 'bad2'])
+
+    def test_cache(self):
+        from flowy.swf.worker import RegistrationCache
+        client = FakeRegistrationClient()
+        names = ['a', 'b']
+        self.make_worker(names, RegistrationCache(self.path)).register_remote(
+            client, 'domain')
+        self.assertEqual(len(client.calls), 4)
+        # A restarted worker skips them
+        client.calls = []
+        self.make_worker(names, RegistrationCache(self.path)).register_remote(
+            client, 'domain')
+        self.assertEqual(client.calls, [])
+        # But not in other domains
+        self.make_worker(names, RegistrationCache(self.path)).register_remote(
+            client, 'other')
+        self.assertEqual(len(client.calls), 4)
+
+    def test_cache_config_changed(self):
+        from flowy import SWFActivityConfig
+        from flowy.swf.worker import RegistrationCache
+        client = FakeRegistrationClient()
+        self.make_worker(['a'], RegistrationCache(self.path)).register_remote(
+            client, 'domain')
+        client.calls = []
+        config = SWFActivityConfig(default_task_list='tl')
+        worker = self.make_worker(['a'], RegistrationCache(self.path), config)
+        self.assertRaises(Exception, worker.register_remote, client, 'domain')
+        self.assertEqual(len(client.calls), 2)
+
+    def test_cache_ttl(self):
+        from flowy.swf.worker import RegistrationCache
+        client = FakeRegistrationClient()
+        self.make_worker(['a'], RegistrationCache(self.path, ttl=-1)
+                         ).register_remote(client, 'domain')
+        client.calls = []
+        self.make_worker(['a'], RegistrationCache(self.path)).register_remote(
+            client, 'domain')
+        self.assertEqual(len(client.calls), 2)
+
+    def test_cache_unreadable(self):
+        from flowy.swf.worker import RegistrationCache
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as f:
+            f.write('not json')
+        cache = RegistrationCache(self.path)
+        self.assertFalse(cache.verified('key'))
+        cache.add('key')
+        cache.save()
+        self.assertTrue(RegistrationCache(self.path).verified('key'))
@@ -0,0 +1,150 @@
+import asyncio
+import gc
+import threading
+import time
+import unittest
+import warnings
+
+from flowy import SWFActivityConfig
+from flowy import SWFActivityWorker
+from flowy.proxy import Proxy
+from flowy.swf.aio import AsyncActivityPool
+from flowy.swf.aio import AsyncSWFActivityWorker
+
+
+serialize_input = Proxy.serialize_input
+deserialize_result = Proxy.deserialize_result
+
+
+class FakeAsyncActivityClient(object):
+    """Serve activity tasks and record their responses and heartbeats."""
+
+    def __init__(self, tasks, name):
+        self.tasks = tasks
+        self.name = name
+        self.polled = 0
+        self.responses = {}
+        self.heartbeats = []
+        self.max_in_hand = 0
+        self.lock = threading.Lock()
+
+    def poll_for_activity_task(self, domain, task_list, identity=None):
+        with self.lock:
+            if self.polled >= self.tasks:
+                time.sleep(0.01)
+                return {}
+            i = self.polled
+            self.polled += 1
+            in_hand = self.polled - len(self.responses)
+            self.max_in_hand = max(self.max_in_hand, in_hand)
+        return {
+            'taskToken': 'token-%s' % i,
+            'activityType': {'name': self.name, 'version': '1'},
+            'input': serialize_input(i),
+        }
+
+    def record_activity_task_heartbeat(self, task_token, details=None):
+        with self.lock:
+            self.heartbeats.append((task_token, details))
+
+    def respond_activity_task_completed(self, task_token, result=None):
+        with self.lock:
+            self.responses[task_token] = deserialize_result(result)
+
+    def respond_activity_task_failed(self, task_token, reason=None,
+                                     details=None):
+        with self.lock:
+            self.responses[task_token] = str(reason)
+
+
+async def async_double(heartbeat, n):
+    await heartbeat(str(n))
+    await asyncio.sleep(0.2)
+    if n == 3:
+        raise ValueError('three')
+    return n * 2
+
+
+def sync_double(heartbeat, n):
+    heartbeat(str(n))
+    if n == 3:
+        raise ValueError('three')
+    return n * 2
+
+
+class TestAsyncActivityWorker(unittest.TestCase):
+    def run_worker(self, func, tasks, **kwargs):
+        client = FakeAsyncActivityClient(tasks, func.__name__)
+
+        class StoppingWorker(AsyncSWFActivityWorker):
+            def break_loop(self):
+                return len(client.responses) >= tasks
+
+        worker = StoppingWorker()
+        worker.register(SWFActivityConfig(), func, version=1)
+        worker.run_forever('domain', 'tl', swf_client=client, setup_log=False,
+                           register_remote=False, **kwargs)
+        return client
+
+    def assert_finished(self, client, tasks):
+        self.assertEqual(len(client.responses), tasks)
+        for i in range(tasks):
+            expected = 'three' if i == 3 else i * 2
+            self.assertEqual(client.responses['token-%s' % i], expected)
+        self.assertEqual(sorted(client.heartbeats),
+                         sorted(('token-%s' % i, str(i))
+                                for i in range(tasks)))
+
+    def test_coroutines(self):
+        start = time.time()
+        client = self.run_worker(async_double, 50, pollers=2)
+        # Run concurrently, not one after another
+        self.assertLess(time.time() - start, 50 * 0.2 / 2)
+        self.assert_finished(client, 50)
+        self.assertGreater(client.max_in_hand, 10)
+
+    def test_concurrency(self):
+        client = self.run_worker(async_double, 12, pollers=2, concurrency=4)
+        self.assert_finished(client, 12)
+        self.assertEqual(client.max_in_hand, 4)
+
+    def test_plain_functions(self):
+        client = self.run_worker(sync_double, 10)
+        self.assert_finished(client, 10)
+
+    def test_unknown_activity(self):
+        client = FakeAsyncActivityClient(1, 'unknown')
+        worker = AsyncSWFActivityWorker()
+        worker.break_loop = lambda: client.polled >= 1
+        worker.run_forever('domain', 'tl', swf_client=client, setup_log=False,
+                           register_remote=False)
+        self.assertEqual(client.responses, {})
+
+    def test_invalid_pool(self):
+        worker = AsyncSWFActivityWorker()
+        self.assertRaises(ValueError, AsyncActivityPool, worker, None, 'd',
+                          'tl', concurrency=0)
+
+
+class TestSyncWorker(unittest.TestCase):
+    def test_coroutine_activity_fails(self):
+        client = FakeAsyncActivityClient(2, 'async_double')
+
+        class StoppingWorker(SWFActivityWorker):
+            def break_loop(self):
+                return len(client.responses) >= 2
+
+        worker = StoppingWorker()
+        worker.register(SWFActivityConfig(), async_double, version=1)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            worker.run_forever('domain', 'tl', swf_client=client,
+                               setup_log=False, register_remote=False)
+            gc.collect()
+        self.assertEqual(client.responses, {
+            'token-0': 'Coroutine activities need an asyncio worker.',
+            'token-1': 'Coroutine activities need an asyncio worker.',
+        })
+        self.assertEqual(client.heartbeats, [])
+        self.assertEqual([w for w in caught
+                          if issubclass(w.category, RuntimeWarning)], [])